@@ -0,0 +1,399 @@
+import argparse
+import os
+import sys
+import time
+from collections import Counter, OrderedDict
+from math import sqrt
+
+import numpy as np
+import pandas as pd
+
+from attack_labels import join_attack_log, load_attack_log
+from pcap_reader import CaptureReader, IPPROTO_TCP, IPPROTO_UDP, capture_base_name, format_address, ip_layer, \
+    is_capture
+from table_io import FORMATS, TableWriter, output_path
+
+TCP_FIN, TCP_SYN, TCP_RST, TCP_PSH, TCP_ACK, TCP_URG, TCP_ECE, TCP_CWR = (1 << i for i in range(8))
+
+# Flow identifiers followed by the feature columns of newdataset.csv used by models/tcp_udp_model.ipynb.
+# Durations and inter-arrival times are in microseconds like in that dataset; the bulk transfer
+# averages are not computed.
+ID_COLUMNS = ['src_ip', 'src_port', 'dst_ip', 'dst_port', 'protocol', 'start_time']
+FEATURE_COLUMNS = [
+    'flow_duration', 'flow_bytes_s', 'flow_packets_s', 'fwd_packets_s', 'bwd_packets_s',
+    'packet_length_min', 'packet_length_max', 'packet_length_mean', 'average_packet_size',
+    'packet_length_std', 'packet_length_variance',
+    'flow_iat_mean', 'flow_iat_std', 'flow_iat_max', 'flow_iat_min',
+    'fin_flag_count', 'syn_flag_count', 'rst_flag_count', 'psh_flag_count', 'ack_flag_count',
+    'cwr_flag_count', 'ece_flag_count', 'down_up_ratio',
+    'active_mean', 'active_std', 'active_max', 'active_min', 'idle_mean', 'idle_std', 'idle_max', 'idle_min',
+    'fwd_iat_total', 'total_fwd_packet', 'total_length_of_fwd_packet',
+    'fwd_packet_length_min', 'fwd_packet_length_max', 'fwd_packet_length_mean', 'fwd_packet_length_std',
+    'fwd_iat_mean', 'fwd_iat_std', 'fwd_iat_max', 'fwd_iat_min', 'fwd_segment_size_avg',
+    'fwd_psh_flags', 'fwd_rst_flags', 'fwd_header_length', 'fwd_init_win_bytes', 'fwd_act_data_pkts',
+    'fwd_seg_size_min', 'subflow_fwd_packets', 'subflow_fwd_bytes',
+    'bwd_iat_total', 'total_bwd_packets', 'total_length_of_bwd_packet',
+    'bwd_packet_length_min', 'bwd_packet_length_max', 'bwd_packet_length_mean', 'bwd_packet_length_std',
+    'bwd_iat_mean', 'bwd_iat_std', 'bwd_iat_max', 'bwd_iat_min', 'bwd_segment_size_avg',
+    'bwd_psh_flags', 'bwd_rst_flags', 'bwd_header_length', 'bwd_init_win_bytes',
+    'subflow_bwd_packets', 'subflow_bwd_bytes',
+]
+FLOW_COLUMNS = ID_COLUMNS + FEATURE_COLUMNS
+# Fixed dtypes, so every exported batch has the same schema whatever values it happens to hold
+INTEGER_COLUMNS = [
+    'src_port', 'dst_port', 'protocol',
+    'fin_flag_count', 'syn_flag_count', 'rst_flag_count', 'psh_flag_count', 'ack_flag_count',
+    'cwr_flag_count', 'ece_flag_count', 'total_fwd_packet', 'total_length_of_fwd_packet',
+    'fwd_psh_flags', 'fwd_rst_flags', 'fwd_header_length', 'fwd_init_win_bytes', 'fwd_act_data_pkts',
+    'fwd_seg_size_min', 'total_bwd_packets', 'total_length_of_bwd_packet', 'bwd_psh_flags', 'bwd_rst_flags',
+    'bwd_header_length', 'bwd_init_win_bytes',
+]
+FLOW_DTYPES = {column: np.float64 for column in FLOW_COLUMNS}
+FLOW_DTYPES.update({column: np.int64 for column in INTEGER_COLUMNS})
+FLOW_DTYPES.update({'src_ip': object, 'dst_ip': object})
+US = 1e6
+
+
+class RunningStats:
+    # Welford's online mean and variance, plus min and max, in constant memory
+    __slots__ = ('n', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = 0.0
+        self.max = 0.0
+
+    def add(self, x):
+        self.n += 1
+        if self.n == 1:
+            self.min = self.max = x
+        elif x < self.min:
+            self.min = x
+        elif x > self.max:
+            self.max = x
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def copy(self):
+        other = RunningStats()
+        other.n, other.mean, other.m2, other.min, other.max = self.n, self.mean, self.m2, self.min, self.max
+        return other
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self):
+        return sqrt(self.variance)
+
+
+class Direction:
+    # Per-direction counters of a flow
+    __slots__ = ('packets', 'bytes', 'lengths', 'iat', 'last', 'header_bytes', 'psh', 'rst', 'init_win',
+                 'data_packets', 'min_header')
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+        self.lengths = RunningStats()
+        self.iat = RunningStats()
+        self.last = None
+        self.header_bytes = 0
+        self.psh = 0
+        self.rst = 0
+        self.init_win = -1
+        self.data_packets = 0
+        self.min_header = 0
+
+    def add(self, timestamp, length, header, flags, window):
+        if self.last is not None:
+            self.iat.add((timestamp - self.last) * US)
+        else:
+            self.init_win = window
+            self.min_header = header
+        self.last = timestamp
+        self.packets += 1
+        self.bytes += length
+        self.lengths.add(length)
+        self.header_bytes += header
+        self.min_header = min(self.min_header, header)
+        if length:
+            self.data_packets += 1
+        if flags & TCP_PSH:
+            self.psh += 1
+        if flags & TCP_RST:
+            self.rst += 1
+
+
+class Flow:
+    __slots__ = ('src', 'sport', 'dst', 'dport', 'proto', 'start', 'last', 'fwd', 'bwd', 'lengths', 'iat',
+                 'flags', 'active', 'idle', 'active_start', 'subflows', 'fin_fwd', 'fin_bwd')
+
+    def __init__(self, src, sport, dst, dport, proto, timestamp):
+        # The first packet seen defines the forward direction
+        self.src, self.sport, self.dst, self.dport, self.proto = src, sport, dst, dport, proto
+        self.start = self.last = self.active_start = timestamp
+        self.fwd = Direction()
+        self.bwd = Direction()
+        self.lengths = RunningStats()
+        self.iat = RunningStats()
+        self.flags = Counter()
+        self.active = RunningStats()
+        self.idle = RunningStats()
+        self.subflows = 1
+        self.fin_fwd = self.fin_bwd = False
+
+    def add(self, timestamp, forward, length, header, flags, window, activity_timeout):
+        if self.lengths.n:
+            gap = timestamp - self.last
+            self.iat.add(gap * US)
+            if gap > activity_timeout:
+                # A long silence ends an active period and starts a new subflow
+                self.active.add((self.last - self.active_start) * US)
+                self.idle.add(gap * US)
+                self.active_start = timestamp
+                self.subflows += 1
+        self.last = timestamp
+        self.lengths.add(length)
+        (self.fwd if forward else self.bwd).add(timestamp, length, header, flags, window)
+        if flags:
+            self.flags[flags] += 1
+            if flags & TCP_FIN:
+                if forward:
+                    self.fin_fwd = True
+                else:
+                    self.fin_bwd = True
+
+    def flag_count(self, flag):
+        return sum(n for flags, n in self.flags.items() if flags & flag)
+
+    def row(self):
+        fwd, bwd = self.fwd, self.bwd
+        duration = (self.last - self.start) * US
+        seconds = duration / US
+        packets = fwd.packets + bwd.packets
+        total_bytes = fwd.bytes + bwd.bytes
+        # The last active period ends with the flow
+        active = self.active.copy()
+        active.add((self.last - self.active_start) * US)
+        return (
+            format_address(self.src), self.sport, format_address(self.dst), self.dport, self.proto, self.start,
+            duration,
+            total_bytes / seconds if seconds else 0.0,
+            packets / seconds if seconds else 0.0,
+            fwd.packets / seconds if seconds else 0.0,
+            bwd.packets / seconds if seconds else 0.0,
+            self.lengths.min, self.lengths.max, self.lengths.mean, total_bytes / packets,
+            self.lengths.std, self.lengths.variance,
+            self.iat.mean, self.iat.std, self.iat.max, self.iat.min,
+            self.flag_count(TCP_FIN), self.flag_count(TCP_SYN), self.flag_count(TCP_RST),
+            self.flag_count(TCP_PSH), self.flag_count(TCP_ACK), self.flag_count(TCP_CWR),
+            self.flag_count(TCP_ECE),
+            bwd.packets / fwd.packets if fwd.packets else 0.0,
+            active.mean, active.std, active.max, active.min,
+            self.idle.mean, self.idle.std, self.idle.max, self.idle.min,
+            fwd.iat.mean * fwd.iat.n, fwd.packets, fwd.bytes,
+            fwd.lengths.min, fwd.lengths.max, fwd.lengths.mean, fwd.lengths.std,
+            fwd.iat.mean, fwd.iat.std, fwd.iat.max, fwd.iat.min, fwd.lengths.mean,
+            fwd.psh, fwd.rst, fwd.header_bytes, max(fwd.init_win, 0), fwd.data_packets,
+            fwd.min_header, fwd.packets / self.subflows, fwd.bytes / self.subflows,
+            bwd.iat.mean * bwd.iat.n, bwd.packets, bwd.bytes,
+            bwd.lengths.min, bwd.lengths.max, bwd.lengths.mean, bwd.lengths.std,
+            bwd.iat.mean, bwd.iat.std, bwd.iat.max, bwd.iat.min, bwd.lengths.mean,
+            bwd.psh, bwd.rst, bwd.header_bytes, max(bwd.init_win, 0), bwd.packets / self.subflows,
+            bwd.bytes / self.subflows,
+        )
+
+
+class FlowMeter:
+    # 5-tuple flow table. Flows are kept in least-recently-seen order, so idle flows are expired from
+    # the front in O(1) per packet, and the table never holds more than max_flows: under port scans
+    # or floods of one-packet flows the least recently seen flow is exported early instead.
+    def __init__(self, active_timeout=120.0, idle_timeout=30.0, activity_timeout=5.0, max_flows=500_000,
+                 batch_size=100_000, export=None):
+        self.active_timeout = active_timeout
+        self.idle_timeout = idle_timeout
+        self.activity_timeout = activity_timeout
+        self.max_flows = max_flows
+        self.batch_size = batch_size
+        self.export = export
+        self.flows = OrderedDict()
+        self.finished = []
+        self.stats = Counter()
+
+    def __len__(self):
+        return len(self.flows)
+
+    def process(self, timestamp, linktype, data, orig_len=None):
+        stats = self.stats
+        stats['packets'] += 1
+        ip = ip_layer(data, linktype)
+        if ip is None:
+            stats['not_ip'] += 1
+            return
+        _, src, dst, proto, off, end, first_fragment = ip
+        if proto == IPPROTO_TCP:
+            if not first_fragment or off + 20 > end:
+                stats['fragmented'] += 1
+                return
+            sport = (data[off] << 8) | data[off + 1]
+            dport = (data[off + 2] << 8) | data[off + 3]
+            header = (data[off + 12] >> 4) * 4
+            flags = data[off + 13]
+            window = (data[off + 14] << 8) | data[off + 15]
+        elif proto == IPPROTO_UDP:
+            if not first_fragment or off + 8 > end:
+                stats['fragmented'] += 1
+                return
+            sport = (data[off] << 8) | data[off + 1]
+            dport = (data[off + 2] << 8) | data[off + 3]
+            header = 8
+            flags = 0
+            window = 0
+        else:
+            stats['not_tcp_udp'] += 1
+            return
+        length = max(end - off - header, 0)
+
+        flows = self.flows
+        # Both directions share one table entry
+        key = (proto, src, sport, dst, dport) if (src, sport) <= (dst, dport) else (proto, dst, dport, src, sport)
+        flow = flows.get(key)
+        if flow is not None:
+            if timestamp - flow.start > self.active_timeout:
+                stats['active_timeouts'] += 1
+                self._finish(key)
+                flow = None
+            elif (flow.fin_fwd and flow.fin_bwd) and (flags & (TCP_SYN | TCP_RST) or length):
+                # A closed connection is only kept around for its last ACK
+                self._finish(key)
+                flow = None
+            else:
+                flows.move_to_end(key)
+        if flow is None:
+            if len(flows) >= self.max_flows:
+                stats['evicted'] += 1
+                self._finish(next(iter(flows)))
+            flow = flows[key] = Flow(src, sport, dst, dport, proto, timestamp)
+            stats['flows'] += 1
+        forward = src == flow.src and sport == flow.sport
+        flow.add(timestamp, forward, length, header, flags, window, self.activity_timeout)
+        if flags & TCP_RST:
+            stats['rst'] += 1
+            self._finish(key)
+        elif flow.fin_fwd and flow.fin_bwd and not length and flags == TCP_ACK:
+            stats['fin'] += 1
+            self._finish(key)
+        self.expire(timestamp)
+
+    def expire(self, now):
+        flows = self.flows
+        deadline = now - self.idle_timeout
+        while flows:
+            key = next(iter(flows))
+            if flows[key].last >= deadline:
+                break
+            self.stats['idle_timeouts'] += 1
+            self._finish(key)
+
+    def _finish(self, key):
+        self.finished.append(self.flows.pop(key).row())
+        if len(self.finished) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.finished and self.export is not None:
+            self.export(pd.DataFrame(self.finished, columns=FLOW_COLUMNS).astype(FLOW_DTYPES))
+        self.finished = []
+
+    def close(self):
+        # Exports the flows still open at the end of the capture
+        while self.flows:
+            self._finish(next(iter(self.flows)))
+        self.flush()
+
+
+class PcapFlowConverter:
+    # Writes one row per TCP/UDP flow of a capture, in batches as flows finish
+    def __init__(self, data_directory, pcap_file, output_directory, attack_log=None, output_format='csv',
+                 **meter_options):
+        self.pcap_file = os.path.join(data_directory, pcap_file)
+        self.output_directory = output_directory
+        self.attack_log = attack_log
+        self.output_format = output_format
+        self.meter_options = meter_options
+        file_base_name = capture_base_name(pcap_file)
+        self.output_file = output_path(os.path.join(output_directory, f'{file_base_name}_flows'), output_format)
+        self.writer = None
+
+    def write_batch(self, df):
+        if self.attack_log is not None:
+            # Flows are labelled like windows, by majority overlap with the logged attack slots
+            starts = df['start_time'].to_numpy()
+            ends = np.maximum(starts + df['flow_duration'].to_numpy() / US, starts + 1e-6)
+            labels = join_attack_log(starts, ends, self.attack_log)
+            df = pd.concat([df, labels[['Label_val', 'Label']]], axis=1)
+        self.writer.append(df)
+
+    def run(self):
+        if not os.path.exists(self.output_directory):
+            os.makedirs(self.output_directory)
+        self.writer = TableWriter(self.output_file, self.output_format)
+        meter = FlowMeter(export=self.write_batch, **self.meter_options)
+        start = time.perf_counter()
+        for timestamp, linktype, data, orig_len, _ in CaptureReader(self.pcap_file).records():
+            meter.process(timestamp, linktype, data, orig_len)
+        meter.close()
+        seconds = time.perf_counter() - start
+        self.writer.close(FLOW_COLUMNS)
+        print(f"Saved {self.writer.rows} flows to {self.output_file} ({meter.stats['packets']} packets, "
+              f"{meter.stats['packets'] / seconds if seconds else 0:,.0f} packets/s, "
+              f"{meter.stats['evicted']} evicted at max flows)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert N3/N9 captures into TCP/UDP flow features.')
+    parser.add_argument('data_directory', type=str,
+                        help='Directory containing the captures (.pcap or .pcapng, optionally .gz or .zst)')
+    parser.add_argument('output_directory', type=str, help='Directory to save the flow CSV files')
+    parser.add_argument('--active-timeout', type=float, default=120.0,
+                        help='Split flows that last longer than this many seconds (default: 120)')
+    parser.add_argument('--idle-timeout', type=float, default=30.0,
+                        help='Finish flows without packets for this many seconds (default: 30)')
+    parser.add_argument('--activity-timeout', type=float, default=5.0,
+                        help='Gap in seconds that ends an active period and a subflow (default: 5)')
+    parser.add_argument('--max-flows', type=int, default=500_000,
+                        help='Maximum open flows; the least recently seen flow is exported beyond it '
+                             '(default: 500000)')
+    parser.add_argument('--batch-size', type=int, default=100_000,
+                        help='Finished flows written per batch (default: 100000)')
+    parser.add_argument('--format', choices=FORMATS, default='csv', dest='output_format',
+                        help='Output table format (default: csv)')
+    parser.add_argument('--attack-log', type=str, default=None,
+                        help='attack_logs.csv; flows are labelled by majority overlap with the logged slots')
+    args = parser.parse_args()
+    attack_log = load_attack_log(args.attack_log) if args.attack_log else None
+
+    filenames = sorted(f for f in os.listdir(args.data_directory) if is_capture(f))
+    failed = 0
+    for filename in filenames:
+        print(f"Processing file: {filename}")
+        try:
+            PcapFlowConverter(args.data_directory, filename, args.output_directory, attack_log, args.output_format,
+                              active_timeout=args.active_timeout, idle_timeout=args.idle_timeout,
+                              activity_timeout=args.activity_timeout, max_flows=args.max_flows,
+                              batch_size=args.batch_size).run()
+        except Exception as e:
+            failed += 1
+            print(f"  {filename}: FAILED {type(e).__name__}: {e}")
+    print(f"Total capture files processed: {len(filenames) - failed}, failed: {failed}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,53 +1,130 @@
 import subprocess
 import os
+import sys
+import csv
+import json
+import pickle
+import time
 import pandas as pd
 import numpy as np
-import tables as tb
 import argparse
+import copy
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from functools import reduce
+from itertools import repeat
+from math import gcd
 
-# Mapping PFCP message types to readable names
-pfcp_msg_type_map = {
-    1: "heartbeat_request",
-    2: "heartbeat_response",
-    3: "pfd_management_request",
-    4: "pfd_management_response",
-    5: "association_setup_request",
-    6: "association_setup_response",
-    7: "association_update_request",
-    8: "association_update_response",
-    9: "association_release_request",
-    10: "association_release_response",
-    11: "version_not_supported_response",
-    12: "node_report_request",
-    13: "node_report_response",
-    14: "session_set_deletion_request",
-    15: "session_set_deletion_response",
-    50: "session_establishment_request",
-    51: "session_establishment_response",
-    52: "session_modification_request",
-    53: "session_modification_response",
-    54: "session_deletion_request",
-    55: "session_deletion_response",
-    56: "session_report_request",
-    57: "session_report_response",
-}
+from attack_labels import join_attack_log, load_attack_log
+from capture_watch import CaptureWatcher, DailyWriter
+from manifest import Manifest, cache_path, file_digest, settings_key
+from pcap_index import CaptureIndex
+from pcap_reader import CaptureFormatError, capture_base_name, is_capture, is_compressed
+from pfcp_decoder import PfcpDecoder
+from pfcp_latency import LatencyMatcher
+from pfcp_online import OnlineWindows
+from pfcp_sessions import SessionTable
+from pfcp_windows import MSG_TYPE_COLUMNS, WindowCounter
+from pipeline_metrics import PipelineMetrics, combine, peak_rss, write_json_report, write_prometheus
+from table_io import FORMATS, load_table, output_path, write_table
+
+FEATURES = ('sessions', 'latency')
+ENGINES = ('native', 'tshark')
+# Decoder statistics reported as dropped input
+DROP_REASONS = ('not_udp', 'fragmented', 'not_pfcp', 'malformed', 'unparsed_msg_type')
+REPORT_FILE = 'run_report.json'
+# Attempts at a capture in --watch mode before it is left out until the file changes
+WATCH_ATTEMPTS = 3
+# Open windows and converted captures of --watch, kept in the output directory between runs
+WATCH_STATE_FILE = 'watch_state.pkl'
+
+# Labelling rules, applied in order with the first match winning:
+# (columns, minimum share of all messages in the window, Label_val, Label)
+LABEL_RULES = [
+    (['heartbeat_request', 'heartbeat_response'], 0.8, 0, 'normal'),
+    (['session_deletion_request', 'session_deletion_response'], 0.2, 1, 'del_att'),
+    (['session_modification_request', 'session_modification_response'], 0.2, 2, 'mod_att'),
+    (['session_establishment_request', 'session_establishment_response'], 0.2, 3, 'est_att'),
+]
+DEFAULT_LABEL = (4, 'mix_att')
+
+
+def load_label_rules(path):
+    # JSON list of [columns, threshold, label_val, label] entries, in priority order
+    with open(path) as file:
+        return [(list(columns), float(threshold), int(label_val), label)
+                for columns, threshold, label_val, label in json.load(file)]
+
+
+def label_windows(df, rules=LABEL_RULES, default=DEFAULT_LABEL):
+    # Whole-column version of the per-row threshold rules
+    counts = df[MSG_TYPE_COLUMNS].to_numpy()
+    total = counts.sum(axis=1)
+    conditions = []
+    for columns, threshold, _, _ in rules:
+        selected = df[columns].to_numpy().sum(axis=1)
+        conditions.append(selected >= threshold * total)
+    choice = np.select(conditions, np.arange(len(rules)), default=len(rules))
+    label_vals = np.array([rule[2] for rule in rules] + [default[0]])
+    labels = np.array([rule[3] for rule in rules] + [default[1]], dtype=object)
+    df['Label_val'] = label_vals[choice]
+    df['Label'] = labels[choice]
+    return df
 
 
 class PcapCsvConverter:
-    def __init__(self, data_directory, pcap_file, output_directory, interval=120):
+    def __init__(self, data_directory, pcap_file, output_directory, interval=120, engine='native', split=1,
+                 time_range=None, hop=None, label_rules=LABEL_RULES, attack_log=None, features=(),
+                 session_timeout=600, response_timeout=10.0, output_format='csv', message_cache=None,
+                 window_times=False):
         self.data_directory = data_directory
         self.pcap_file = os.path.join(data_directory, pcap_file)
         self.output_directory = output_directory
-        self.interval = interval
-        self.temp_csv_file = os.path.join(output_directory, 'temp_pcap.csv')
+        # Several intervals are derived from one count at their greatest common divisor
+        self.intervals = sorted(set(interval)) if isinstance(interval, (list, tuple)) else [interval]
+        self.hop = hop
+        self.label_rules = label_rules
+        self.attack_log = attack_log
+        self.interval = reduce(gcd, self.intervals + ([hop] if hop else []))
+        self.engine = engine
+        self.split = split
+        self.time_range = time_range
+        # Extra per-window feature groups that need the decoded messages, not just their types
+        self.features = tuple(features)
+        self.session_timeout = session_timeout
+        self.response_timeout = response_timeout
+        self.trackers = {}
+        # Absolute window_start/window_end columns, the key for joining windows with other sources
+        self.window_times = window_times
+        self.metrics = PipelineMetrics()
+        # Frames read, PFCP messages counted and skipped input by reason, for the run report
+        self.decode_stats = Counter()
+        if self.features and engine != 'native':
+            raise ValueError(f"--features {' '.join(self.features)} needs the native engine")
+
+        # Extract the file name without extension and add the interval and the format's extension
+        self.output_format = output_format
+        # Parquet file with the time and type of every PFCP message, reused when it exists
+        self.message_cache = message_cache
+        file_base_name = capture_base_name(pcap_file)
+        if time_range is not None:
+            file_base_name = f'{file_base_name}_{time_range[0]:g}-{time_range[1]:g}'
+        hop_suffix = f'_hop{hop}' if hop else ''
+        self.output_files = {i: output_path(os.path.join(output_directory, f'{file_base_name}_{i}{hop_suffix}'),
+                                            output_format)
+                             for i in self.intervals}
+        self.output_file = self.output_files[self.intervals[0]]
 
-        # Extract the file name without extension and add .csv with interval
-        file_name = os.path.basename(pcap_file)
-        file_base_name = os.path.splitext(file_name)[0]
-        self.final_csv_file = os.path.join(output_directory, f'{file_base_name}_{interval}.csv')
-        self.final_h5_file = os.path.join(output_directory, f'{file_base_name}_{interval}.h5')
+    def read_messages_native(self):
+        decoder = PfcpDecoder(self.pcap_file)
+        for frame in decoder.frames():
+            for message in frame.messages:
+                yield frame, message
+        self.decode_stats.update(decoder.stats)
+        print(f"Decoded {decoder.stats['pfcp_messages']} PFCP messages from {self.pcap_file}")
 
-    def convert_pcap_to_csv(self):
+    def read_messages_tshark(self):
         command_csv = [
             'tshark',
             '-r', self.pcap_file,
@@ -55,7 +132,7 @@ class PcapCsvConverter:
             '-T', 'fields',
             '-E', 'separator=,',
             '-E', 'quote=d',
-            '-e', 'frame.time_relative',  
+            '-e', 'frame.time_epoch',  # Absolute time, needed to join attack logs
             '-e', 'ip.src',  
             '-e', 'ip.dst',  
             '-e', 'pfcp.msg_type',  # PFCP message type (as number)
@@ -63,139 +140,585 @@ class PcapCsvConverter:
             '-E', 'header=y'  # CSV header
         ]
 
-        print(f"Converting {self.pcap_file} to {self.temp_csv_file}")
-        with open(self.temp_csv_file, 'w') as file:
-            subprocess.run(command_csv, stdout=file)  # Save to CSV file
-        print(f"Conversion completed: {self.temp_csv_file}")
-
-    def add_message_type_names(self):
-        with open(self.temp_csv_file, 'r') as file:
-            lines = file.readlines()
-
-        with open(self.final_csv_file, 'w') as file:
-           # Add column headers
-            file.write('frame.time,ip.src,ip.dst,pfcp.msg_type,frame.len,info\n')
-            for line in lines[1:]:  # Skip header
-                parts = line.strip().split(',')
-                text = parts[3].replace('"', '')
-                try:
-                    msg_type_name = pfcp_msg_type_map.get(int(text), 'unknown')  
-                    # Add new column 'info' with message type name
-                    file.write(f'{",".join(parts)},{msg_type_name}\n')
-                except:
-                    pass
-
-    def process_csv(self):
-        df = pd.read_csv(self.final_csv_file)
-
-        min_time = df['frame.time'].min()
-        max_time = df['frame.time'].max()
-
-        # Create time interval labels
-        bins = np.arange(min_time, max_time + self.interval, self.interval)
-        labels = [f"part_{i + 1}" for i in range(len(bins) - 1)]
-
-        df['part'] = pd.cut(df['frame.time'], bins=bins, labels=labels, include_lowest=True)
-
-        # Group and count 'info' values
-        df_grouped = df.groupby(['part', 'info']).size().reset_index(name='count')
-
-        # Create pivot table with all values from the dictionary as columns
-        df_final = df_grouped.pivot_table(index='part', columns='info', values='count', fill_value=0)
-        for msg_type_name in pfcp_msg_type_map.values():
-            if msg_type_name not in df_final.columns:
-                df_final[msg_type_name] = 0
-
-        # Reset index and remove 'part' column
-        df_final.reset_index(inplace=True)
-        df_final.drop(columns=['part'], inplace=True)
-        if 'Label' in df_final.columns:
-            df_final.to_csv(self.final_csv_file, index=False)
+        print(f"Converting {self.pcap_file} with tshark")
+        with subprocess.Popen(command_csv, stdout=subprocess.PIPE, text=True) as process:
+            reader = csv.reader(process.stdout)
+            next(reader, None)  # Skip header
+            stats = self.decode_stats
+            for row in reader:
+                stats['frames'] += 1
+                # Frames carrying several PFCP messages list all their types, e.g. "50,52"
+                for text in row[3].split(','):
+                    if text.isdigit():
+                        stats['pfcp_messages'] += 1
+                        yield float(row[0]), int(text)
+                    else:
+                        stats['unparsed_msg_type'] += 1
+        if process.returncode != 0:
+            raise RuntimeError(f"tshark exited with code {process.returncode} for {self.pcap_file}")
+        print(f"Conversion completed: {self.pcap_file}")
+
+    def window_range(self, interval):
+        # Windows starting within --time-range, counted from the first PFCP message
+        if self.time_range is None:
+            return None, None
+        step = self.hop or interval
+        return int(self.time_range[0] // step), int(-(-self.time_range[1] // step))
+
+    def count_windows_indexed(self):
+        # Splits the capture into byte ranges using the sidecar index and counts them in parallel
+        first_frame = next(PfcpDecoder(self.pcap_file).frames(), None)
+        if first_frame is None:
+            return WindowCounter(self.interval)
+        t0 = first_frame.time
+        counter = WindowCounter(self.interval, t0)
+        index = CaptureIndex.load_or_build(self.pcap_file)
+        if self.time_range is not None:
+            # The longest interval needs the widest span of complete windows
+            first = min(self.window_range(i)[0] * (self.hop or i) for i in self.intervals)
+            last = max((self.window_range(i)[1] - 1) * (self.hop or i) + i for i in self.intervals)
+            ranges = [index.time_range(t0 + first, t0 + last)]
         else:
-            df_final = self.manual_create_label(df_final)
-            df_final.to_csv(self.final_csv_file, index=False)
-        
-        '''
-        # Save to HDF5 file
-        with tb.open_file(self.final_h5_file, mode='w') as h5file:
-            h5file.create_table('/', 'pfcp_data', obj=df_final.to_records(index=False))
-        '''
+            ranges = index.split(self.split)
+        print(f"Counting {self.pcap_file} in {len(ranges)} part(s)")
 
-    def manual_create_label(self, df):
-        names = ['heartbeat', 'session_deletion', 'session_modification', 'session_establishment']
-        # Add new columns Label_val and Label to DataFrame
-        df['Label_val'] = 4  # Default value is 4
-        df['Label'] = 'mix_att'  # Default label is 'mix_att'
-    
-        for index, row in df.iterrows():
-            row_to_sum = row.drop(labels=['Label_val','Label'])
-            total_sum = row_to_sum.sum()  # Sum of all columns
-            # Check selected columns
-            for i, name in enumerate(names):
-                selected_sum = row[f'{name}_request'] + row[f'{name}_request']  # Sum of selected columns
-                # Check if selected_sum is at least 70% of total_sum
-                if i == 0:
-                    if selected_sum >= 0.8 * total_sum:
-                        df.at[index, 'Label_val'] = i
-                        df.at[index, 'Label'] = 'normal'
-                        break
+        if len(ranges) == 1:
+            parts = [count_range(self.pcap_file, self.interval, t0, *ranges[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=self.split) as executor:
+                parts = list(executor.map(count_range, repeat(self.pcap_file), repeat(self.interval), repeat(t0),
+                                          [start for start, _ in ranges], [stop for _, stop in ranges]))
+        # Workers share the t0 grid, so windows straddling a split are summed exactly
+        for part, stats in parts:
+            counter.merge(part)
+            self.decode_stats.update(stats)
+        return counter
+
+    def count_cached(self):
+        # Message times and types stored by an earlier run, counted without decoding the capture again
+        messages = load_table(self.message_cache)
+        print(f"Read {len(messages)} PFCP messages of {self.pcap_file} from {self.message_cache}")
+        self.decode_stats['pfcp_messages'] += len(messages)
+        counter = WindowCounter(self.interval)
+        counter.add_many(messages['time'].to_numpy(), messages['msg_type'].to_numpy())
+        return counter
+
+    def save_message_cache(self, times, msg_types):
+        os.makedirs(os.path.dirname(self.message_cache), exist_ok=True)
+        write_table(pd.DataFrame({'time': np.frombuffer(times, dtype=np.float64),
+                                  'msg_type': np.frombuffer(msg_types, dtype=np.uint8)}),
+                    self.message_cache, 'parquet')
+
+    def count_windows(self):
+        counter = WindowCounter(self.interval)
+        if self.features and self.message_cache is not None:
+            print("--features needs the decoded frames, the message cache is not used")
+            self.message_cache = None
+        if self.message_cache is not None and os.path.exists(self.message_cache):
+            return self.count_cached()
+        # Every message is kept for the cache when one should be written
+        caching = self.message_cache is not None
+        times, msg_types = array('d'), array('B')
+        if self.engine == 'native':
+            try:
+                if (self.features or caching) and self.split > 1:
+                    # Session state carries across the whole capture, so it cannot be split into ranges
+                    print(f"--features and the message cache need one pass over {self.pcap_file}, ignoring --split")
+                elif is_compressed(self.pcap_file) and self.split > 1:
+                    # A byte range of a compressed capture can only be reached by decompressing everything before it
+                    print(f"{self.pcap_file} is compressed, ignoring --split")
+                elif self.split > 1 or self.time_range is not None and not self.features and not caching:
+                    return self.count_windows_indexed()
+                if 'sessions' in self.features:
+                    self.trackers['sessions'] = SessionTable(self.interval, self.session_timeout)
+                if 'latency' in self.features:
+                    self.trackers['latency'] = LatencyMatcher(self.interval, self.response_timeout)
+                trackers = list(self.trackers.values())
+                for frame, message in self.read_messages_native():
+                    counter.add(frame.time, message.msg_type)
+                    for tracker in trackers:
+                        tracker.update(frame.time, frame, message)
+                    if caching:
+                        times.append(frame.time)
+                        msg_types.append(message.msg_type)
+                if caching:
+                    self.save_message_cache(times, msg_types)
+                return counter
+            except CaptureFormatError as e:
+                # Formats the built-in decoder does not understand still go through tshark
+                print(f"Native decoder failed ({e}), falling back to tshark")
+                counter = WindowCounter(self.interval)
+                times, msg_types = array('d'), array('B')
+                self.decode_stats = Counter()
+                if self.trackers:
+                    print("tshark gives message types only, the --features columns are left out")
+                    self.trackers = {}
+        for timestamp, msg_type in self.read_messages_tshark():
+            counter.add(timestamp, msg_type)
+            if caching:
+                times.append(timestamp)
+                msg_types.append(msg_type)
+        if caching:
+            self.save_message_cache(times, msg_types)
+        return counter
+
+    def process_windows(self, counter):
+        # One table per interval: one row per window, one column per PFCP message type
+        tables = {}
+        for interval in self.intervals:
+            with self.metrics.stage('window') as stage:
+                # Every interval is built from the same messages, so they count as input once
+                if interval == self.intervals[0]:
+                    stage.rows_in += self.decode_stats['pfcp_messages']
+                if self.hop:
+                    windows = counter.slide(interval, self.hop)
                 else:
-                    if selected_sum >= 0.2 * total_sum:
-                        df.at[index, 'Label_val'] = i
-                        if i == 1:
-                            df.at[index, 'Label'] = 'del_att'
-                        elif i == 2:
-                            df.at[index, 'Label'] = 'mod_att'
-                        elif i == 3:
-                            df.at[index, 'Label'] = 'est_att'
-                        break
-        
-        return df
+                    windows = counter if interval == self.interval else counter.resample(interval)
+                df_final = windows.to_frame(*self.window_range(interval))
+                if self.trackers:
+                    bounds = windows.bounds(*self.window_range(interval))
+                    df_final = pd.concat([df_final] + [tracker.to_frame(windows, *bounds)
+                                                       for tracker in self.trackers.values()], axis=1)
+                if self.window_times:
+                    window_starts, window_ends = windows.window_times(*self.window_range(interval))
+                    df_final.insert(0, 'window_start', window_starts)
+                    df_final.insert(1, 'window_end', window_ends)
+                stage.rows_out += len(df_final)
+            with self.metrics.stage('label') as stage:
+                stage.rows_in += len(df_final)
+                if self.attack_log is not None:
+                    # Ground truth from the attack orchestrator instead of the count heuristics
+                    window_starts, window_ends = windows.window_times(*self.window_range(interval))
+                    labels = join_attack_log(window_starts, window_ends, self.attack_log)
+                    df_final = pd.concat([df_final, labels], axis=1)
+                else:
+                    df_final = self.manual_create_label(df_final)
+                stage.rows_out += len(df_final)
+            with self.metrics.stage('write') as stage:
+                # Written to a per-process temp file first so concurrent runs never see or clobber partial output
+                write_table(df_final, self.output_files[interval], self.output_format)
+                stage.rows_in += len(df_final)
+                stage.rows_out += len(df_final)
+            tables[interval] = df_final
+        return tables
+
+    def manual_create_label(self, df):
+        return label_windows(df, self.label_rules)
 
     def run(self):
         if not os.path.exists(self.output_directory):
             os.makedirs(self.output_directory)
 
-        # Convert PCAP to CSV
-        self.convert_pcap_to_csv()
+        # Decode PFCP messages and count them per time interval in a single pass
+        with self.metrics.stage('decode') as stage:
+            counter = self.count_windows()
+            # Frames read, or cached messages when the capture was not decoded
+            stage.rows_in = self.decode_stats['frames'] or self.decode_stats['pfcp_messages']
+            stage.rows_out = self.decode_stats['pfcp_messages']
+        for reason in DROP_REASONS:
+            self.metrics.drop(reason, self.decode_stats[reason])
+
+        # Label the intervals and write the final table
+        tables = self.process_windows(counter)
+        # Message types without a column are skipped by the windows, not by the decoder
+        self.metrics.drop('unknown_msg_type', counter.unknown)
+        for interval, df_final in tables.items():
+            print(f"Saved {len(df_final)} intervals to {self.output_files[interval]}")
 
-        # Add readable message type names
-        self.add_message_type_names()
 
-        # Process and split data into time intervals
-        self.process_csv()
+def count_range(pcap_file, interval, t0, start, stop):
+    # Counts the PFCP messages of records starting in the byte range [start, stop) on a fixed t0 grid
+    counter = WindowCounter(interval, t0)
+    decoder = PfcpDecoder(pcap_file)
+    for frame in decoder.frames(start, stop):
+        for message in frame.messages:
+            counter.add(frame.time, message.msg_type)
+    counter.flush()
+    return counter, decoder.stats
 
-        # Remove temporary CSV file
-        os.remove(self.temp_csv_file)
-        print(f"Temporary file {self.temp_csv_file} removed")
 
+def convert_pcap(data_directory, filename, output_directory, interval, options, previous=None,
+                 cache_messages=False):
+    # Runs one conversion and reports the outcome instead of raising, so one bad capture cannot stop a batch.
+    # `previous` is the manifest entry of an earlier conversion with the same settings.
+    start = time.perf_counter()
+    try:
+        path = os.path.join(data_directory, filename)
+        stat = os.stat(path)
+        digest = file_digest(path)
+        record = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest}
+        if previous is not None and previous['digest'] == digest:
+            # Touched or copied, but the content is what was converted before
+            return filename, None, time.perf_counter() - start, dict(record, outputs=previous['outputs'], skipped=True)
+        if cache_messages:
+            options = dict(options, message_cache=cache_path(output_directory, digest))
+        processor = PcapCsvConverter(data_directory, filename, output_directory, interval, **options)
+        processor.run()
+        outputs = list(processor.output_files.values())
+        return filename, None, time.perf_counter() - start, dict(record, outputs=outputs, skipped=False,
+                                                                  metrics=processor.metrics.to_dict())
+    except Exception as e:
+        return filename, f"{type(e).__name__}: {e}", time.perf_counter() - start, None
 
-def process_all_pcaps_in_directory(data_directory, output_directory, interval):
+
+def process_all_pcaps_in_directory(data_directory, output_directory, interval, jobs=1, force=False,
+                                   cache_messages=False, report_file=None, prometheus_file=None, **options):
+    run_start = time.perf_counter()
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
 
-    # Iterate through all files in the given folder
-    processed_files_count = 0
-    for filename in os.listdir(data_directory):
-        if filename.endswith('.pcap'):
+    # Sorted so that batches are processed and reported in the same order on every run
+    filenames = sorted(f for f in os.listdir(data_directory) if is_capture(f))
+
+    # Captures already converted with the same settings are skipped; --split only changes how, not what
+    manifest = Manifest(output_directory)
+    intervals = sorted(set(interval)) if isinstance(interval, (list, tuple)) else [interval]
+    key = settings_key(dict({k: v for k, v in options.items() if k != 'split'}, interval=intervals))
+    results = {}
+    todo = []
+    for filename in filenames:
+        entry = None if force else manifest.current(filename, key)
+        if entry is not None and manifest.unchanged(entry, os.stat(os.path.join(data_directory, filename))):
+            results[filename] = (filename, None, 0.0, dict(entry, skipped=True))
+        else:
+            todo.append((filename, entry))
+
+    def finished(result):
+        filename, error, _, record = result
+        results[filename] = result
+        if error is None:
+            manifest.record(filename, record['size'], record['mtime_ns'], record['digest'], key, record['outputs'])
+            manifest.save()
+
+    if jobs == 1:
+        for filename, entry in todo:
             print(f"Processing file: {filename}")
-            processor = PcapCsvConverter(data_directory, filename, output_directory, interval)
-            processor.run()
-            processed_files_count += 1
+            finished(convert_pcap(data_directory, filename, output_directory, interval, options, entry,
+                                  cache_messages))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            pending = set()
+            for filename, entry in todo:
+                print(f"Processing file: {filename}")
+                pending.add(executor.submit(convert_pcap, data_directory, filename, output_directory, interval,
+                                            options, entry, cache_messages))
+                # Keep at most two captures per worker in flight
+                if len(pending) >= 2 * jobs:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finished(future.result())
+            for future in pending:
+                finished(future.result())
+
+    failed = [results[f] for f in filenames if results[f][1] is not None]
+    skipped = 0
+    files = {}
+    for filename in filenames:
+        _, error, seconds, record = results[filename]
+        if error is None and record['skipped']:
+            skipped += 1
+            status = 'unchanged'
+        else:
+            status = 'FAILED ' + error if error else 'ok'
+        print(f"  {filename}: {status} ({seconds:.1f} s)")
+        files[filename] = {'status': status.split(' ')[0].lower(), 'seconds': round(seconds, 6),
+                           'error': error, 'metrics': record.get('metrics') if record else None}
+    print(f"Total capture files processed: {len(filenames) - len(failed) - skipped}, unchanged: {skipped}, "
+          f"failed: {len(failed)}")
+
+    write_run_report(files, run_start, jobs, report_file or os.path.join(output_directory, REPORT_FILE),
+                     prometheus_file)
+    return failed
+
+
+def write_run_report(files, run_start, jobs, report_file, prometheus_file=None):
+    # Machine-readable summary of the run: per-capture stage metrics and their totals
+    statuses = Counter(f['status'] for f in files.values())
+    report = {'finished': round(time.time(), 3), 'seconds': round(time.perf_counter() - run_start, 6),
+              'jobs': jobs,
+              'files_by_status': {status: statuses[status] for status in ('ok', 'unchanged', 'failed')},
+              'totals': combine([f['metrics'] for f in files.values() if f['metrics']]),
+              'peak_rss_bytes': peak_rss(), 'files': files}
+    write_json_report(report_file, report)
+    if prometheus_file:
+        write_prometheus(prometheus_file, report)
+
+
+class WatchConverter:
+    # Streaming counterpart of PcapCsvConverter for --watch. Window state carries over from one capture
+    # to the next and windows are aligned to multiples of the hop since the epoch, so a window spanning a
+    # rotation is counted whole. Windows are labelled and appended to the per-day files as soon as a
+    # later message closes them; the windows still open wait for the next capture, also across restarts
+    # through save_state and load_state.
+    def __init__(self, output_directory, intervals, hop=None, label_rules=LABEL_RULES, attack_log_file=None):
+        self.intervals = intervals
+        self.hop = hop
+        self.windows = self.new_windows()
+        self.writers = {interval: DailyWriter(output_directory, interval, hop) for interval in intervals}
+        self.label_rules = label_rules
+        self.attack_log_file = attack_log_file
+        self.attack_log = None
+        self.attack_log_mtime = None
+
+    def new_windows(self):
+        return {interval: OnlineWindows(interval, self.hop, align=True) for interval in self.intervals}
+
+    def current_attack_log(self):
+        # The orchestrator appends a row per slot during a campaign, so the log is read again when it changes
+        mtime = os.stat(self.attack_log_file).st_mtime_ns
+        if mtime != self.attack_log_mtime:
+            self.attack_log = load_attack_log(self.attack_log_file)
+            self.attack_log_mtime = mtime
+        return self.attack_log
+
+    def add_capture(self, path):
+        # Returns the metrics of the capture, the number of windows written and the files they went to.
+        # A capture that cannot be read to the end, e.g. a truncated .gz, leaves the window state as it
+        # was before, so it can be added again.
+        metrics = PipelineMetrics()
+        closed = {interval: [] for interval in self.windows}
+        saved = copy.deepcopy(self.windows)
+        try:
+            with metrics.stage('decode') as stage:
+                decoder = PfcpDecoder(path)
+                for frame in decoder.frames():
+                    for message in frame.messages:
+                        for interval, windows in self.windows.items():
+                            closed[interval].extend(windows.add(frame.time, message.msg_type))
+                stage.rows_in = decoder.stats['frames']
+                stage.rows_out = decoder.stats['pfcp_messages']
+            for reason in DROP_REASONS:
+                metrics.drop(reason, decoder.stats[reason])
+            return (metrics, *self.write(closed, metrics))
+        except BaseException:
+            self.windows = saved
+            raise
+
+    def flush(self):
+        # Writes every window still open with the messages seen so far: advancing by a whole interval
+        # closes the open bin and all hop windows overlapping it. The next capture starts new windows.
+        metrics = PipelineMetrics()
+        closed = {interval: windows.advance(windows.bin_start + windows.interval) if windows.bin_start is not None
+                  else [] for interval, windows in self.windows.items()}
+        self.windows = self.new_windows()
+        return (metrics, *self.write(closed, metrics))
 
-    print(f"Total .pcap files processed: {processed_files_count}")
+    def save_state(self, path, key, captures):
+        # Written after the windows of a capture were appended and before the manifest records it
+        temp_file = f'{path}.{os.getpid()}.tmp'
+        with open(temp_file, 'wb') as file:
+            pickle.dump({'settings': key, 'windows': self.windows, 'captures': sorted(captures)}, file)
+        os.replace(temp_file, path)
+
+    def load_state(self, path, key):
+        # Resumes the open windows of an earlier run with the same settings; returns the captures they include
+        if not os.path.exists(path):
+            return []
+        with open(path, 'rb') as file:
+            state = pickle.load(file)
+        if state['settings'] != key:
+            return []
+        self.windows = state['windows']
+        return state['captures']
+
+    def write(self, closed, metrics):
+        rows = 0
+        outputs = []
+        for interval, windows in closed.items():
+            if not windows:
+                continue
+            with metrics.stage('window') as stage:
+                window_starts = np.array([window[0] for window in windows], dtype=np.float64)
+                window_ends = np.array([window[1] for window in windows], dtype=np.float64)
+                df_final = pd.DataFrame(np.vstack([window[2] for window in windows]), columns=MSG_TYPE_COLUMNS)
+                df_final.insert(0, 'window_start', window_starts)
+                df_final.insert(1, 'window_end', window_ends)
+                stage.rows_out += len(df_final)
+            with metrics.stage('label') as stage:
+                stage.rows_in += len(df_final)
+                if self.attack_log_file is not None:
+                    labels = join_attack_log(window_starts, window_ends, self.current_attack_log())
+                    df_final = pd.concat([df_final, labels], axis=1)
+                else:
+                    df_final = label_windows(df_final, self.label_rules)
+                stage.rows_out += len(df_final)
+            with metrics.stage('write') as stage:
+                outputs.extend(path for path in self.writers[interval].append(df_final) if path not in outputs)
+                stage.rows_in += len(df_final)
+                stage.rows_out += len(df_final)
+            rows += len(df_final)
+        return rows, outputs
+
+
+def watch_directory(data_directory, output_directory, interval, hop=None, label_rules=LABEL_RULES,
+                    attack_log_file=None, poll_interval=1.0, settle=2.0, force=False, report_file=None,
+                    prometheus_file=None, flush_on_exit=False):
+    # Converts captures as they are finished until interrupted, appending to <output>/<day>_<interval>.csv
+    run_start = time.perf_counter()
+    os.makedirs(output_directory, exist_ok=True)
+    intervals = sorted(set(interval)) if isinstance(interval, (list, tuple)) else [interval]
+    report_file = report_file or os.path.join(output_directory, REPORT_FILE)
+    manifest = Manifest(output_directory)
+    key = settings_key({'watch': True, 'interval': intervals, 'hop': hop, 'label_rules': label_rules,
+                        'attack_log': attack_log_file})
+    state_file = os.path.join(output_directory, WATCH_STATE_FILE)
+    converter = WatchConverter(output_directory, intervals, hop, label_rules, attack_log_file)
+    # Captures appended by an earlier run with the same settings are not appended again, and the windows
+    # it left open are continued. A capture in the state but not yet in the manifest is converted too.
+    done = set() if force else set(manifest.converted(key)) | set(converter.load_state(state_file, key))
+    watcher = CaptureWatcher(data_directory, settle, done)
+    files = {}
+    attempts = Counter()
+    print(f"Watching {data_directory} for finished captures, {len(done)} already converted (Ctrl+C to stop)")
+    try:
+        while True:
+            ready = watcher.poll()
+            for position, filename in enumerate(ready):
+                path = os.path.join(data_directory, filename)
+                start = time.perf_counter()
+                try:
+                    stat = os.stat(path)
+                    metrics, rows, outputs = converter.add_capture(path)
+                    done.add(filename)
+                    converter.save_state(state_file, key, done)
+                    manifest.record(filename, stat.st_size, stat.st_mtime_ns, file_digest(path), key, outputs)
+                    manifest.save()
+                    files[filename] = {'status': 'ok', 'seconds': round(time.perf_counter() - start, 6),
+                                       'error': None, 'metrics': metrics.to_dict()}
+                    # Lag between the capture being finished and its windows being on disk
+                    print(f"  {filename}: {metrics.stages['decode'].rows_out} messages, {rows} windows appended, "
+                          f"{time.time() - stat.st_mtime:.1f} s after the capture was closed")
+                    attempts.pop(filename, None)
+                except Exception as e:
+                    files[filename] = {'status': 'failed', 'seconds': round(time.perf_counter() - start, 6),
+                                       'error': f"{type(e).__name__}: {e}", 'metrics': None}
+                    attempts[filename] += 1
+                    if attempts[filename] >= WATCH_ATTEMPTS:
+                        del attempts[filename]
+                        watcher.quarantine(filename)
+                        print(f"  {filename}: FAILED {type(e).__name__}: {e}, skipped until the file changes")
+                    else:
+                        # Later captures wait for this one, so the windows are filled in capture order
+                        for name in ready[position:]:
+                            watcher.retry(name)
+                        print(f"  {filename}: FAILED {type(e).__name__}: {e}, retrying "
+                              f"({attempts[filename]} of {WATCH_ATTEMPTS} attempts)")
+                        write_run_report(files, run_start, 1, report_file, prometheus_file)
+                        break
+                write_run_report(files, run_start, 1, report_file, prometheus_file)
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        if flush_on_exit:
+            _, rows, _ = converter.flush()
+            converter.save_state(state_file, key, done)
+            print(f"Stopped, {rows} open windows written")
+        else:
+            print(f"Stopped, the open windows are kept in {state_file} for the next run")
+        write_run_report(files, run_start, 1, report_file, prometheus_file)
+
+
+def parse_time_range(text):
+    start, end = text.split(':')
+    return float(start), float(end)
 
 
 def main():
-    parser = argparse.ArgumentParser(description='Process PCAP files and convert them to CSV and HDF5 formats.')
-    parser.add_argument('data_directory', type=str, help='Directory containing the .pcap files')
+    parser = argparse.ArgumentParser(description='Process PCAP files and convert them to CSV, Parquet or HDF5 tables.')
+    parser.add_argument('data_directory', type=str,
+                        help='Directory containing the captures (.pcap or .pcapng, optionally .gz or .zst)')
     parser.add_argument('output_directory', type=str, help='Directory to save the processed files')
-    parser.add_argument('--interval', type=int, default=120,
-                        help='Time interval for splitting data (default: 120 seconds)')
+    parser.add_argument('--interval', type=int, nargs='+', default=[120],
+                        help='Time interval(s) for splitting data; several values are computed in one pass '
+                             'and written to one file each (default: 120 seconds)')
+    parser.add_argument('--format', choices=FORMATS, default='csv', dest='output_format',
+                        help='Output table format; parquet and hdf5 store counts as uint32 and labels as '
+                             'categories (default: csv)')
+    parser.add_argument('--engine', choices=ENGINES, default='native',
+                        help='PFCP decoder: built-in pcap/pcapng reader or tshark (default: native)')
+    parser.add_argument('--hop', type=int, default=None,
+                        help='Emit overlapping windows of --interval length every HOP seconds '
+                             '(default: tumbling windows)')
+    parser.add_argument('--label-rules', type=str, default=None,
+                        help='JSON file with labelling rules [[columns], threshold, label_val, label], '
+                             'first match wins (default: built-in heartbeat/deletion/modification/establishment rules)')
+    parser.add_argument('--attack-log', type=str, default=None,
+                        help='attack_logs.csv with slot start/end times; windows are labelled by majority '
+                             'overlap with the logged slots instead of --label-rules')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of captures converted in parallel (default: 1)')
+    parser.add_argument('--split', type=int, default=1,
+                        help='Count each capture in N byte ranges in parallel, using a .idx sidecar index '
+                             '(native engine, default: 1)')
+    parser.add_argument('--features', nargs='+', choices=FEATURES, default=[],
+                        help='Extra per-window columns: sessions tracks PFCP sessions by SEID and adds orphan '
+                             'modification/deletion counts, session churn and live sessions; latency matches '
+                             'requests with responses and adds response time percentiles, unanswered requests '
+                             'and retransmissions (native engine)')
+    parser.add_argument('--session-timeout', type=float, default=600,
+                        help='Seconds without messages after which a session is evicted (default: 600)')
+    parser.add_argument('--response-timeout', type=float, default=10.0,
+                        help='Seconds after which a request without response counts as unanswered (default: 10)')
+    parser.add_argument('--force', action='store_true',
+                        help='Convert every capture again, even if manifest.json lists it as converted '
+                             'with the same settings')
+    parser.add_argument('--cache-messages', action='store_true',
+                        help='Keep the time and type of every PFCP message in <output>/.cache/<hash>.parquet, '
+                             'so other intervals, hops or labels are computed without decoding the capture again')
+    parser.add_argument('--window-times', action='store_true',
+                        help='Add window_start and window_end columns (epoch seconds), e.g. for '
+                             'models/feature_store.py')
+    parser.add_argument('--report', type=str, default=None,
+                        help=f'JSON run report with per-stage timings, rows, peak RSS and dropped input '
+                             f'(default: <output_directory>/{REPORT_FILE})')
+    parser.add_argument('--prometheus', type=str, default=None,
+                        help='Also write the run totals as a Prometheus textfile, e.g. for the node_exporter '
+                             'textfile collector')
+    parser.add_argument('--time-range', type=parse_time_range, default=None, metavar='START:END',
+                        help='Only convert the intervals covering START..END seconds after the first PFCP message')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and convert captures as they are finished, appending the windows to '
+                             '<output_directory>/<day>_<interval>.csv (UTC day of the window start)')
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help='Seconds between directory scans in --watch mode (default: 1)')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='Seconds a capture must keep its size and mtime before --watch reads it (default: 2)')
+    parser.add_argument('--flush-on-exit', action='store_true',
+                        help='When --watch is stopped, write the open windows with the messages seen so far '
+                             'instead of continuing them in the next run')
 
     args = parser.parse_args()
+    label_rules = load_label_rules(args.label_rules) if args.label_rules else LABEL_RULES
+
+    if args.flush_on_exit and not args.watch:
+        parser.error('--flush-on-exit needs --watch')
+    if args.watch:
+        unsupported = [option for option, used in (('--features', args.features), ('--split', args.split > 1),
+                                                   ('--jobs', args.jobs > 1), ('--time-range', args.time_range),
+                                                   ('--cache-messages', args.cache_messages),
+                                                   ('--engine tshark', args.engine != 'native'),
+                                                   ('--format', args.output_format != 'csv')) if used]
+        if unsupported:
+            parser.error(f"--watch cannot be combined with {', '.join(unsupported)}")
+        if args.hop and any(interval % args.hop for interval in args.interval):
+            parser.error('--watch needs every --interval to be a multiple of --hop')
+        watch_directory(args.data_directory, args.output_directory, args.interval, args.hop, label_rules,
+                        args.attack_log, args.poll_interval, args.settle, args.force, args.report, args.prometheus,
+                        args.flush_on_exit)
+        return
+
+    attack_log = load_attack_log(args.attack_log) if args.attack_log else None
 
-    process_all_pcaps_in_directory(args.data_directory, args.output_directory, args.interval)
+    failed = process_all_pcaps_in_directory(args.data_directory, args.output_directory, args.interval, args.jobs,
+                                            force=args.force, cache_messages=args.cache_messages,
+                                            report_file=args.report, prometheus_file=args.prometheus,
+                                            engine=args.engine, split=args.split, time_range=args.time_range,
+                                            hop=args.hop, label_rules=label_rules,
+                                            attack_log=attack_log, features=args.features,
+                                            session_timeout=args.session_timeout,
+                                            response_timeout=args.response_timeout,
+                                            output_format=args.output_format, window_times=args.window_times)
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
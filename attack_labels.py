@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+# Label given to windows that no attack_logs.csv slot overlaps
+UNLABELLED = (-1, 'unlabelled')
+
+
+def load_attack_log(path):
+    # attack_logs.csv written by attacks/attack_random.py: index, Label, Label_val, start_time, end_time
+    log = pd.read_csv(path)
+    if 'start_time' not in log.columns or 'end_time' not in log.columns:
+        raise ValueError(f"{path} has no start_time/end_time columns, it was written by an older attack_random.py")
+    return log.sort_values('start_time').reset_index(drop=True)
+
+
+def covered_time(starts, ends, times):
+    # Total length of the sorted, non-overlapping [starts, ends) intervals that lies before each of times
+    cumulative = np.concatenate(([0.0], np.cumsum(ends - starts)))
+    k = np.searchsorted(ends, times, side='right')
+    inside = np.minimum(k, len(starts) - 1)
+    partial = np.where((k < len(starts)) & (starts[inside] < times), times - starts[inside], 0.0)
+    return cumulative[k] + partial
+
+
+def join_attack_log(window_starts, window_ends, log):
+    # Majority label of each window by overlap with the logged slots, and the fraction of the window it covers
+    if log.empty:
+        return pd.DataFrame({'Label_val': UNLABELLED[0], 'Label': UNLABELLED[1],
+                             'label_overlap': np.zeros(len(window_starts))})
+    label_vals = np.sort(log['Label_val'].unique())
+    overlap = np.zeros((len(window_starts), len(label_vals)))
+    for column, label_val in enumerate(label_vals):
+        slots = log[log['Label_val'] == label_val]
+        starts = slots['start_time'].to_numpy(dtype=np.float64)
+        ends = slots['end_time'].to_numpy(dtype=np.float64)
+        overlap[:, column] = covered_time(starts, ends, window_ends) - covered_time(starts, ends, window_starts)
+
+    names = log.drop_duplicates('Label_val').set_index('Label_val')['Label']
+    majority = overlap.argmax(axis=1)
+    best = overlap[np.arange(len(overlap)), majority]
+    covered = best > 0
+    result = pd.DataFrame({
+        'Label_val': np.where(covered, label_vals[majority], UNLABELLED[0]),
+        'Label': np.where(covered, names.reindex(label_vals).to_numpy()[majority], UNLABELLED[1]),
+        'label_overlap': best / (window_ends - window_starts),
+    })
+    return result
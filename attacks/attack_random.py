@@ -1,59 +1,21 @@
-import subprocess
-import time
-import random
-import csv
+from attack_scheduler import AttackScheduler, plan_campaign
+from pfcp_generator import PFCP_CP_IP_V4, PFCP_UP_IP_V4, SimulatedSmf
 
-# Lista skryptów do uruchomienia
-scripts = ["pfcp_establishment.py", "pfcp_modification_dupl.py",  "pfcp_deletion.py"]
-#scripts = ["pfcp_establishment.py", "pfcp_modification_dupl.py", "pfcp_modification_drop.py", "pfcp_deletion.py"]
+# Lista scenariuszy do uruchomienia (zachowania skryptów pfcp_*.py, wykonywane w jednym procesie)
+scenarios = ["establishment", "modification_dupl", "deletion"]
+#scenarios = ["establishment", "modification_dupl", "modification_drop", "deletion"]
 total_duration = 10800
 script_duration = 39
-cnt = 0
-
-# Czas rozpoczęcia
-start_time = time.time()
 
 # Nazwa pliku CSV
 csv_file = "attack_logs.csv"
 
-# Inicjalizacja pliku CSV i zapisanie nagłówków
-with open(csv_file, mode='w', newline='') as file:
-    writer = csv.writer(file)
-    writer.writerow(["index", "Label","Label_val"])
-
-while time.time() - start_time < total_duration:
-    # Losowy wybór skryptu z listy
-    if cnt % (len(scripts)+ 1) == 0:
-        time.sleep(39)
-        with open(csv_file, mode='a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([cnt, 'normal', 0])
-    else:
-        current_script = random.choice(scripts)
-        try:
-            # Drukujemy nazwę skryptu do debugowania
-            print(f"Uruchamianie {current_script} przez {script_duration} sekund")
-            
-            # Zapisujemy nazwę skryptu do pliku CSV z aktualnym indeksem
-            with open(csv_file, mode='a', newline='') as file:
-                writer = csv.writer(file)
-                if current_script == 'pfcp_establishment.py':
-                    writer.writerow([cnt, "est_att", 3])
-                elif current_script == "pfcp_modification_drop.py" or current_script == "pfcp_modification_dupl.py":
-                    writer.writerow([cnt, "mod_att", 2])
-                elif current_script == "pfcp_deletion.py":
-                    writer.writerow([cnt, "del_att", 1])
-                else:
-                    writer.writerow([cnt, "mix_att", 4])
-            # Debugowanie: potwierdzenie zapisu
-            print(f"Zapisano do CSV: {cnt}, {current_script}")
-
-            # Uruchamiamy skrypt za pomocą python3
-            subprocess.run(["python3", current_script], timeout=script_duration)
-        except subprocess.TimeoutExpired:
-            print(f"Zakończono {current_script} po {script_duration} sekundach")
-        except Exception as e:
-            print(f"Błąd podczas uruchamiania {current_script}: {e}")
-    
-    cnt += 1
-    time.sleep(1)
+if __name__ == "__main__":
+    # Plan slotów losowany z góry: co (len(scenarios) + 1)-ty slot normalny, pozostałe losowy scenariusz.
+    # Po slocie 1 s przerwy, jak wcześniej time.sleep(1) po każdym skrypcie.
+    slots = plan_campaign(scenarios, total_duration, script_duration, gap=1)
+    sender = SimulatedSmf(PFCP_CP_IP_V4, PFCP_UP_IP_V4, spoof=True)
+    try:
+        AttackScheduler(sender, slots, script_duration, csv_file).run()
+    finally:
+        sender.close()
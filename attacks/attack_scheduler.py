@@ -0,0 +1,148 @@
+import argparse
+import csv
+import heapq
+import random
+import time
+from collections import namedtuple
+
+from pfcp_generator import PFCP_CP_IP_V4, PFCP_PORT, PFCP_UP_IP_V4, SimulatedSmf
+
+# An attack behaviour: its label and the message streams it sends, as (message kind, seconds between messages)
+Scenario = namedtuple('Scenario', ['label', 'label_val', 'streams'])
+Slot = namedtuple('Slot', ['index', 'offset', 'scenario', 'label', 'label_val', 'streams'])
+
+# The attack scripts: one message per time.sleep() of their request threads
+SCENARIOS = {
+    'normal': Scenario('normal', 0, ()),
+    'establishment': Scenario('est_att', 3, (('establishment', 1.0),)),
+    'modification_dupl': Scenario('mod_att', 2, (('modification_dupl', 3.0),)),
+    'modification_drop': Scenario('mod_att', 2, (('modification_drop', 3.0),)),
+    'deletion': Scenario('del_att', 1, (('deletion', 1.0),)),
+}
+MIXED = ('mix_att', 4)
+# Scenarios of attack_random.py
+DEFAULT_SCENARIOS = ['establishment', 'modification_dupl', 'deletion']
+LOG_COLUMNS = ['index', 'Label', 'Label_val', 'start_time', 'end_time', 'scenario', 'messages', 'max_lateness']
+# Sleeps end this long before a deadline, the rest is waited out on the monotonic clock
+SPIN = 0.002
+
+
+def scenario(name):
+    # 'establishment+deletion' runs both scenarios at once in the same slot
+    parts = [SCENARIOS[part] for part in name.split('+')]
+    labels = {(part.label, part.label_val) for part in parts}
+    label, label_val = labels.pop() if len(labels) == 1 else MIXED
+    return label, label_val, tuple(stream for part in parts for stream in part.streams)
+
+
+def plan_campaign(scenarios, total_duration, slot_duration, gap=1.0, seed=None):
+    # Slot order of attack_random.py: every (len(scenarios) + 1)-th slot is normal, the others a random
+    # scenario. The whole plan is drawn up front, so a seed reproduces the campaign.
+    rng = random.Random(seed)
+    period = slot_duration + gap
+    slots = []
+    for index in range(int(-(-total_duration // period))):
+        name = 'normal' if index % (len(scenarios) + 1) == 0 else rng.choice(scenarios)
+        slots.append(Slot(index, index * period, name, *scenario(name)))
+    return slots
+
+
+def wait_until(deadline):
+    remaining = deadline - time.monotonic()
+    if remaining > SPIN:
+        time.sleep(remaining - SPIN)
+    while time.monotonic() < deadline:
+        pass
+
+
+class AttackScheduler:
+    # Runs a campaign plan on one sender. Deadlines are fixed offsets from the campaign start on the
+    # monotonic clock, so slots do not drift; the log gets the wall clock time read at each boundary.
+    def __init__(self, sender, slots, slot_duration, log_file='attack_logs.csv', reset_seids=True):
+        self.sender = sender
+        self.slots = slots
+        self.slot_duration = slot_duration
+        self.log_file = log_file
+        self.reset_seids = reset_seids
+
+    def run(self, lead=0.5):
+        with open(self.log_file, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(LOG_COLUMNS)
+            start = time.monotonic() + lead
+            for slot in self.slots:
+                row = self.run_slot(slot, start + slot.offset)
+                writer.writerow(row)
+                file.flush()
+                print(f"Slot {slot.index}: {slot.scenario} ({slot.label}), {row[6]} messages, "
+                      f"max lateness {float(row[7]) * 1000:.3f} ms")
+
+    def run_slot(self, slot, slot_start):
+        slot_end = slot_start + self.slot_duration
+        if self.reset_seids:
+            # Every attack script started its guessed SEIDs at 1
+            self.sender.next_seid = 1
+        events = [(slot_start, i, kind, interval) for i, (kind, interval) in enumerate(slot.streams)]
+        heapq.heapify(events)
+        wait_until(slot_start)
+        start_time = time.time()
+        lateness = time.monotonic() - slot_start
+        messages = 0
+        while events and events[0][0] < slot_end:
+            due, i, kind, interval = heapq.heappop(events)
+            wait_until(due)
+            lateness = max(lateness, time.monotonic() - due)
+            self.sender.send((kind,))
+            messages += 1
+            heapq.heappush(events, (due + interval, i, kind, interval))
+        wait_until(slot_end)
+        end_time = time.time()
+        lateness = max(lateness, time.monotonic() - slot_end)
+        return [slot.index, slot.label, slot.label_val, f"{start_time:.6f}", f"{end_time:.6f}", slot.scenario,
+                messages, f"{lateness:.6f}"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a labelled PFCP attack campaign in one process.')
+    parser.add_argument('--scenarios', nargs='+', default=DEFAULT_SCENARIOS,
+                        help=f"Attack scenarios to choose from, '+' joins scenarios run together "
+                             f"(available: {', '.join(name for name in SCENARIOS if name != 'normal')})")
+    parser.add_argument('--total-duration', type=float, default=10800, help='Campaign length in seconds (default: 10800)')
+    parser.add_argument('--slot-duration', type=float, default=39, help='Seconds per slot (default: 39)')
+    parser.add_argument('--gap', type=float, default=1, help='Pause between slots in seconds (default: 1)')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed of the slot plan')
+    parser.add_argument('--log', default='attack_logs.csv', help='Slot log (default: attack_logs.csv)')
+    parser.add_argument('--smf', default=PFCP_CP_IP_V4, help=f'SMF address the requests come from (default: {PFCP_CP_IP_V4})')
+    parser.add_argument('--upf', default=PFCP_UP_IP_V4, help=f'UPF address (default: {PFCP_UP_IP_V4})')
+    parser.add_argument('--port', type=int, default=PFCP_PORT, help=f'PFCP port (default: {PFCP_PORT})')
+    parser.add_argument('--bind', action='store_true',
+                        help='Send from a UDP socket bound to --smf instead of spoofing it through a raw socket')
+    parser.add_argument('--keep-seids', action='store_true',
+                        help='Continue guessed SEIDs across slots instead of starting each slot at 1')
+    parser.add_argument('--full-establishment', action='store_true',
+                        help='Send establishments with Node ID, F-SEID, PDR and FAR instead of the empty body of '
+                             'pfcp_establishment.py')
+    parser.add_argument('--dry-run', action='store_true', help='Print the slot plan and exit')
+    args = parser.parse_args()
+    for name in args.scenarios:
+        for part in name.split('+'):
+            if part not in SCENARIOS:
+                parser.error(f"Unknown scenario {part}")
+
+    slots = plan_campaign(args.scenarios, args.total_duration, args.slot_duration, args.gap, args.seed)
+    if args.dry_run:
+        for slot in slots:
+            print(f"{slot.index}\t{slot.offset:.0f}\t{slot.scenario}\t{slot.label}\t{slot.label_val}")
+        return
+    sender = SimulatedSmf(args.smf, args.upf, args.port, spoof=not args.bind,
+                          full_establishment=args.full_establishment)
+    try:
+        AttackScheduler(sender, slots, args.slot_duration, args.log, not args.keep_seids).run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sender.close()
+
+
+if __name__ == "__main__":
+    main()
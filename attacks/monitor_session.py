@@ -1,6 +1,11 @@
-from scapy.all import sniff, wrpcap, get_if_list
+from scapy.all import AsyncSniffer, conf, get_if_list
+from scapy.utils import PcapWriter
+from collections import deque
+import argparse
+import os
+import struct
 import time
-from threading import Thread
+from threading import Lock, Thread, Event
 
 # Definiowanie adresów IP do filtrowania
 IP1 = "10.0.14.45" #N4 UPF
@@ -11,32 +16,163 @@ iface = "br-8a599ea23a63"  #N4 int
 #iface = "br-a06450588026" #N3 int
 #iface = "br-639f93cf89a0" #N9 int
 
-# Sprawdzenie dostępnych interfejsów
-print("Dostępne interfejsy:", get_if_list())
-
-# Funkcja do zapisywania pakietów do pliku
-def save_packets(packets, filename):
-    wrpcap(filename, packets)
-
-# Funkcja do przechwytywania pakietów
-def capture_packets():
-    print("Rozpoczynanie przechwytywania na interfejsie:", iface)
-    packets = sniff(iface=iface, filter=f"host {IP1}", timeout=capture_duration)
-    print(f"Przechwycono {len(packets)} pakietów")
-    return packets
-
-def periodic_capture():
-    while True:
-        filename = f"captured_packets_{int(time.time())}.pcap"
-        packets = capture_packets()
-        if packets:
-            save_packets(packets, filename)
-            print(f"Saved {len(packets)} packets to {filename}")
-        else:
-            print("Brak przechwyconych pakietów")
-        time.sleep(1)
+# Stałe z linux/if_packet.h do odczytu liczników gniazda AF_PACKET
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+
+
+class RotatingPcapWriter:
+    # Zapisuje pakiety na bieżąco, rekord po rekordzie, i zmienia plik po upływie czasu lub rozmiaru.
+    # Plik w trakcie zapisu ma rozszerzenie .pcap.part, więc konwerter nie weźmie niedokończonego pliku.
+    def __init__(self, out_dir, prefix, rotate_seconds=capture_duration, rotate_bytes=None, ring_size=None):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.rotate_seconds = rotate_seconds
+        self.rotate_bytes = rotate_bytes
+        self.ring_size = ring_size
+        self.lock = Lock()
+        self.files = deque()
+        self.writer = None
+        self.path = None
+        self.opened_at = None
+        self.bytes = 0
+        self.packets = 0
+
+    def _open(self):
+        self.opened_at = time.time()
+        self.path = os.path.join(self.out_dir, f"{self.prefix}_{int(self.opened_at)}.pcap")
+        # Przy rotacji po rozmiarze kilka plików może powstać w tej samej sekundzie
+        n = 1
+        while os.path.exists(self.path) or self.path in self.files:
+            self.path = os.path.join(self.out_dir, f"{self.prefix}_{int(self.opened_at)}_{n}.pcap")
+            n += 1
+        self.writer = PcapWriter(self.path + '.part', sync=False)
+        self.bytes = 24
+        self.packets = 0
+
+    def _close(self):
+        self.writer.close()
+        os.replace(self.path + '.part', self.path)
+        print(f"Saved {self.packets} packets to {self.path}")
+        self.files.append(self.path)
+        self.writer = None
+        # Bufor cykliczny: zostawiamy tylko ostatnie ring_size plików
+        while self.ring_size and len(self.files) > self.ring_size:
+            os.remove(self.files.popleft())
+
+    def _due(self):
+        if time.time() - self.opened_at >= self.rotate_seconds:
+            return True
+        return self.rotate_bytes is not None and self.bytes >= self.rotate_bytes
+
+    def write(self, packet):
+        with self.lock:
+            # Nowy plik otwierany jest przy pierwszym pakiecie po rotacji, więc między plikami nie ma przerwy
+            if self.writer is None:
+                self._open()
+            self.writer.write(packet)
+            self.bytes += 16 + len(packet)
+            self.packets += 1
+            if self._due():
+                self._close()
+
+    def tick(self):
+        # Rotacja po czasie także wtedy, gdy nie przychodzą żadne pakiety
+        with self.lock:
+            if self.writer is not None and self._due():
+                self._close()
+
+    def close(self):
+        with self.lock:
+            if self.writer is not None:
+                self._close()
+
+
+class InterfaceCapture:
+    def __init__(self, iface, bpf_filter, writer):
+        self.iface = iface
+        self.writer = writer
+        self.kernel_packets = 0
+        self.kernel_drops = 0
+        self.socket = conf.L2listen(iface=iface, filter=bpf_filter)
+        # store=False: pakiety nie są trzymane w pamięci, tylko od razu zapisywane
+        self.sniffer = AsyncSniffer(opened_socket=self.socket, prn=writer.write, store=False)
+
+    def update_counters(self):
+        # PACKET_STATISTICS zwraca liczniki od ostatniego odczytu (tylko Linux)
+        try:
+            raw = self.socket.ins.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8)
+        except (AttributeError, OSError):
+            return
+        packets, drops = struct.unpack('II', raw)
+        self.kernel_packets += packets
+        self.kernel_drops += drops
+
+    def start(self):
+        print("Rozpoczynanie przechwytywania na interfejsie:", self.iface)
+        self.sniffer.start()
+
+    def stop(self):
+        self.sniffer.stop()
+        self.writer.close()
+
+
+def monitor(captures, stop_event, stats_interval):
+    last_stats = time.time()
+    while not stop_event.wait(1):
+        for capture in captures:
+            capture.writer.tick()
+        if time.time() - last_stats >= stats_interval:
+            last_stats = time.time()
+            for capture in captures:
+                capture.update_counters()
+                print(f"{capture.iface}: kernel packets={capture.kernel_packets} drops={capture.kernel_drops} "
+                      f"written to current file={capture.writer.packets}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Continuous capture to rotating pcap files.')
+    parser.add_argument('--iface', action='append', default=None,
+                        help=f'Interface to capture on, can be given several times (default: {iface})')
+    parser.add_argument('--filter', default=f"host {IP1}", help=f'BPF filter (default: "host {IP1}")')
+    parser.add_argument('--out-dir', default='.', help='Directory for the capture files (default: .)')
+    parser.add_argument('--rotate-seconds', type=int, default=capture_duration,
+                        help=f'Start a new file after this many seconds (default: {capture_duration})')
+    parser.add_argument('--rotate-mb', type=int, default=None, help='Start a new file after this many MB')
+    parser.add_argument('--ring', type=int, default=None, help='Keep only the last N files per interface')
+    parser.add_argument('--stats-interval', type=int, default=60,
+                        help='Seconds between drop counter reports (default: 60)')
+    args = parser.parse_args()
+
+    # Sprawdzenie dostępnych interfejsów
+    print("Dostępne interfejsy:", get_if_list())
+
+    ifaces = args.iface or [iface]
+    rotate_bytes = args.rotate_mb * 1024 * 1024 if args.rotate_mb else None
+    captures = []
+    for name in ifaces:
+        # Przy kilku interfejsach nazwa pliku zawiera interfejs
+        prefix = "captured_packets" if len(ifaces) == 1 else f"captured_packets_{name}"
+        writer = RotatingPcapWriter(args.out_dir, prefix, args.rotate_seconds, rotate_bytes, args.ring)
+        captures.append(InterfaceCapture(name, args.filter, writer))
+
+    stop_event = Event()
+    monitor_thread = Thread(target=monitor, args=(captures, stop_event, args.stats_interval), daemon=True)
+    for capture in captures:
+        capture.start()
+    monitor_thread.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        for capture in captures:
+            capture.stop()
+            capture.update_counters()
+            print(f"{capture.iface}: kernel packets={capture.kernel_packets} drops={capture.kernel_drops}")
+
 
 if __name__ == "__main__":
-    # Uruchamianie przechwytywania pakietów w osobnym wątku
-    capture_thread = Thread(target=periodic_capture)
-    capture_thread.start()
+    main()
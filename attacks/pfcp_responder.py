@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+import os
+import random
+import socket
+import struct
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pfcp_decoder import CAUSE_REQUEST_ACCEPTED, IE_CAUSE, IE_F_SEID, PFCP_PORT, f_seid, find_ie, parse_pfcp, \
+    pfcp_msg_type_map  # noqa: E402
+
+# Further information elements written in responses (3GPP TS 29.244)
+IE_NODE_ID = 60
+IE_RECOVERY_TIME_STAMP = 96
+
+CAUSE_SESSION_CONTEXT_NOT_FOUND = 65
+CAUSE_MANDATORY_IE_MISSING = 66
+CAUSE_NO_ESTABLISHED_ASSOCIATION = 72
+CAUSE_NO_RESOURCES_AVAILABLE = 75
+
+HEARTBEAT_REQUEST = 1
+ASSOCIATION_SETUP_REQUEST = 5
+ASSOCIATION_UPDATE_REQUEST = 7
+ASSOCIATION_RELEASE_REQUEST = 9
+VERSION_NOT_SUPPORTED_RESPONSE = 11
+SESSION_SET_DELETION_REQUEST = 14
+SESSION_ESTABLISHMENT_REQUEST = 50
+SESSION_MODIFICATION_REQUEST = 52
+SESSION_DELETION_REQUEST = 54
+NODE_MESSAGES = (HEARTBEAT_REQUEST, ASSOCIATION_SETUP_REQUEST, ASSOCIATION_UPDATE_REQUEST,
+                 ASSOCIATION_RELEASE_REQUEST, SESSION_SET_DELETION_REQUEST)
+
+NTP_OFFSET = 2208988800
+
+
+def ie(ie_type, value):
+    return struct.pack('!HH', ie_type, len(value)) + value
+
+
+def node_message(msg_type, seq, ies):
+    body = b''.join(ies)
+    return struct.pack('!BBH', 0x20, msg_type, len(body) + 4) + seq.to_bytes(3, 'big') + b'\x00' + body
+
+
+def session_message(msg_type, seid, seq, ies):
+    body = b''.join(ies)
+    return struct.pack('!BBHQ', 0x21, msg_type, len(body) + 12, seid) + seq.to_bytes(3, 'big') + b'\x00' + body
+
+
+class UpfState:
+    # PFCP side of a UPF: associations and sessions, answering each request with the response a UPF would send
+    def __init__(self, node_ip, max_sessions=1_000_000, require_association=False):
+        address = socket.inet_aton(node_ip)
+        self.node_id = ie(IE_NODE_ID, b'\x00' + address)
+        self.address = address
+        self.recovery = ie(IE_RECOVERY_TIME_STAMP, struct.pack('!I', (int(time.time()) + NTP_OFFSET) & 0xFFFFFFFF))
+        self.causes = {value: ie(IE_CAUSE, bytes([value])) for value in (
+            CAUSE_REQUEST_ACCEPTED, CAUSE_SESSION_CONTEXT_NOT_FOUND, CAUSE_MANDATORY_IE_MISSING,
+            CAUSE_NO_ESTABLISHED_ASSOCIATION, CAUSE_NO_RESOURCES_AVAILABLE)}
+        self.max_sessions = max_sessions
+        self.require_association = require_association
+        self.associations = set()
+        # UP SEID -> (SMF address, CP SEID)
+        self.sessions = {}
+        self.next_seid = 1
+        self.requests = Counter()
+        self.responses = Counter()
+        self.ignored = 0
+
+    def handle(self, data, peer):
+        # Responses to all PFCP messages of one datagram
+        responses = []
+        for message in parse_pfcp(data, 0, len(data)):
+            if message.version != 1:
+                responses.append(node_message(VERSION_NOT_SUPPORTED_RESPONSE, message.seq, []))
+                self.responses['version_not_supported'] += 1
+                continue
+            if message.msg_type in NODE_MESSAGES:
+                response, cause = self.node_request(message, peer)
+            elif message.msg_type in (SESSION_ESTABLISHMENT_REQUEST, SESSION_MODIFICATION_REQUEST,
+                                      SESSION_DELETION_REQUEST) and message.s_flag:
+                response, cause = self.session_request(data, message, peer)
+            else:
+                # Responses and requests this UPF does not serve
+                self.ignored += 1
+                continue
+            self.requests[pfcp_msg_type_map[message.msg_type]] += 1
+            self.responses[cause] += 1
+            responses.append(response)
+        return responses
+
+    def node_request(self, message, peer):
+        msg_type, seq = message.msg_type, message.seq
+        accepted = self.causes[CAUSE_REQUEST_ACCEPTED]
+        if msg_type == HEARTBEAT_REQUEST:
+            return node_message(msg_type + 1, seq, [self.recovery]), CAUSE_REQUEST_ACCEPTED
+        if msg_type == ASSOCIATION_SETUP_REQUEST:
+            self.associations.add(peer)
+            return node_message(msg_type + 1, seq, [self.node_id, accepted, self.recovery]), CAUSE_REQUEST_ACCEPTED
+        if msg_type == ASSOCIATION_RELEASE_REQUEST:
+            self.associations.discard(peer)
+            self.sessions = {seid: session for seid, session in self.sessions.items() if session[0] != peer}
+        elif msg_type == SESSION_SET_DELETION_REQUEST:
+            self.sessions = {seid: session for seid, session in self.sessions.items() if session[0] != peer}
+        elif peer not in self.associations and self.require_association:
+            cause = CAUSE_NO_ESTABLISHED_ASSOCIATION
+            return node_message(msg_type + 1, seq, [self.node_id, self.causes[cause]]), cause
+        return node_message(msg_type + 1, seq, [self.node_id, accepted]), CAUSE_REQUEST_ACCEPTED
+
+    def session_request(self, data, message, peer):
+        msg_type, seq = message.msg_type, message.seq
+        if msg_type == SESSION_ESTABLISHMENT_REQUEST:
+            cp_seid = f_seid(data, message)
+            if cp_seid is None or find_ie(data, message, IE_NODE_ID) is None:
+                cause = CAUSE_MANDATORY_IE_MISSING
+            elif self.require_association and peer not in self.associations:
+                cause = CAUSE_NO_ESTABLISHED_ASSOCIATION
+            elif len(self.sessions) >= self.max_sessions:
+                cause = CAUSE_NO_RESOURCES_AVAILABLE
+            else:
+                seid = self.next_seid
+                self.next_seid += 1
+                self.sessions[seid] = (peer, cp_seid)
+                up_f_seid = ie(IE_F_SEID, b'\x02' + struct.pack('!Q', seid) + self.address)
+                return session_message(msg_type + 1, cp_seid, seq,
+                                       [self.node_id, self.causes[CAUSE_REQUEST_ACCEPTED], up_f_seid]), \
+                    CAUSE_REQUEST_ACCEPTED
+            return session_message(msg_type + 1, cp_seid or 0, seq, [self.node_id, self.causes[cause]]), cause
+        session = self.sessions.get(message.seid)
+        if session is None:
+            # Unknown SEID: the response carries SEID 0 (TS 29.244, 7.2.2.4.2)
+            cause = CAUSE_SESSION_CONTEXT_NOT_FOUND
+            return session_message(msg_type + 1, 0, seq, [self.causes[cause]]), cause
+        if msg_type == SESSION_DELETION_REQUEST:
+            del self.sessions[message.seid]
+        return session_message(msg_type + 1, session[1], seq, [self.causes[CAUSE_REQUEST_ACCEPTED]]), \
+            CAUSE_REQUEST_ACCEPTED
+
+
+class PfcpResponderProtocol(asyncio.DatagramProtocol):
+    def __init__(self, state, delay=0.0, jitter=0.0):
+        self.state = state
+        self.delay = delay
+        self.jitter = jitter
+        self.transport = None
+        self.loop = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+
+    def datagram_received(self, data, addr):
+        responses = self.state.handle(data, addr[0])
+        if not responses:
+            return
+        delay = self.delay + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        for response in responses:
+            if delay > 0:
+                # Processing delay without a task per request: the reply is scheduled on the event loop
+                self.loop.call_later(delay, self.transport.sendto, response, addr)
+            else:
+                self.transport.sendto(response, addr)
+
+
+def print_stats(state, elapsed):
+    total = sum(state.requests.values())
+    causes = ', '.join(f"{cause}: {n}" for cause, n in sorted(state.responses.items(), key=str))
+    print(f"{elapsed:.0f} s: {total} requests ({total / elapsed if elapsed else 0:,.0f}/s), "
+          f"{len(state.sessions)} sessions, {len(state.associations)} associations, causes {{{causes}}}, "
+          f"ignored {state.ignored}")
+
+
+async def serve(host, port, state, delay=0.0, jitter=0.0, duration=None, stats_interval=10.0):
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(lambda: PfcpResponderProtocol(state, delay, jitter),
+                                                       local_addr=(host, port))
+    sock = transport.get_extra_info('socket')
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    print(f"PFCP responder on {host}:{port}")
+    start = time.monotonic()
+    try:
+        while duration is None or time.monotonic() - start < duration:
+            wait = stats_interval if duration is None else min(stats_interval, duration - (time.monotonic() - start))
+            await asyncio.sleep(max(wait, 0))
+            print_stats(state, time.monotonic() - start)
+    finally:
+        transport.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Answer PFCP requests like a UPF, e.g. on loopback for benchmarks.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=PFCP_PORT, help=f'UDP port (default: {PFCP_PORT})')
+    parser.add_argument('--node-ip', default=None, help='Node ID and F-SEID address in responses (default: --host)')
+    parser.add_argument('--delay', type=float, default=0.0, help='Processing delay per request in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra delay of up to this many seconds')
+    parser.add_argument('--max-sessions', type=int, default=1_000_000,
+                        help='Sessions kept before establishments are rejected with cause 75 (default: 1000000)')
+    parser.add_argument('--require-association', action='store_true',
+                        help='Reject session and node requests from SMFs without a PFCP association (cause 72)')
+    parser.add_argument('--duration', type=float, default=None, help='Stop after this many seconds')
+    parser.add_argument('--stats-interval', type=float, default=10.0, help='Seconds between statistics lines')
+    args = parser.parse_args()
+
+    state = UpfState(args.node_ip or args.host, args.max_sessions, args.require_association)
+    try:
+        asyncio.run(serve(args.host, args.port, state, args.delay, args.jitter, args.duration, args.stats_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
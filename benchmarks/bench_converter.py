@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_capture import FORMATS, CaptureGenerator, format_size, parse_size, write_capture
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CONVERTER = os.path.join(ROOT, 'PfcpFlowMeter.py')
+STAGES = ('decode', 'window', 'label', 'write')
+# Metrics compared against the baseline: (name, True if higher is better)
+COMPARED = (('frames_per_second', True), ('peak_rss_bytes', False))
+
+
+def prepare_capture(directory, size, seed, fmt='pcap'):
+    # Generated once per size, seed and format and kept in directory, with the generator stats next to it
+    capture_directory = os.path.join(directory, f'synthetic_{format_size(size)}_seed{seed}_{fmt}')
+    stats_file = os.path.join(capture_directory, 'capture.json')
+    if os.path.exists(stats_file):
+        with open(stats_file) as file:
+            return capture_directory, json.load(file)
+    os.makedirs(capture_directory, exist_ok=True)
+    start = time.perf_counter()
+    stats = write_capture(os.path.join(capture_directory, f'capture.{fmt}'), CaptureGenerator(seed=seed), size=size)
+    print(f"generated {format_size(stats['bytes'])} capture in {time.perf_counter() - start:.1f} s")
+    with open(stats_file, 'w') as file:
+        json.dump(stats, file, indent=2)
+    return capture_directory, stats
+
+
+def run_converter(capture_directory, interval, workers, extra_args=()):
+    # Runs PfcpFlowMeter.py in its own process, so peak RSS (wait4 includes the --split workers) and
+    # CPU time belong to this case only
+    with tempfile.TemporaryDirectory() as output_directory:
+        report_file = os.path.join(output_directory, 'report.json')
+        command = [sys.executable, CONVERTER, capture_directory, os.path.join(output_directory, 'out'),
+                   '--interval', str(interval), '--split', str(workers), '--report', report_file, *extra_args]
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode:
+            raise RuntimeError(f"{' '.join(command)} exited with {process.returncode}")
+        with open(report_file) as file:
+            report = json.load(file)
+    return wall, usage, report
+
+
+def measure(capture_directory, capture, interval, workers, repeat, extra_args=()):
+    # Best of repeat runs for time, largest peak RSS of all runs
+    best = None
+    peak_rss = 0
+    for _ in range(repeat):
+        wall, usage, report = run_converter(capture_directory, interval, workers, extra_args)
+        peak_rss = max(peak_rss, usage.ru_maxrss * 1024)
+        if best is None or wall < best[0]:
+            best = wall, usage, report
+    wall, usage, report = best
+    stages = report['totals']['stages']
+    frames = stages['decode']['rows_in']
+    result = {
+        'bytes': capture['bytes'],
+        'frames': frames,
+        'messages': stages['decode']['rows_out'],
+        'wall_seconds': round(wall, 4),
+        'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 4),
+        'frames_per_second': round(frames / wall, 1),
+        'mib_per_second': round(capture['bytes'] / wall / 2 ** 20, 2),
+        'peak_rss_bytes': peak_rss,
+        'stage_seconds': {name: stages[name]['wall_seconds'] for name in STAGES if name in stages},
+        'drops': report['totals']['drops'],
+    }
+    # A decoder change that loses or invents messages is a regression too, whatever its speed
+    if result['messages'] != capture['messages']:
+        result['message_mismatch'] = capture['messages'] - result['messages']
+    return result
+
+
+def machine():
+    try:
+        commit = subprocess.run(['git', '-C', ROOT, 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count(),
+            'commit': commit}
+
+
+def compare(results, baseline, tolerance, rss_tolerance):
+    # Lists (case, metric, baseline, current, change) of cases present in both, and whether any regressed
+    rows = []
+    regressed = False
+    for case, current in results.items():
+        before = baseline.get(case)
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED:
+            change = current[metric] / before[metric] - 1 if before[metric] else 0.0
+            limit = tolerance if higher_is_better else rss_tolerance
+            bad = -change > limit if higher_is_better else change > limit
+            regressed |= bad
+            rows.append((case, metric, before[metric], current[metric], change, bad))
+        if 'message_mismatch' in current:
+            regressed = True
+            rows.append((case, 'messages', before['messages'], current['messages'], 0.0, True))
+    return rows, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PfcpFlowMeter.py on synthetic captures and '
+                                                 'compare with a stored baseline.')
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[parse_size('20M'), parse_size('100M')],
+                        help='Capture sizes, e.g. 100M 2G (default: 20M 100M)')
+    parser.add_argument('--intervals', type=int, nargs='+', default=[60, 120], help='Window intervals (default: 60 120)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2],
+                        help='Worker processes per capture, passed as --split (default: 1 2)')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per case, the fastest is kept (default: 1)')
+    parser.add_argument('--converter-args', nargs=argparse.REMAINDER, default=[],
+                        help='Further PfcpFlowMeter.py options for every case, e.g. --features sessions latency')
+    parser.add_argument('--data-directory', default=os.path.join(tempfile.gettempdir(), 'pfcp_bench_captures'),
+                        help='Where generated captures are kept between runs')
+    parser.add_argument('--seed', type=int, default=42, help='Generator seed (default: 42)')
+    parser.add_argument('--capture-format', choices=FORMATS, default='pcap', help='Capture format (default: pcap)')
+    parser.add_argument('--baseline', default=None, help='Baseline JSON to compare with')
+    parser.add_argument('--update-baseline', action='store_true', help='Write the results to --baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Allowed drop in frames per second before a case counts as a regression (default: 0.15)')
+    parser.add_argument('--rss-tolerance', type=float, default=0.25,
+                        help='Allowed growth of peak RSS before a case counts as a regression (default: 0.25)')
+    parser.add_argument('--output', default=None, help='Also write the results to this JSON file')
+    args = parser.parse_args()
+    if args.update_baseline and not args.baseline:
+        parser.error('--update-baseline needs --baseline')
+
+    results = {}
+    print(f"{'case':>18} {'frames/s':>10} {'MiB/s':>7} {'wall s':>7} {'cpu s':>7} {'RSS MiB':>8} "
+          + ' '.join(f'{name:>7}' for name in STAGES))
+    for size in args.sizes:
+        capture_directory, capture = prepare_capture(args.data_directory, size, args.seed, args.capture_format)
+        for interval in args.intervals:
+            for workers in args.workers:
+                case = f'{format_size(size)}/{interval}s/{workers}w'
+                result = measure(capture_directory, capture, interval, workers, args.repeat, args.converter_args)
+                results[case] = result
+                print(f"{case:>18} {result['frames_per_second']:>10,.0f} {result['mib_per_second']:>7.2f} "
+                      f"{result['wall_seconds']:>7.2f} {result['cpu_seconds']:>7.2f} "
+                      f"{result['peak_rss_bytes'] / 2 ** 20:>8.1f} "
+                      + ' '.join(f"{result['stage_seconds'].get(name, 0):>7.2f}" for name in STAGES))
+                if 'message_mismatch' in result:
+                    print(f"{case:>18} decoded {result['messages']} of {capture['messages']} generated messages")
+
+    document = {'machine': machine(), 'converter_args': args.converter_args, 'seed': args.seed,
+                'capture_format': args.capture_format, 'cases': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(document, file, indent=2)
+
+    regressed = False
+    if args.baseline and os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline['machine']['platform'] != document['machine']['platform'] \
+                or baseline['machine']['cpus'] != document['machine']['cpus']:
+            print(f"baseline was recorded on {baseline['machine']['platform']} with "
+                  f"{baseline['machine']['cpus']} CPUs, timings may not be comparable")
+        if baseline.get('converter_args', []) != args.converter_args or baseline.get('seed') != args.seed \
+                or baseline.get('capture_format', 'pcap') != args.capture_format:
+            print("baseline was recorded with other converter options, seed or capture format")
+        rows, regressed = compare(results, baseline['cases'], args.tolerance, args.rss_tolerance)
+        print(f"\ncompared with {args.baseline} (commit {baseline['machine'].get('commit')}):")
+        for case, metric, before, current, change, bad in rows:
+            print(f"{case:>18} {metric:>18} {before:>14,.0f} -> {current:>14,.0f} {change:>+8.1%}"
+                  f"{'  REGRESSION' if bad else ''}")
+    elif args.baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(document, file, indent=2)
+        print(f"baseline written to {args.baseline}")
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
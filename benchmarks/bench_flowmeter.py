@@ -0,0 +1,102 @@
+import argparse
+import os
+import struct
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from FlowMeter import FlowMeter, TCP_ACK, TCP_FIN, TCP_PSH, TCP_RST, TCP_SYN  # noqa: E402
+from pcap_reader import LINKTYPE_ETHERNET  # noqa: E402
+
+
+def ethernet(src, dst, proto, l4):
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(l4), 0, 0, 64, proto, 0, src, dst)
+    return b'\x00' * 12 + b'\x08\x00' + ip + l4
+
+
+def tcp(src, dst, sport, dport, flags, payload=b''):
+    return ethernet(src, dst, 6, struct.pack('!HHIIBBHHH', sport, dport, 0, 0, 5 << 4, flags, 65535, 0, 0) + payload)
+
+
+def udp(src, dst, sport, dport, payload):
+    return ethernet(src, dst, 17, struct.pack('!HHHH', sport, dport, 8 + len(payload), 0) + payload)
+
+
+def synthetic_packets(packets, scan_share, seed=42):
+    # Mix of complete TCP connections, UDP request/response pairs (GTP-U like N3/N9 traffic)
+    # and a port scan that opens a new flow with every packet
+    rng = np.random.default_rng(seed)
+    clients = [bytes([10, 45, 0, i]) for i in range(1, 200)]
+    server = bytes([10, 0, 14, 45])
+    scanner = bytes([10, 66, 6, 6])
+    payload = b'x' * 512
+    out = []
+    ts = 1_000_000.0
+    scan_port = 0
+    while len(out) < packets:
+        ts += rng.exponential(1e-4)
+        r = rng.random()
+        if r < scan_share:
+            scan_port = scan_port % 65535 + 1
+            out.append((ts, tcp(scanner, server, 40000, scan_port, TCP_SYN)))
+            # Filtered ports never answer, so those flows only leave the table by timeout or eviction
+            if rng.random() < 0.5:
+                out.append((ts + 1e-5, tcp(server, scanner, scan_port, 40000, TCP_RST | TCP_ACK)))
+        elif r < scan_share + (1 - scan_share) / 2:
+            client = clients[rng.integers(len(clients))]
+            port = int(rng.integers(1024, 65535))
+            conversation = [(client, server, TCP_SYN, b''), (server, client, TCP_SYN | TCP_ACK, b''),
+                            (client, server, TCP_ACK, b''), (client, server, TCP_PSH | TCP_ACK, payload),
+                            (server, client, TCP_PSH | TCP_ACK, payload * 2), (client, server, TCP_FIN | TCP_ACK, b''),
+                            (server, client, TCP_FIN | TCP_ACK, b''), (client, server, TCP_ACK, b'')]
+            for i, (src, dst, flags, data) in enumerate(conversation):
+                sport, dport = (port, 443) if src == client else (443, port)
+                out.append((ts + i * 1e-3, tcp(src, dst, sport, dport, flags, data)))
+        else:
+            client = clients[rng.integers(len(clients))]
+            out.append((ts, udp(client, server, 2152, 2152, payload)))
+            out.append((ts + 2e-4, udp(server, client, 2152, 2152, payload[:100])))
+    out.sort(key=lambda packet: packet[0])
+    return out[:packets]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure FlowMeter throughput and flow table size.')
+    parser.add_argument('--packets', type=int, default=1_000_000, help='Number of packets (default: 1000000)')
+    parser.add_argument('--scan-share', type=float, default=0.3,
+                        help='Share of generated events that are port scan probes (default: 0.3)')
+    parser.add_argument('--max-flows', type=int, default=500_000, help='Flow table limit (default: 500000)')
+    parser.add_argument('--memory', action='store_true', help='Also trace peak memory (slower)')
+    args = parser.parse_args()
+
+    packets = synthetic_packets(args.packets, args.scan_share)
+    exported = [0]
+
+    def export(df):
+        exported[0] += len(df)
+
+    meter = FlowMeter(max_flows=args.max_flows, export=export)
+    largest = 0
+    if args.memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for i, (timestamp, data) in enumerate(packets):
+        meter.process(timestamp, LINKTYPE_ETHERNET, data)
+        if not i & 0xfff:
+            largest = max(largest, len(meter))
+    meter.close()
+    seconds = time.perf_counter() - start
+    print(f"{len(packets)} packets in {seconds:.2f} s ({len(packets) / seconds:,.0f} packets/s)")
+    print(f"flows exported: {exported[0]}, largest table: {largest}, evicted at max flows: {meter.stats['evicted']}, "
+          f"closed by FIN: {meter.stats['fin']}, by RST: {meter.stats['rst']}, idle: {meter.stats['idle_timeouts']}")
+    if args.memory:
+        _, peak = tracemalloc.get_traced_memory()
+        print(f"peak traced memory: {peak / 2 ** 20:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models'))
+
+from inference import export_artifact, load_artifact  # noqa: E402
+
+BATCH_SIZES = (1, 10, 100, 1000, 10_000, 100_000)
+
+
+def synthetic_windows(rows, features, attack_share, seed=42):
+    # Benign rows around one mean, attack classes 1..3 shifted along different features
+    rng = np.random.default_rng(seed)
+    y = np.where(rng.random(rows) < attack_share, rng.integers(1, 4, rows), 0)
+    X = rng.normal(size=(rows, features))
+    X[np.arange(rows), y] += 3 * (y > 0)
+    return X, y
+
+
+def measure(predict, X, batch_size, seconds=2.0, min_calls=5):
+    # Rows per second and per-call latency percentiles of predict() on consecutive batches of X,
+    # called for at least `seconds` and min_calls times
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < min_calls or time.perf_counter() - start < seconds:
+        offset = (len(latencies) * batch_size) % max(len(X) - batch_size + 1, 1)
+        batch = X[offset:offset + batch_size]
+        t = time.perf_counter()
+        predict(batch)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return len(latencies) * batch_size / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure batched two-stage inference throughput and latency.')
+    parser.add_argument('--artifact', default=None, help='Model artifact to load (default: train a synthetic one)')
+    parser.add_argument('--rows', type=int, default=100_000, help='Rows of synthetic input (default: 100000)')
+    parser.add_argument('--features', type=int, default=20, help='Synthetic feature count (default: 20)')
+    parser.add_argument('--attack-share', type=float, default=0.2,
+                        help='Share of attack rows, which go through the second stage (default: 0.2)')
+    parser.add_argument('--trees', type=int, default=100, help='Random forest size of the synthetic model')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(BATCH_SIZES))
+    parser.add_argument('--seconds', type=float, default=2.0, help='Time spent per measurement (default: 2)')
+    parser.add_argument('--sklearn', action='store_true', help='Also measure the sklearn estimators')
+    args = parser.parse_args()
+
+    X, y = synthetic_windows(args.rows, args.features, args.attack_share)
+    estimators = None
+    if args.artifact:
+        model = load_artifact(args.artifact)
+        X, _ = synthetic_windows(args.rows, len(model.columns), args.attack_share)
+    else:
+        from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+        from sklearn.preprocessing import StandardScaler
+        train = min(len(X), 20_000)
+        scaler = StandardScaler().fit(X[:train])
+        Xs = scaler.transform(X[:train])
+        binary = RandomForestClassifier(n_estimators=args.trees, max_depth=20, min_samples_split=5,
+                                        random_state=42).fit(Xs, y[:train])
+        flagged = binary.predict(Xs) != 0
+        multiclass = GradientBoostingClassifier(n_estimators=100).fit(Xs[flagged], y[:train][flagged])
+        estimators = scaler, binary, multiclass
+        with tempfile.TemporaryDirectory() as directory:
+            path = export_artifact(os.path.join(directory, 'model.npz'),
+                                   [f'f{i}' for i in range(args.features)], binary, multiclass, scaler)
+            print(f"artifact: {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+            model = load_artifact(path)
+
+    def sklearn_predict(batch):
+        scaler, binary, multiclass = estimators
+        batch = scaler.transform(batch)
+        predictions = binary.predict(batch)
+        flagged = predictions != 0
+        if flagged.any():
+            predictions[flagged] = multiclass.predict(batch[flagged])
+        return predictions
+
+    print(f"{'batch':>7} {'engine':>8} {'rows/s':>12} {'p50 ms':>9} {'p99 ms':>9}")
+    for batch_size in args.batch_sizes:
+        engines = [('numpy', model.predict)]
+        if args.sklearn and estimators is not None:
+            engines.append(('sklearn', sklearn_predict))
+        for name, predict in engines:
+            rate, p50, p99 = measure(predict, X, batch_size, args.seconds)
+            print(f"{batch_size:>7} {name:>8} {rate:>12,.0f} {p50:>9.3f} {p99:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
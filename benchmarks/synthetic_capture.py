@@ -0,0 +1,384 @@
+import argparse
+import csv
+import heapq
+import os
+import random
+import struct
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pcap_reader import LINKTYPE_ETHERNET, PCAP_MAGIC_US, PCAPNG_BYTE_ORDER_MAGIC, PCAPNG_EPB, PCAPNG_IDB, \
+    PCAPNG_SHB  # noqa: E402
+from pfcp_decoder import CAUSE_REQUEST_ACCEPTED, IE_CAUSE, IE_F_SEID, PFCP_PORT  # noqa: E402
+
+# Addresses of the lab setup used by the attack scripts
+UPF_IP = '10.0.14.45'
+SMF_NETWORK = '10.0.14.'
+FIRST_SMF = 40
+START_TIME = 1_700_000_000.0
+
+IE_CREATE_PDR = 1
+IE_UPDATE_FAR = 10
+IE_NODE_ID = 60
+IE_RECOVERY_TIME_STAMP = 96
+CAUSE_SESSION_CONTEXT_NOT_FOUND = 65
+
+# Attack slots like attack_random.py: label, label value and the request kind flooded in the slot
+ATTACKS = {
+    'establishment': ('est_att', 3, 'establishment'),
+    'modification_dupl': ('mod_att', 2, 'modification'),
+    'modification_drop': ('mod_att', 2, 'modification'),
+    'deletion': ('del_att', 1, 'deletion'),
+}
+DEFAULT_SCENARIOS = ['establishment', 'modification_dupl', 'deletion']
+LOG_COLUMNS = ['index', 'Label', 'Label_val', 'start_time', 'end_time', 'scenario', 'messages', 'max_lateness']
+# Ways a frame is broken: PFCP cut inside its header, an S flag header shorter than a SEID, UDP cut short
+MALFORMED_KINDS = ('truncated', 'short_header', 'runt')
+FORMATS = ('pcap', 'pcapng')
+# Buffered output is written in chunks of this size
+CHUNK_SIZE = 1 << 22
+
+
+def parse_size(value):
+    # '500M', '20G', '1.5T' or a number of bytes
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    value = value.strip().upper().rstrip('B')
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def format_size(size):
+    for unit in ('B', 'K', 'M', 'G'):
+        if size < 1024 or unit == 'G':
+            return f'{size:.0f}{unit}' if unit == 'B' or size == int(size) else f'{size:.1f}{unit}'
+        size /= 1024
+
+
+def ie(ie_type, value):
+    return struct.pack('!HH', ie_type, len(value)) + value
+
+
+def ipv4(address):
+    return bytes(int(part) for part in address.split('.'))
+
+
+# Information elements that are the same in every message
+CAUSE_ACCEPTED = ie(IE_CAUSE, bytes([CAUSE_REQUEST_ACCEPTED]))
+CAUSE_NOT_FOUND = ie(IE_CAUSE, bytes([CAUSE_SESSION_CONTEXT_NOT_FOUND]))
+CREATE_PDR = ie(IE_CREATE_PDR, bytes(48))
+UPDATE_FAR = ie(IE_UPDATE_FAR, bytes(20))
+PCAP_RECORD = struct.Struct('<IIII')
+
+
+def pfcp(msg_type, seq, body=b'', seid=None, follow_on=False):
+    flags = 0x20 | (0x04 if follow_on else 0)
+    if seid is None:
+        header = seq.to_bytes(3, 'big') + b'\x00'
+    else:
+        flags |= 0x01
+        header = struct.pack('!Q', seid) + seq.to_bytes(3, 'big') + b'\x00'
+    return struct.pack('!BBH', flags, msg_type, len(header) + len(body)) + header + body
+
+
+class CaptureGenerator:
+    # Deterministic PFCP traffic between simulated SMFs and one UPF, yielded as (timestamp, ethernet frame)
+    # in time order. Normal load is heartbeats plus sessions that are established, modified a few times
+    # and deleted; attack slots add a flood of one request kind, with guessed SEIDs for modification and
+    # deletion like the attack scripts. A share of datagrams carries two messages (FO flag) and a share
+    # of frames is broken.
+    def __init__(self, smfs=4, session_rate=20.0, session_lifetime=60.0, modifications=2, heartbeat_interval=10.0,
+                 attack_rate=200.0, scenarios=DEFAULT_SCENARIOS, slot_duration=39.0, gap=1.0, multi_share=0.02,
+                 malformed_share=0.001, response_delay=0.002, start_time=START_TIME, seed=42):
+        self.smfs = [ipv4(f'{SMF_NETWORK}{FIRST_SMF + i}') for i in range(smfs)]
+        self.upf = ipv4(UPF_IP)
+        self.session_rate = session_rate
+        self.session_lifetime = session_lifetime
+        self.modifications = modifications
+        self.heartbeat_interval = heartbeat_interval
+        self.attack_rate = attack_rate
+        self.scenarios = scenarios
+        self.slot_duration = slot_duration
+        self.period = slot_duration + gap
+        self.multi_share = multi_share
+        self.malformed_share = malformed_share
+        self.response_delay = response_delay
+        self.start_time = start_time
+        self.rng = random.Random(seed)
+        self.slot_rng = random.Random(seed + 1)
+        self.slots = []
+        self.stats = Counter()
+        self.messages = Counter()
+        self.seq = 0
+        self.next_cp_seid = 1
+        self.next_up_seid = 1
+        self.headers = {}
+        self.events = []
+        self.order = 0
+
+    def push(self, timestamp, handler, *args):
+        self.order += 1
+        heapq.heappush(self.events, (timestamp, self.order, handler, args))
+
+    def packets(self, stop=None):
+        # Ends before the first event at or after stop, so the stats only cover packets that were yielded
+        rng = self.rng
+        for i, smf in enumerate(self.smfs):
+            self.push(self.start_time + rng.uniform(0, self.heartbeat_interval), self.heartbeat, i)
+        self.push(self.start_time + rng.expovariate(self.session_rate), self.new_session)
+        self.push(self.start_time, self.slot)
+        while stop is None or self.events[0][0] < stop:
+            timestamp, _, handler, args = heapq.heappop(self.events)
+            for frame in handler(timestamp, *args):
+                yield timestamp, frame
+
+    def frame(self, src, dst, payload, msg_types):
+        # Ethernet/IPv4/UDP headers are cached per address pair and payload length. Messages are counted
+        # by type unless the frame is broken, so the counts are what a decoder should find.
+        key = (src, dst, len(payload))
+        header = self.headers.get(key)
+        if header is None:
+            udp_length = 8 + len(payload)
+            header = (b'\x02\x00\x00\x00\x00\x02\x02\x00\x00\x00\x00\x01\x08\x00'
+                      + struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + udp_length, 0, 0x4000, 64, 17, 0, src, dst)
+                      + struct.pack('!HHHH', PFCP_PORT, PFCP_PORT, udp_length, 0))
+            self.headers[key] = header
+        self.stats['frames'] += 1
+        if self.malformed_share and self.rng.random() < self.malformed_share:
+            return self.malformed(header, payload)
+        for msg_type in msg_types:
+            self.messages[msg_type] += 1
+        return header + payload
+
+    def malformed(self, header, payload):
+        kind = self.rng.choice(MALFORMED_KINDS)
+        self.stats[f'malformed_{kind}'] += 1
+        self.stats['malformed'] += 1
+        if kind == 'truncated':
+            return header + payload[:6]
+        if kind == 'short_header':
+            return header + bytes([payload[0] | 0x01, payload[1], 0, 8]) + payload[4:12]
+        # IP total length still covers the UDP header, the frame ends inside it
+        return header[:14 + 20 + 4]
+
+    def next_seq(self):
+        self.seq = (self.seq + 1) & 0xffffff
+        return self.seq
+
+    def request(self, timestamp, smf, messages, responses):
+        # One datagram with the request messages, the responses follow one by one after the UPF's delay
+        payload = b''.join(pfcp(msg_type, seq, body, seid, follow_on=i < len(messages) - 1)
+                           for i, (msg_type, seq, body, seid) in enumerate(messages))
+        if len(messages) > 1:
+            self.stats['multi_message'] += 1
+        delay = timestamp
+        for response in responses:
+            delay += self.rng.expovariate(1 / self.response_delay)
+            self.push(delay, self.response, smf, response)
+        return self.frame(self.smfs[smf], self.upf, payload, [message[0] for message in messages])
+
+    def response(self, timestamp, smf, message):
+        msg_type, seq, body, seid = message
+        yield self.frame(self.upf, self.smfs[smf], pfcp(msg_type, seq, body, seid), (msg_type,))
+
+    def heartbeat(self, timestamp, smf):
+        seq = self.next_seq()
+        recovery = ie(IE_RECOVERY_TIME_STAMP, struct.pack('!I', int(self.start_time) + 2208988800))
+        self.push(timestamp + self.heartbeat_interval, self.heartbeat, smf)
+        yield self.request(timestamp, smf, [(1, seq, recovery, None)], [(2, seq, recovery, None)])
+
+    def establishment(self, timestamp, smf):
+        # Returns the frame and the (CP, UP) SEIDs of the new session
+        cp_seid, up_seid = self.next_cp_seid, self.next_up_seid
+        self.next_cp_seid += 1
+        self.next_up_seid += 1
+        seq = self.next_seq()
+        node = ie(IE_NODE_ID, b'\x00' + self.smfs[smf])
+        body = node + ie(IE_F_SEID, b'\x02' + struct.pack('!Q', cp_seid) + self.smfs[smf]) + CREATE_PDR
+        response = (ie(IE_NODE_ID, b'\x00' + self.upf) + CAUSE_ACCEPTED
+                    + ie(IE_F_SEID, b'\x02' + struct.pack('!Q', up_seid) + self.upf))
+        frame = self.request(timestamp, smf, [(50, seq, body, 0)], [(51, seq, response, cp_seid)])
+        return frame, cp_seid, up_seid
+
+    def session_request(self, timestamp, smf, msg_type, up_seid, cp_seid):
+        # Modification or deletion of a known session, or of a guessed SEID the UPF does not know
+        accepted = cp_seid is not None
+        body = UPDATE_FAR if msg_type == 52 else b''
+        cause = CAUSE_ACCEPTED if accepted else CAUSE_NOT_FOUND
+        messages, responses = [], []
+        for _ in range(2 if self.rng.random() < self.multi_share else 1):
+            seq = self.next_seq()
+            messages.append((msg_type, seq, body, up_seid))
+            responses.append((msg_type + 1, seq, cause, cp_seid if accepted else 0))
+        return self.request(timestamp, smf, messages, responses)
+
+    def new_session(self, timestamp):
+        rng = self.rng
+        smf = rng.randrange(len(self.smfs))
+        frame, cp_seid, up_seid = self.establishment(timestamp, smf)
+        lifetime = rng.expovariate(1 / self.session_lifetime)
+        for _ in range(self.modifications):
+            self.push(timestamp + rng.uniform(0, lifetime), self.session, smf, 52, up_seid, cp_seid)
+        self.push(timestamp + lifetime, self.session, smf, 54, up_seid, cp_seid)
+        self.push(timestamp + rng.expovariate(self.session_rate), self.new_session)
+        yield frame
+
+    def session(self, timestamp, smf, msg_type, up_seid, cp_seid):
+        yield self.session_request(timestamp, smf, msg_type, up_seid, cp_seid)
+
+    def slot(self, timestamp):
+        # Slot plan of attack_random.py: every (len(scenarios) + 1)-th slot is normal, the others a random attack
+        index = len(self.slots)
+        name = 'normal' if index % (len(self.scenarios) + 1) == 0 else self.slot_rng.choice(self.scenarios)
+        label, label_val = ('normal', 0) if name == 'normal' else ATTACKS[name][:2]
+        self.slots.append({'index': index, 'Label': label, 'Label_val': label_val, 'start_time': timestamp,
+                           'end_time': timestamp + self.slot_duration, 'scenario': name, 'messages': 0})
+        self.push(timestamp + self.period, self.slot)
+        if name != 'normal' and self.attack_rate > 0:
+            # Every attack script guessed SEIDs starting at 1
+            self.push(timestamp + self.rng.expovariate(self.attack_rate), self.attack, self.slots[-1], [1])
+        return ()
+
+    def attack(self, timestamp, slot, guess):
+        if timestamp >= slot['end_time']:
+            return
+        kind = ATTACKS[slot['scenario']][2]
+        slot['messages'] += 1
+        self.stats['attack_requests'] += 1
+        self.push(timestamp + self.rng.expovariate(self.attack_rate), self.attack, slot, guess)
+        if kind == 'establishment':
+            yield self.establishment(timestamp, 0)[0]
+        else:
+            guess[0] += 1
+            yield self.session_request(timestamp, 0, 52 if kind == 'modification' else 54, guess[0] - 1, None)
+
+
+class PcapWriter:
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.buffer = []
+        self.buffered = 0
+        self.size = 0
+        self.write_raw(struct.pack('<IHHiIII', PCAP_MAGIC_US, 2, 4, 0, 0, 65535, LINKTYPE_ETHERNET))
+
+    def write_raw(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        self.size += len(data)
+        if self.buffered >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.file.write(b''.join(self.buffer))
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, timestamp, frame):
+        seconds = int(timestamp)
+        self.write_raw(PCAP_RECORD.pack(seconds, int((timestamp - seconds) * 1e6), len(frame), len(frame)) + frame)
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class PcapngWriter(PcapWriter):
+    # One section, one ethernet interface with microsecond timestamps, enhanced packet blocks
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.buffer = []
+        self.buffered = 0
+        self.size = 0
+        self.block(PCAPNG_SHB, struct.pack('<IHHq', PCAPNG_BYTE_ORDER_MAGIC, 1, 0, -1))
+        self.block(PCAPNG_IDB, struct.pack('<HHI', LINKTYPE_ETHERNET, 0, 65535))
+
+    def block(self, block_type, body):
+        body += b'\x00' * (-len(body) % 4)
+        self.write_raw(struct.pack('<II', block_type, 12 + len(body)) + body + struct.pack('<I', 12 + len(body)))
+
+    def write(self, timestamp, frame):
+        ticks = int(round(timestamp * 1e6))
+        padding = -len(frame) % 4
+        length = 32 + len(frame) + padding
+        self.write_raw(struct.pack('<IIIIIII', PCAPNG_EPB, length, 0, ticks >> 32, ticks & 0xffffffff,
+                                   len(frame), len(frame)) + frame + b'\x00' * padding + struct.pack('<I', length))
+
+
+def write_capture(path, generator, size=None, duration=None, fmt=None, attack_log=None):
+    # Writes packets of the generator until the file reaches size bytes or the traffic spans duration
+    # seconds; returns the generator stats with the file size and traffic time span
+    fmt = fmt or ('pcapng' if path.endswith('.pcapng') else 'pcap')
+    writer = (PcapngWriter if fmt == 'pcapng' else PcapWriter)(path)
+    stop = generator.start_time + duration if duration else None
+    last = generator.start_time
+    packets = generator.packets(stop)
+    try:
+        for timestamp, frame in packets:
+            writer.write(timestamp, frame)
+            last = timestamp
+            # Checked after writing, so no frame is generated and then left out of the file
+            if size is not None and writer.size >= size:
+                break
+    finally:
+        writer.close()
+    if attack_log:
+        write_attack_log(attack_log, [slot for slot in generator.slots if slot['start_time'] <= last])
+    stats = dict(generator.stats, bytes=writer.size, seconds=last - generator.start_time)
+    stats['messages'] = sum(generator.messages.values())
+    return stats
+
+
+def write_attack_log(path, slots):
+    # Same columns as the log of attacks/attack_scheduler.py, usable with PfcpFlowMeter.py --attack-log
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(LOG_COLUMNS)
+        for slot in slots:
+            writer.writerow([slot['index'], slot['Label'], slot['Label_val'], f"{slot['start_time']:.6f}",
+                             f"{slot['end_time']:.6f}", slot['scenario'], slot['messages'], '0.000000'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a deterministic synthetic PFCP capture.')
+    parser.add_argument('output', help='Capture file to write (.pcap or .pcapng)')
+    parser.add_argument('--size', type=parse_size, default=None, help='Stop at this file size, e.g. 500M or 20G')
+    parser.add_argument('--duration', type=float, default=None, help='Stop after this many seconds of traffic')
+    parser.add_argument('--format', choices=FORMATS, default=None, help='Capture format (default: from the extension)')
+    parser.add_argument('--attack-log', default=None, help='Also write the attack slots as an attack log CSV')
+    parser.add_argument('--smfs', type=int, default=4, help='Number of SMFs (default: 4)')
+    parser.add_argument('--session-rate', type=float, default=20.0, help='New sessions per second (default: 20)')
+    parser.add_argument('--session-lifetime', type=float, default=60.0, help='Mean session lifetime in seconds (default: 60)')
+    parser.add_argument('--modifications', type=int, default=2, help='Modifications per session (default: 2)')
+    parser.add_argument('--heartbeat-interval', type=float, default=10.0, help='Seconds between heartbeats (default: 10)')
+    parser.add_argument('--attack-rate', type=float, default=200.0,
+                        help='Attack requests per second in attack slots (default: 200)')
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(ATTACKS), default=DEFAULT_SCENARIOS,
+                        help='Attack scenarios of the slots')
+    parser.add_argument('--slot-duration', type=float, default=39, help='Seconds per slot (default: 39)')
+    parser.add_argument('--gap', type=float, default=1, help='Pause between slots in seconds (default: 1)')
+    parser.add_argument('--multi-share', type=float, default=0.02,
+                        help='Share of modification/deletion datagrams carrying two messages (default: 0.02)')
+    parser.add_argument('--malformed-share', type=float, default=0.001, help='Share of broken frames (default: 0.001)')
+    parser.add_argument('--start-time', type=float, default=START_TIME, help='Epoch time of the first packet')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    args = parser.parse_args()
+    if args.size is None and args.duration is None:
+        parser.error('one of --size or --duration is required')
+
+    generator = CaptureGenerator(args.smfs, args.session_rate, args.session_lifetime, args.modifications,
+                                 args.heartbeat_interval, args.attack_rate, args.scenarios, args.slot_duration,
+                                 args.gap, args.multi_share, args.malformed_share, start_time=args.start_time,
+                                 seed=args.seed)
+    start = time.perf_counter()
+    stats = write_capture(args.output, generator, args.size, args.duration, args.format, args.attack_log)
+    seconds = time.perf_counter() - start
+    print(f"Wrote {format_size(stats['bytes'])} to {args.output}: {stats['frames']} frames, {stats['messages']} PFCP "
+          f"messages, {stats.get('multi_message', 0)} multi-message, {stats.get('malformed', 0)} malformed, "
+          f"{stats['seconds']:.0f} s of traffic in {seconds:.1f} s ({stats['bytes'] / seconds / 2 ** 20:.1f} MiB/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import os
+import time
+
+import pandas as pd
+
+from pcap_reader import is_capture
+
+
+class CaptureWatcher:
+    # Polls a directory for finished captures. A capture is handed out once its size and mtime have not
+    # changed for `settle` seconds; files monitor_session.py is still writing end in .part and are not
+    # captures at all, so they are picked up after the rename.
+    def __init__(self, directory, settle=2.0, done=()):
+        self.directory = directory
+        self.settle = settle
+        self.done = set(done)
+        # name -> ((size, mtime_ns), monotonic time it was first seen with that size and mtime)
+        self.pending = {}
+        # name -> (size, mtime_ns) of captures that kept failing; they are offered again once replaced
+        self.quarantined = {}
+
+    def poll(self):
+        # Names of the captures that became ready, oldest first, which is the order they were rotated in
+        now = time.monotonic()
+        wall = time.time()
+        ready = []
+        for name in os.listdir(self.directory):
+            if name in self.done or not is_capture(name):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if name in self.quarantined:
+                if self.quarantined[name] == signature:
+                    continue
+                del self.quarantined[name]
+            seen = self.pending.get(name)
+            if seen is None or seen[0] != signature:
+                # Files last written longer than settle ago, e.g. at startup, do not wait another round
+                self.pending[name] = (signature, now - (self.settle if wall - stat.st_mtime >= self.settle else 0))
+                seen = self.pending[name]
+            if now - seen[1] >= self.settle:
+                ready.append((stat.st_mtime_ns, name))
+        ready.sort()
+        for _, name in ready:
+            del self.pending[name]
+            self.done.add(name)
+        return [name for _, name in ready]
+
+    def retry(self, name):
+        # Hands the capture out again on the next poll
+        self.done.discard(name)
+
+    def quarantine(self, name):
+        # Leaves the capture out until its size or mtime changes
+        self.done.discard(name)
+        try:
+            stat = os.stat(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            return
+        self.quarantined[name] = (stat.st_size, stat.st_mtime_ns)
+
+
+class DailyWriter:
+    # Appends window rows to one CSV per UTC day of the window start: <day>_<interval>[_hopH].csv.
+    # Windows come in start order, so rows starting at or before the last one in the file were written
+    # by an earlier run, e.g. one stopped before it recorded the capture, and are left out.
+    def __init__(self, output_directory, interval, hop=None):
+        self.output_directory = output_directory
+        self.suffix = f'_{interval}' + (f'_hop{hop}' if hop else '')
+        # path -> window_start of the last row in the file
+        self.last = {}
+
+    def path(self, day):
+        return os.path.join(self.output_directory, f'{day}{self.suffix}.csv')
+
+    def last_start(self, path):
+        if path not in self.last:
+            starts = pd.read_csv(path, usecols=['window_start'])['window_start'] if os.path.exists(path) else []
+            self.last[path] = starts.max() if len(starts) else None
+        return self.last[path]
+
+    def append(self, df):
+        # Returns the files written to. The header is only written when a file is created.
+        days = pd.to_datetime(df['window_start'], unit='s', utc=True).dt.strftime('%Y-%m-%d')
+        paths = []
+        for day, rows in df.groupby(days, sort=True):
+            path = self.path(day)
+            last = self.last_start(path)
+            if last is not None:
+                rows = rows[rows['window_start'] > last]
+                if rows.empty:
+                    continue
+            rows.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+            self.last[path] = rows['window_start'].iloc[-1]
+            paths.append(path)
+        return paths
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on Windows; concurrent runs on one output directory are then not supported
+    fcntl = None
+
+import pandas as pd
+
+MANIFEST_FILE = 'manifest.json'
+CACHE_DIRECTORY = '.cache'
+HASH_BLOCK = 1 << 20
+
+
+def file_digest(path):
+    # Content hash of a capture, independent of its name and mtime
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def settings_key(settings):
+    # Stable hash of the converter settings that change the output tables
+    def encode(value):
+        if isinstance(value, pd.DataFrame):
+            return hashlib.blake2b(value.to_csv(index=False).encode(), digest_size=20).hexdigest()
+        return str(value)
+    text = json.dumps(settings, sort_keys=True, default=encode)
+    return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+
+def cache_path(output_directory, digest):
+    return os.path.join(output_directory, CACHE_DIRECTORY, f'{digest}.parquet')
+
+
+class Manifest:
+    # Record of the converted captures in an output directory: size, mtime and content hash of each
+    # input and the files written for it, per input and settings key, so runs with other settings on
+    # the same directory keep their own entries. Several converters may share a directory: the file is
+    # read and written under a lock, and save() merges this run's changes into what is on disk.
+    def __init__(self, output_directory):
+        self.output_directory = output_directory
+        self.path = os.path.join(output_directory, MANIFEST_FILE)
+        self.lock_path = f'{self.path}.lock'
+        # filename -> settings key -> entry
+        self.entries = {}
+        # (filename, key) -> entry, or None for entries removed by this run
+        self.changes = {}
+        with self.locked():
+            self.entries = self.load()
+
+    @contextmanager
+    def locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as file:
+            entries = json.load(file)
+        # Manifests written before entries were kept per settings key hold one entry per file
+        return {filename: {entry.pop('settings'): entry} if 'digest' in entry else entry
+                for filename, entry in entries.items()}
+
+    def outputs_exist(self, entry):
+        return all(os.path.exists(os.path.join(self.output_directory, path)) for path in entry['outputs'])
+
+    def deleted(self, entry):
+        # Every output of the entry is gone
+        return bool(entry['outputs']) and not any(os.path.exists(os.path.join(self.output_directory, path))
+                                                  for path in entry['outputs'])
+
+    def current(self, filename, key):
+        # The entry for an input converted with the same settings whose outputs still exist, or None
+        entry = self.entries.get(filename, {}).get(key)
+        if entry is None or not self.outputs_exist(entry):
+            return None
+        # Outputs are stored relative to the output directory
+        return dict(entry, outputs=[os.path.join(self.output_directory, path) for path in entry['outputs']])
+
+    def converted(self, key):
+        # Names of the inputs with a current entry for the settings key
+        return [filename for filename in self.entries if self.current(filename, key) is not None]
+
+    def unchanged(self, entry, stat):
+        # Same size and mtime: the content is not hashed again
+        return entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+    def record(self, filename, size, mtime_ns, digest, key, outputs):
+        entry = {'size': size, 'mtime_ns': mtime_ns, 'digest': digest,
+                 'outputs': [os.path.relpath(path, self.output_directory) for path in outputs]}
+        # Entries of the same input with other settings whose outputs were just overwritten are stale
+        for other, previous in self.entries.get(filename, {}).items():
+            if other != key and set(previous['outputs']) & set(entry['outputs']):
+                self.changes[(filename, other)] = None
+        self.changes[(filename, key)] = entry
+        self.apply(self.entries, self.changes)
+
+    @staticmethod
+    def apply(entries, changes):
+        for (filename, key), entry in changes.items():
+            if entry is None:
+                entries.get(filename, {}).pop(key, None)
+            else:
+                entries.setdefault(filename, {})[key] = entry
+        for filename in [filename for filename, by_key in entries.items() if not by_key]:
+            del entries[filename]
+
+    def save(self):
+        with self.locked():
+            entries = self.load()
+            # Entries whose outputs were all deleted are pruned
+            self.apply(entries, {(filename, key): None for filename, by_key in entries.items()
+                                 for key, entry in by_key.items() if self.deleted(entry)})
+            self.apply(entries, self.changes)
+            self.entries = entries
+            temp_file = f'{self.path}.{os.getpid()}.tmp'
+            with open(temp_file, 'w') as file:
+                json.dump(self.entries, file, indent=1, sort_keys=True)
+            os.replace(temp_file, self.path)
@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Label groups of tcp_udp_model.ipynb: every raw label containing a keyword belongs to that group
+LABEL_KEYWORDS = [('dos', 'dos'), ('ftp-patator', 'brute force'), ('ssh-patator', 'brute force'),
+                  ('web attack', 'web attack'), ('botnet', 'botnet'), ('infiltration', 'infiltration')]
+LABEL_GROUP_VALUES = {'benign': 0, 'dos': 11, 'portscan': 12, 'botnet': 13, 'infiltration': 14,
+                      'web attack': 15, 'brute force': 16, 'heartbleed': 17}
+UNKNOWN_LABEL = -1
+DROP_COLUMNS = ['fname']
+
+
+def clean_column(column):
+    return column.strip(' ').replace('/', '_').replace(' ', '_').lower()
+
+
+def label_group(label):
+    label = str(label).strip().lower()
+    for keyword, group in LABEL_KEYWORDS:
+        if keyword in label:
+            return group
+    return label
+
+
+def label_value(label):
+    # Numeric labels (e.g. Label_val of the PFCP tables) are used as they are
+    try:
+        return int(float(label))
+    except ValueError:
+        return LABEL_GROUP_VALUES.get(label_group(label), UNKNOWN_LABEL)
+
+
+class StratifiedReservoir:
+    # Uniform sample of at most `per_class` rows of every class in one pass over the data
+    # (Algorithm R per class), so memory depends on the sample size and not on the file size
+    def __init__(self, per_class, n_features, seed=42):
+        self.per_class = per_class
+        self.n_features = n_features
+        self.rng = np.random.default_rng(seed)
+        self.rows = {}
+        self.seen = {}
+
+    def add(self, X, y):
+        for label in np.unique(y):
+            rows = X[y == label]
+            reservoir = self.rows.get(label)
+            if reservoir is None:
+                reservoir = self.rows[label] = np.empty((0, self.n_features), dtype=np.float32)
+                self.seen[label] = 0
+            seen = self.seen[label]
+            free = self.per_class - len(reservoir)
+            if free > 0:
+                taken = rows[:free]
+                reservoir = self.rows[label] = np.vstack((reservoir, taken))
+                rows = rows[len(taken):]
+                seen += len(taken)
+            if len(rows):
+                # The i-th row of the class (0-based) replaces a random slot with probability per_class / (i + 1)
+                slots = (self.rng.random(len(rows)) * (seen + 1 + np.arange(len(rows)))).astype(np.int64)
+                seen += len(rows)
+                keep = slots < self.per_class
+                slots, rows = slots[keep], rows[keep]
+                # Later rows win when several replace the same slot, as in the sequential algorithm
+                last = len(slots) - 1 - np.unique(slots[::-1], return_index=True)[1]
+                reservoir[slots[last]] = rows[last]
+            self.seen[label] = seen
+
+    def result(self):
+        labels = sorted(self.rows)
+        X = np.vstack([self.rows[label] for label in labels]) if labels else np.empty((0, self.n_features))
+        y = np.concatenate([np.full(len(self.rows[label]), label, dtype=np.int16) for label in labels]) \
+            if labels else np.empty(0, dtype=np.int16)
+        order = self.rng.permutation(len(y))
+        return X[order], y[order]
+
+
+def read_chunks(path, label_column='label', drop_columns=DROP_COLUMNS, chunksize=200_000):
+    # Chunks of (float32 feature matrix, int label vector, feature names) with declared dtypes
+    header = pd.read_csv(path, nrows=0).columns
+    raw_label = next(column for column in header if clean_column(column) == label_column)
+    features = [column for column in header if column != raw_label and clean_column(column) not in drop_columns]
+    # Repeated header rows inside the file parse as NaN instead of breaking the float columns
+    na_values = {column: [column, column.strip()] for column in features}
+    dtypes = {column: np.float32 for column in features}
+    dtypes[raw_label] = 'category'
+    names = [clean_column(column) for column in features]
+    reader = pd.read_csv(path, usecols=features + [raw_label], dtype=dtypes, na_values=na_values,
+                         keep_default_na=True, chunksize=chunksize)
+    lookup = {}
+    for chunk in reader:
+        labels = chunk[raw_label]
+        header_rows = (labels == raw_label).to_numpy() | (labels == raw_label.strip()).to_numpy()
+        # Vectorized mapping: each distinct label is looked up once and the rows index the result
+        values = np.array([lookup[c] if c in lookup else lookup.setdefault(c, label_value(c))
+                           for c in labels.cat.categories], dtype=np.int64)
+        codes = labels.cat.codes.to_numpy()
+        y = np.where(codes >= 0, values[np.maximum(codes, 0)], UNKNOWN_LABEL)
+        keep = ~header_rows
+        X = chunk[features].to_numpy(dtype=np.float32)
+        yield X[keep], y[keep], names
+
+
+def build_dataset(path, output_directory, per_class=100_000, label_column='label', drop_columns=DROP_COLUMNS,
+                  chunksize=200_000, seed=42):
+    reservoir = None
+    names = []
+    rows = 0
+    for X, y, names in read_chunks(path, label_column, drop_columns, chunksize):
+        if reservoir is None:
+            reservoir = StratifiedReservoir(per_class, X.shape[1], seed)
+        reservoir.add(X, y)
+        rows += len(y)
+    if reservoir is None:
+        raise ValueError(f"{path} has no data rows")
+    X, y = reservoir.result()
+
+    os.makedirs(output_directory, exist_ok=True)
+    features = np.lib.format.open_memmap(os.path.join(output_directory, 'X.npy'), mode='w+', dtype=np.float32,
+                                         shape=X.shape)
+    features[:] = X
+    features.flush()
+    np.save(os.path.join(output_directory, 'y.npy'), y)
+    counts = {int(label): int(n) for label, n in zip(*np.unique(y, return_counts=True))}
+    seen = {int(label): int(n) for label, n in reservoir.seen.items()}
+    with open(os.path.join(output_directory, 'dataset.json'), 'w') as file:
+        json.dump({'source': os.path.abspath(path), 'columns': names, 'per_class': per_class, 'seed': seed,
+                   'rows_read': rows, 'rows_per_class': seen, 'sampled_per_class': counts}, file, indent=2)
+    print(f"Read {rows} rows from {path}, sampled {len(y)}: "
+          + ', '.join(f"{label}: {counts[label]}/{seen[label]}" for label in sorted(counts)))
+    return X, y
+
+
+def load_dataset(output_directory):
+    # Memory-mapped feature matrix, label vector and column names of a built dataset
+    with open(os.path.join(output_directory, 'dataset.json')) as file:
+        meta = json.load(file)
+    X = np.load(os.path.join(output_directory, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(output_directory, 'y.npy'))
+    return X, y, meta['columns']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a stratified float32 training set from a large CSV.')
+    parser.add_argument('csv_file', help='Source CSV, e.g. newdataset.csv')
+    parser.add_argument('output_directory', help='Directory for X.npy, y.npy and dataset.json')
+    parser.add_argument('--per-class', type=int, default=100_000,
+                        help='Maximum rows kept per class; smaller classes are kept whole (default: 100000)')
+    parser.add_argument('--label-column', default='label',
+                        help='Label column; numeric labels such as Label_val are used as they are (default: label)')
+    parser.add_argument('--drop', nargs='*', default=DROP_COLUMNS, help='Columns left out of the features')
+    parser.add_argument('--chunksize', type=int, default=200_000, help='Rows read per chunk (default: 200000)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    args = parser.parse_args()
+    build_dataset(args.csv_file, args.output_directory, args.per_class, clean_column(args.label_column),
+                  [clean_column(column) for column in args.drop], args.chunksize, args.seed)
+
+
+if __name__ == '__main__':
+    main()
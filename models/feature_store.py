@@ -0,0 +1,179 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from attack_labels import UNLABELLED  # noqa: E402
+from table_io import TableWriter, load_table  # noqa: E402
+
+KEY_COLUMNS = ['node', 'window_start', 'window_end']
+LABEL_COLUMNS = ['Label_val', 'Label', 'label_overlap']
+# Flow aggregates per window: flows starting in the window, sums and means of these flow columns
+FLOW_SUM_COLUMNS = ['total_fwd_packet', 'total_bwd_packets', 'total_length_of_fwd_packet',
+                    'total_length_of_bwd_packet', 'syn_flag_count', 'fin_flag_count', 'rst_flag_count']
+FLOW_MEAN_COLUMNS = ['flow_duration', 'flow_iat_mean', 'packet_length_mean', 'down_up_ratio']
+# Label_val of flows that are not attack traffic: normal, and flows no attack slot covers
+NON_ATTACK_LABELS = (0, UNLABELLED[0])
+
+
+def flow_aggregate_columns(sum_columns=FLOW_SUM_COLUMNS, mean_columns=FLOW_MEAN_COLUMNS):
+    return (['flows', 'flow_attacks'] + [f'flow_sum_{column}' for column in sum_columns]
+            + [f'flow_mean_{column}' for column in mean_columns])
+
+
+def aggregate_flows(flows, window_starts, window_ends, sum_columns=FLOW_SUM_COLUMNS, mean_columns=FLOW_MEAN_COLUMNS):
+    # Sorted merge of flow start times with the windows: every flow is added to each window covering it,
+    # which is one window for tumbling and several for hopping windows. Returns the aggregates and the
+    # number of flows outside all windows.
+    n = len(window_starts)
+    times = flows['start_time'].to_numpy(dtype=np.float64)
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    # Window ends are sorted like the starts, so the covering windows are one contiguous range per flow
+    first = np.searchsorted(window_ends, times, side='right')
+    last = np.searchsorted(window_starts, times, side='right')
+    counts = np.maximum(last - first, 0)
+    flow_index = np.repeat(order, counts)
+    window_index = np.repeat(first, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+
+    result = {'flows': np.bincount(window_index, minlength=n).astype(np.uint32)}
+    if 'Label_val' in flows.columns:
+        attack = ~np.isin(flows['Label_val'].to_numpy(), NON_ATTACK_LABELS)
+        result['flow_attacks'] = np.bincount(window_index, weights=attack[flow_index], minlength=n).astype(np.uint32)
+    else:
+        result['flow_attacks'] = np.zeros(n, dtype=np.uint32)
+    for column in sum_columns:
+        values = flows[column].to_numpy(dtype=np.float64)[flow_index]
+        result[f'flow_sum_{column}'] = np.bincount(window_index, weights=values, minlength=n).astype(np.float32)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for column in mean_columns:
+            values = flows[column].to_numpy(dtype=np.float64)[flow_index]
+            total = np.bincount(window_index, weights=values, minlength=n)
+            result[f'flow_mean_{column}'] = np.where(result['flows'] > 0, total / result['flows'], 0).astype(np.float32)
+    return pd.DataFrame(result), int((counts == 0).sum())
+
+
+def join_node(node, pfcp, flows=None):
+    # PFCP windows of one node (the key grid) with the flows of the same node aggregated onto them
+    if 'window_start' not in pfcp.columns:
+        raise ValueError(f"PFCP table of {node} has no window_start column, convert it with --window-times")
+    pfcp = pfcp.sort_values('window_start', kind='stable').reset_index(drop=True)
+    dropped = 0
+    if flows is not None and len(flows):
+        aggregates, dropped = aggregate_flows(flows, pfcp['window_start'].to_numpy(), pfcp['window_end'].to_numpy())
+    else:
+        aggregates = pd.DataFrame({column: np.zeros(len(pfcp), dtype=np.uint32 if column in ('flows', 'flow_attacks')
+                                                    else np.float32) for column in flow_aggregate_columns()})
+    keys = pd.DataFrame({'node': node, 'window_start': pfcp['window_start'], 'window_end': pfcp['window_end']})
+    features = pfcp.drop(columns=['window_start', 'window_end'] + [c for c in LABEL_COLUMNS if c in pfcp.columns])
+    labels = pfcp[[c for c in LABEL_COLUMNS if c in pfcp.columns]]
+    return pd.concat([keys, features, aggregates, labels], axis=1), dropped
+
+
+def build_store(path, pfcp_tables, flow_tables=None):
+    # pfcp_tables and flow_tables map a node name (e.g. the UPF) to its table files. The joined rows are
+    # sorted by (node, window_start) and written as one parquet file with separate row groups per node.
+    flow_tables = flow_tables or {}
+    parts = []
+    for node in sorted(pfcp_tables):
+        pfcp = pd.concat([load_table(table) for table in pfcp_tables[node]], ignore_index=True)
+        flows = pd.concat([load_table(table) for table in flow_tables[node]], ignore_index=True) \
+            if flow_tables.get(node) else None
+        part, dropped = join_node(node, pfcp, flows)
+        print(f"{node}: {len(part)} windows, {int(part['flows'].sum())} flow-window pairs, "
+              f"{dropped} flows outside the PFCP windows")
+        parts.append(part)
+    for node in sorted(set(flow_tables) - set(pfcp_tables)):
+        print(f"{node}: flows without PFCP windows are left out")
+    store = pd.concat(parts, ignore_index=True)
+    store['node'] = store['node'].astype('category')
+    writer = TableWriter(path, 'parquet')
+    for _, rows in store.groupby('node', observed=True, sort=False):
+        writer.append(rows)
+    writer.close(list(store.columns))
+    features = feature_columns(store)
+    nonzero = int(sum(np.count_nonzero(store[column].to_numpy()) for column in features))
+    print(f"Saved {len(store)} rows x {len(features)} features to {path}, "
+          f"{nonzero / max(store.shape[0] * len(features), 1):.1%} non-zero")
+    return store
+
+
+def feature_columns(store):
+    return [column for column in store.columns if column not in KEY_COLUMNS + LABEL_COLUMNS]
+
+
+def load_store(path, columns=None, nodes=None, start=None, stop=None):
+    # Reads only the requested columns and rows. Row groups of other nodes are skipped from their
+    # statistics, and so are those outside the time range, as windows are sorted within a node.
+    filters = []
+    if nodes is not None:
+        filters.append(('node', 'in', list(nodes)))
+    if start is not None:
+        filters.append(('window_start', '>=', start))
+    if stop is not None:
+        filters.append(('window_start', '<', stop))
+    if columns is not None:
+        columns = list(dict.fromkeys(KEY_COLUMNS + list(columns)))
+    return pd.read_parquet(path, columns=columns, filters=filters or None)
+
+
+def sparse_matrix(df, columns=None):
+    # CSR matrix of the feature columns built column by column from their non-zero entries, so memory
+    # follows the non-zero count and no dense float matrix is created
+    from scipy import sparse
+    columns = columns or feature_columns(df)
+    rows, cols, values = [], [], []
+    for j, column in enumerate(columns):
+        data = df[column].to_numpy()
+        nonzero = np.flatnonzero(data)
+        rows.append(nonzero)
+        cols.append(np.full(len(nonzero), j, dtype=np.int32))
+        values.append(data[nonzero].astype(np.float32))
+    return sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(len(df), len(columns)), dtype=np.float32)
+
+
+def time_split(df, test_share=0.2):
+    # Train on the windows ending before the cut and test on those starting after it, so overlapping
+    # windows never put the same traffic on both sides
+    cut = np.quantile(df['window_start'].to_numpy(), 1 - test_share)
+    return df[df['window_end'] <= cut], df[df['window_start'] >= cut]
+
+
+def training_slices(path, label='Label_val', test_share=0.2, columns=None, nodes=None):
+    # Sparse train/test matrices and labels of a store, with the feature column order
+    df = load_store(path, columns=None if columns is None else list(columns) + [label], nodes=nodes)
+    features = columns or feature_columns(df)
+    train, test = time_split(df, test_share)
+    return (sparse_matrix(train, features), train[label].to_numpy(), sparse_matrix(test, features),
+            test[label].to_numpy(), features)
+
+
+def parse_tables(values):
+    # NODE=PATH arguments, several paths of one node are stacked
+    tables = {}
+    for value in values or []:
+        node, _, path = value.partition('=')
+        if not path:
+            raise argparse.ArgumentTypeError(f"Expected NODE=PATH, got {value}")
+        tables.setdefault(node, []).append(path)
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Join PFCP windows and TCP/UDP flows by node and window time.')
+    parser.add_argument('output', help='Parquet file of the joined feature store')
+    parser.add_argument('--pfcp', action='append', required=True, metavar='NODE=PATH',
+                        help='PFCP window table written with --window-times, can be repeated')
+    parser.add_argument('--flows', action='append', default=[], metavar='NODE=PATH',
+                        help='Flow table from FlowMeter.py of the same node, can be repeated')
+    args = parser.parse_args()
+    build_store(args.output, parse_tables(args.pfcp), parse_tables(args.flows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+# Version of the .npz model artifact; loading refuses artifacts of a newer format
+FORMAT_VERSION = 1
+BENIGN_LABEL = 0
+# Upper bound on rows x trees evaluated at once, keeps the node index arrays small
+NODES_PER_CHUNK = 1 << 20
+
+
+class AffineScaler:
+    # StandardScaler ((X - center) / scale) or MinMaxScaler (X * scale + offset), applied like sklearn does
+    def __init__(self, kind, a, b):
+        self.kind = kind
+        self.a = np.asarray(a, dtype=np.float64)
+        self.b = np.asarray(b, dtype=np.float64)
+
+    @classmethod
+    def from_sklearn(cls, scaler, n_features):
+        name = type(scaler).__name__
+        if name == 'StandardScaler':
+            center = scaler.mean_ if scaler.mean_ is not None else np.zeros(n_features)
+            scale = scaler.scale_ if scaler.scale_ is not None else np.ones(n_features)
+            return cls('standard', center, scale)
+        if name == 'MinMaxScaler':
+            return cls('minmax', scaler.scale_, scaler.min_)
+        raise ValueError(f"Unsupported scaler {name}, expected StandardScaler or MinMaxScaler")
+
+    def transform(self, X):
+        if self.kind == 'standard':
+            return (X - self.a) / self.b
+        return X * self.a + self.b
+
+    def arrays(self, prefix):
+        return {f'{prefix}/a': self.a, f'{prefix}/b': self.b}
+
+    @classmethod
+    def from_arrays(cls, meta, arrays, prefix):
+        return cls(meta['kind'], arrays[f'{prefix}/a'], arrays[f'{prefix}/b'])
+
+
+class TreeEnsemble:
+    # Trees of a RandomForestClassifier or GradientBoostingClassifier flattened into shared node arrays.
+    # Leaves point to themselves with an infinite threshold, so every row takes `depth` branch-free steps.
+    def __init__(self, kind, classes, feature, threshold, left, right, value, roots, depth, tree_output=None,
+                 init=None, learning_rate=1.0):
+        self.kind = kind
+        self.classes = np.asarray(classes)
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        # Column 0 is taken when the feature is <= threshold, column 1 otherwise
+        self.children = np.stack([self.left, self.right], axis=1)
+        self.depth = int(depth)
+        # Boosting: output column of each tree and the constant initial raw prediction
+        self.tree_output = None if tree_output is None else np.asarray(tree_output, dtype=np.int32)
+        self.init = None if init is None else np.asarray(init, dtype=np.float64)
+        self.learning_rate = float(learning_rate)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        name = type(model).__name__
+        if name in ('RandomForestClassifier', 'ExtraTreesClassifier'):
+            trees = [estimator.tree_ for estimator in model.estimators_]
+            outputs = None
+        elif name == 'GradientBoostingClassifier':
+            # estimators_ is (n_estimators, K) regression trees, one per class (K=1 for two classes)
+            trees = [estimator.tree_ for row in model.estimators_ for estimator in row]
+            outputs = [k for _ in model.estimators_ for k in range(model.estimators_.shape[1])]
+        else:
+            raise ValueError(f"Unsupported tree model {name}")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        depth = 0
+        base = 0
+        for tree in trees:
+            leaf = tree.children_left < 0
+            index = np.arange(tree.node_count) + base
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(np.where(leaf, np.inf, tree.threshold))
+            lefts.append(np.where(leaf, index, tree.children_left + base))
+            rights.append(np.where(leaf, index, tree.children_right + base))
+            value = tree.value[:, 0, :]
+            if outputs is None:
+                # Class fractions of the leaf, averaged over the trees like predict_proba
+                value = value / value.sum(axis=1, keepdims=True)
+            values.append(value)
+            roots.append(base)
+            depth = max(depth, tree.max_depth)
+            base += tree.node_count
+
+        init = learning_rate = None
+        if outputs is not None:
+            # Raw score of the init estimator (class priors), the same for every row
+            init = model._raw_predict_init(np.zeros((1, model.n_features_in_)))[0]
+            learning_rate = model.learning_rate
+        return cls('boosting' if outputs is not None else 'forest', model.classes_, np.concatenate(features),
+                   np.concatenate(thresholds), np.concatenate(lefts), np.concatenate(rights), np.vstack(values),
+                   roots, depth, outputs, init, learning_rate if learning_rate is not None else 1.0)
+
+    def leaves(self, X):
+        # Leaf index reached by every row in every tree, shape (rows, trees)
+        flat = X.ravel()
+        offsets = (np.arange(len(X), dtype=np.int64) * X.shape[1])[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.depth):
+            x = flat[offsets + self.feature[node]]
+            node = self.children[node, (x > self.threshold[node]).view(np.int8)]
+        return node
+
+    def decision(self, X):
+        # Averaged class probabilities (forest) or raw scores per output (boosting)
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        chunk = max(1, NODES_PER_CHUNK // len(self.roots))
+        if self.kind == 'forest':
+            result = np.empty((len(X), self.value.shape[1]))
+        else:
+            result = np.empty((len(X), len(self.init)))
+            onehot = np.zeros((len(self.roots), len(self.init)))
+            onehot[np.arange(len(self.roots)), self.tree_output] = 1.0
+        for start in range(0, len(X), chunk):
+            node = self.leaves(X[start:start + chunk])
+            if self.kind == 'forest':
+                result[start:start + chunk] = self.value[node].sum(axis=1) / len(self.roots)
+            else:
+                result[start:start + chunk] = self.init + self.learning_rate * (self.value[node, 0] @ onehot)
+        return result
+
+    def predict(self, X):
+        scores = self.decision(X)
+        if self.kind == 'boosting' and scores.shape[1] == 1:
+            return self.classes[(scores[:, 0] > 0).astype(np.int64)]
+        return self.classes[scores.argmax(axis=1)]
+
+    def meta(self):
+        return {'type': 'trees', 'kind': self.kind, 'classes': self.classes.tolist(), 'depth': self.depth,
+                'learning_rate': self.learning_rate}
+
+    def arrays(self, prefix):
+        arrays = {f'{prefix}/{name}': getattr(self, name)
+                  for name in ('feature', 'threshold', 'left', 'right', 'value', 'roots')}
+        if self.kind == 'boosting':
+            arrays[f'{prefix}/tree_output'] = self.tree_output
+            arrays[f'{prefix}/init'] = self.init
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, meta, arrays, prefix):
+        boosting = meta['kind'] == 'boosting'
+        return cls(meta['kind'], meta['classes'], *(arrays[f'{prefix}/{name}'] for name in
+                                                    ('feature', 'threshold', 'left', 'right', 'value', 'roots')),
+                   meta['depth'], arrays[f'{prefix}/tree_output'] if boosting else None,
+                   arrays[f'{prefix}/init'] if boosting else None, meta['learning_rate'])
+
+
+class Mlp:
+    # The torch Discriminator of the notebooks as NumPy: Linear + ReLU layers, sigmoid output > 0.5 is an attack
+    def __init__(self, weights, biases, classes=(0, 1)):
+        self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.classes = np.asarray(classes)
+
+    @classmethod
+    def from_torch(cls, module):
+        # Linear layers in definition order (fc1..fc4); torch itself is only needed to produce the module
+        state = module.state_dict()
+        layers = [name[:-len('.weight')] for name in state if name.endswith('.weight')]
+        return cls([state[f'{layer}.weight'].detach().cpu().numpy().T for layer in layers],
+                   [state[f'{layer}.bias'].detach().cpu().numpy() for layer in layers])
+
+    def predict(self, X):
+        h = np.asarray(X, dtype=np.float32)
+        for w, b in zip(self.weights[:-1], self.biases[:-1]):
+            h = np.maximum(h @ w + b, 0)
+        logit = h @ self.weights[-1] + self.biases[-1]
+        # sigmoid(x) > 0.5 is x > 0
+        return self.classes[(logit[:, 0] > 0).astype(np.int64)]
+
+    def meta(self):
+        return {'type': 'mlp', 'layers': len(self.weights), 'classes': self.classes.tolist()}
+
+    def arrays(self, prefix):
+        arrays = {}
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            arrays[f'{prefix}/w{i}'] = w
+            arrays[f'{prefix}/b{i}'] = b
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, meta, arrays, prefix):
+        return cls([arrays[f'{prefix}/w{i}'] for i in range(meta['layers'])],
+                   [arrays[f'{prefix}/b{i}'] for i in range(meta['layers'])], meta['classes'])
+
+
+STAGE_TYPES = {'trees': TreeEnsemble, 'mlp': Mlp}
+
+
+def stage_from(model):
+    # Flattened form of a fitted first or second stage
+    if isinstance(model, (TreeEnsemble, Mlp)):
+        return model
+    if hasattr(model, 'state_dict'):
+        return Mlp.from_torch(model)
+    return TreeEnsemble.from_sklearn(model)
+
+
+class ConditionalModel:
+    # Two-stage ConditionalClassifier of the notebooks: the binary stage flags attacks and only the flagged
+    # rows go to the multiclass stage; batches without flagged rows never run it
+    def __init__(self, columns, binary, multiclass, scaler=None, benign_label=BENIGN_LABEL, metadata=None):
+        self.columns = list(columns)
+        self.feature_names_in_ = np.array(self.columns, dtype=object)
+        self.binary = binary
+        self.multiclass = multiclass
+        self.scaler = scaler
+        self.benign_label = benign_label
+        self.metadata = metadata or {}
+
+    def features(self, X):
+        if isinstance(X, pd.DataFrame):
+            X = X.reindex(columns=self.columns, fill_value=0)
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        return self.scaler.transform(X) if self.scaler is not None else X
+
+    def predict(self, X, batch_size=None):
+        X = self.features(X)
+        batch_size = batch_size or max(len(X), 1)
+        result = np.empty(len(X), dtype=np.int64)
+        for start in range(0, len(X), batch_size):
+            batch = X[start:start + batch_size]
+            predictions = self.binary.predict(batch).astype(np.int64)
+            flagged = predictions != self.benign_label
+            if flagged.any():
+                predictions[flagged] = self.multiclass.predict(batch[flagged])
+            result[start:start + batch_size] = predictions
+        return result
+
+    def save(self, path):
+        stages = {'binary': self.binary, 'multiclass': self.multiclass}
+        meta = {'format_version': FORMAT_VERSION, 'columns': self.columns, 'benign_label': self.benign_label,
+                'scaler': {'kind': self.scaler.kind} if self.scaler is not None else None,
+                'stages': {name: stage.meta() for name, stage in stages.items()}, 'metadata': self.metadata}
+        arrays = {}
+        for name, stage in stages.items():
+            arrays.update(stage.arrays(name))
+        if self.scaler is not None:
+            arrays.update(self.scaler.arrays('scaler'))
+        with open(path, 'wb') as file:
+            np.savez_compressed(file, meta=np.array(json.dumps(meta)), **arrays)
+        return path
+
+
+def load_artifact(path):
+    # Artifacts hold only arrays and JSON, so loading needs neither pickle nor sklearn or torch
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        if meta['format_version'] > FORMAT_VERSION:
+            raise ValueError(f"{path} has artifact format {meta['format_version']}, this version reads up to "
+                             f"{FORMAT_VERSION}")
+        arrays = {name: data[name] for name in data.files if name != 'meta'}
+    stages = {name: STAGE_TYPES[stage['type']].from_arrays(stage, arrays, name)
+              for name, stage in meta['stages'].items()}
+    scaler = AffineScaler.from_arrays(meta['scaler'], arrays, 'scaler') if meta['scaler'] else None
+    return ConditionalModel(meta['columns'], stages['binary'], stages['multiclass'], scaler, meta['benign_label'],
+                            meta['metadata'])
+
+
+def export_artifact(path, columns, binary_clf, multiclass_clf, scaler=None, benign_label=BENIGN_LABEL,
+                    metadata=None):
+    # From the fitted objects of a notebook: the scaler, the RF or torch Discriminator binary stage and the GB
+    # multiclass stage, with the feature column order they were trained on
+    columns = list(columns)
+    model = ConditionalModel(columns, stage_from(binary_clf), stage_from(multiclass_clf),
+                             AffineScaler.from_sklearn(scaler, len(columns)) if scaler is not None else None,
+                             benign_label, metadata)
+    return model.save(path)
+
+
+def export_pipeline(path, pipeline, columns=None, metadata=None):
+    # Pipeline([('scaler', ...), ('clf', ConditionalClassifier)]) or a ConditionalClassifier that holds its scaler
+    if hasattr(pipeline, 'steps'):
+        scaler, classifier = pipeline.steps[0][1], pipeline.steps[-1][1]
+    else:
+        scaler, classifier = getattr(pipeline, 'scaler', None), pipeline
+    if columns is None:
+        columns = getattr(scaler, 'feature_names_in_', None)
+        if columns is None:
+            raise ValueError("Pass the feature columns, the scaler was fitted without column names")
+    return export_artifact(path, columns, classifier.binary_clf, classifier.multiclass_clf, scaler,
+                           metadata=metadata)
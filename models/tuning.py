@@ -0,0 +1,261 @@
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dataset_builder import load_dataset  # noqa: E402
+
+BENIGN_LABEL = 0
+# Grids of the notebooks' GridSearchCV cells; n_estimators is the budget that successive halving grows
+BINARY_GRID = {
+    'max_depth': [10, 20, 30],
+    'min_samples_split': [2, 5, 10],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': ['sqrt', 'log2'],
+}
+MULTICLASS_GRID = {
+    'learning_rate': [0.01, 0.1, 0.2],
+    'max_depth': [3, 5],
+    'subsample': [1.0, 0.8],
+}
+STAGES = ('binary', 'multiclass')
+
+
+class FoldCache:
+    # Scaled train/validation matrices of every fold, computed once and shared by all candidates.
+    # With a directory they are kept as .npy files and memory-mapped on the next run with the same data.
+    def __init__(self, folds):
+        self.folds = folds
+
+    @classmethod
+    def build(cls, X, y, n_folds=5, scaler='standard', seed=42, directory=None):
+        from sklearn.model_selection import StratifiedKFold
+        from sklearn.preprocessing import MinMaxScaler, StandardScaler
+        X = np.ascontiguousarray(X)
+        y = np.asarray(y)
+        if directory is not None:
+            digest = hashlib.blake2b(digest_size=10)
+            for part in (X, y, np.array([n_folds, seed]), scaler.encode()):
+                digest.update(memoryview(part).cast('B') if isinstance(part, np.ndarray) else part)
+            directory = os.path.join(directory, f'folds_{digest.hexdigest()}')
+            if os.path.exists(os.path.join(directory, 'done')):
+                return cls.load(directory, n_folds)
+        folds = []
+        for train, validation in StratifiedKFold(n_folds, shuffle=True, random_state=seed).split(X, y):
+            scale = StandardScaler() if scaler == 'standard' else MinMaxScaler()
+            X_train = scale.fit_transform(X[train]).astype(np.float32)
+            X_validation = scale.transform(X[validation]).astype(np.float32)
+            folds.append((X_train, y[train], X_validation, y[validation]))
+        cache = cls(folds)
+        if directory is not None:
+            cache.save(directory)
+        return cache
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for i, fold in enumerate(self.folds):
+            for name, array in zip(('X_train', 'y_train', 'X_validation', 'y_validation'), fold):
+                np.save(os.path.join(directory, f'fold{i}_{name}.npy'), array)
+        open(os.path.join(directory, 'done'), 'w').close()
+
+    @classmethod
+    def load(cls, directory, n_folds):
+        return cls([tuple(np.load(os.path.join(directory, f'fold{i}_{name}.npy'), mmap_mode='r')
+                          for name in ('X_train', 'y_train', 'X_validation', 'y_validation'))
+                    for i in range(n_folds)])
+
+    def binary(self, benign_label=BENIGN_LABEL):
+        # Attack (1) vs benign (0) targets on the same matrices
+        return FoldCache([(X_train, (y_train != benign_label).astype(np.int8), X_validation,
+                           (y_validation != benign_label).astype(np.int8))
+                          for X_train, y_train, X_validation, y_validation in self.folds])
+
+    def attacks(self, benign_label=BENIGN_LABEL):
+        # Only the attack rows, which is what the multiclass stage is trained and evaluated on
+        folds = []
+        for X_train, y_train, X_validation, y_validation in self.folds:
+            train, validation = y_train != benign_label, y_validation != benign_label
+            folds.append((X_train[train], y_train[train], X_validation[validation], y_validation[validation]))
+        return FoldCache(folds)
+
+
+def make_estimator(stage, params, seed=42, n_jobs=None):
+    # warm_start lets a surviving candidate grow from its previous forest or boosting stages
+    if stage == 'binary':
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(warm_start=True, random_state=seed, n_jobs=n_jobs, **params)
+    from sklearn.ensemble import GradientBoostingClassifier
+    return GradientBoostingClassifier(warm_start=True, random_state=seed, **params)
+
+
+def grid_candidates(grid):
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+class SearchResult:
+    def __init__(self, params, score, n_estimators, rungs, seconds, fits):
+        self.params = params
+        self.score = score
+        self.n_estimators = n_estimators
+        self.rungs = rungs
+        self.seconds = seconds
+        self.fits = fits
+
+    def to_dict(self):
+        return {'params': self.params, 'n_estimators': self.n_estimators, 'score': self.score,
+                'seconds': round(self.seconds, 3), 'fits': self.fits, 'rungs': self.rungs}
+
+
+def successive_halving(cache, stage, candidates, scoring='f1_macro', min_estimators=10, max_estimators=300,
+                       factor=3, seed=42, n_jobs=None, verbose=True):
+    # Every rung scores the surviving candidates on all folds, keeps the best 1/factor and grows their
+    # ensembles factor times, until they reach max_estimators
+    from sklearn.metrics import get_scorer
+    scorer = get_scorer(scoring)
+    start = time.perf_counter()
+    models = {i: [None] * len(cache.folds) for i in range(len(candidates))}
+    alive = list(range(len(candidates)))
+    n_estimators = min(min_estimators, max_estimators)
+    rungs = []
+    fits = 0
+    while True:
+        scores = {}
+        for i in alive:
+            fold_scores = []
+            for f, (X_train, y_train, X_validation, y_validation) in enumerate(cache.folds):
+                model = models[i][f] or make_estimator(stage, candidates[i], seed, n_jobs)
+                model.set_params(n_estimators=n_estimators)
+                model.fit(X_train, y_train)
+                models[i][f] = model
+                fold_scores.append(scorer(model, X_validation, y_validation))
+                fits += 1
+            scores[i] = float(np.mean(fold_scores))
+        ranked = sorted(alive, key=lambda i: scores[i], reverse=True)
+        rungs.append({'n_estimators': n_estimators, 'candidates': len(alive), 'best_score': scores[ranked[0]],
+                      'seconds': round(time.perf_counter() - start, 3)})
+        if verbose:
+            print(f"  {stage}: {len(alive)} candidates at {n_estimators} estimators, best {scoring} "
+                  f"{scores[ranked[0]]:.4f} ({time.perf_counter() - start:.1f} s)")
+        if n_estimators >= max_estimators:
+            break
+        alive = ranked[:max(1, len(alive) // factor)]
+        for i in ranked[len(alive):]:
+            del models[i]
+        n_estimators = min(n_estimators * factor, max_estimators)
+    best = ranked[0]
+    return SearchResult(candidates[best], scores[best], n_estimators, rungs, time.perf_counter() - start, fits)
+
+
+def hyperband(cache, stage, grid, scoring='f1_macro', min_estimators=10, max_estimators=300, factor=3, seed=42,
+              n_jobs=None, verbose=True):
+    # Successive halving brackets from many candidates on small ensembles to few on large ones,
+    # candidates drawn from the grid without replacement within a bracket
+    rng = np.random.default_rng(seed)
+    candidates = grid_candidates(grid)
+    s_max = int(math.log(max_estimators / min_estimators, factor) + 1e-9)
+    start = time.perf_counter()
+    best = None
+    rungs = []
+    fits = 0
+    for s in range(s_max, -1, -1):
+        n = min(len(candidates), int(math.ceil((s_max + 1) / (s + 1) * factor ** s)))
+        chosen = [candidates[i] for i in rng.choice(len(candidates), n, replace=False)]
+        result = successive_halving(cache, stage, chosen, scoring, max(1, round(max_estimators / factor ** s)),
+                                    max_estimators, factor, seed, n_jobs, verbose)
+        rungs.extend(dict(rung, bracket=s) for rung in result.rungs)
+        fits += result.fits
+        if best is None or result.score > best.score:
+            best = result
+    return SearchResult(best.params, best.score, best.n_estimators, rungs, time.perf_counter() - start, fits)
+
+
+def grid_search(cache, stage, grid, scoring='f1_macro', n_estimators=300, seed=42, n_jobs=None):
+    # Exhaustive baseline on the same folds, every candidate at full size, like GridSearchCV
+    from sklearn.metrics import get_scorer
+    scorer = get_scorer(scoring)
+    start = time.perf_counter()
+    best = (None, -np.inf)
+    fits = 0
+    for params in grid_candidates(grid):
+        scores = []
+        for X_train, y_train, X_validation, y_validation in cache.folds:
+            model = make_estimator(stage, params, seed, n_jobs).set_params(n_estimators=n_estimators)
+            scores.append(scorer(model.fit(X_train, y_train), X_validation, y_validation))
+            fits += 1
+        if np.mean(scores) > best[1]:
+            best = (params, float(np.mean(scores)))
+    return SearchResult(best[0], best[1], n_estimators, [], time.perf_counter() - start, fits)
+
+
+def tune(X, y, stages=STAGES, grids=None, method='halving', scoring='f1_macro', n_folds=5, min_estimators=10,
+         max_estimators=300, factor=3, seed=42, cache_directory=None, compare_grid=False, n_jobs=None):
+    grids = grids or {'binary': BINARY_GRID, 'multiclass': MULTICLASS_GRID}
+    start = time.perf_counter()
+    cache = FoldCache.build(X, y, n_folds, seed=seed, directory=cache_directory)
+    print(f"Folds ready in {time.perf_counter() - start:.1f} s")
+    results = {}
+    for stage in stages:
+        # The binary stage separates attacks from benign rows, the multiclass stage only sees attacks
+        stage_cache = cache.binary() if stage == 'binary' else cache.attacks()
+        if method == 'hyperband':
+            result = hyperband(stage_cache, stage, grids[stage], scoring, min_estimators, max_estimators, factor,
+                               seed, n_jobs)
+        else:
+            result = successive_halving(stage_cache, stage, grid_candidates(grids[stage]), scoring, min_estimators,
+                                        max_estimators, factor, seed, n_jobs)
+        results[stage] = {method: result.to_dict()}
+        print(f"{stage}: best {scoring} {result.score:.4f} with {result.params}, {result.n_estimators} estimators, "
+              f"{result.fits} fits in {result.seconds:.1f} s")
+        if compare_grid:
+            baseline = grid_search(stage_cache, stage, grids[stage], scoring, max_estimators, seed, n_jobs)
+            results[stage]['grid'] = baseline.to_dict()
+            print(f"{stage} grid search: best {scoring} {baseline.score:.4f} with {baseline.params}, "
+                  f"{baseline.fits} fits in {baseline.seconds:.1f} s ({baseline.seconds / result.seconds:.1f}x)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tune the two classifier stages with successive halving.')
+    parser.add_argument('dataset_directory', help='Output of dataset_builder.py (X.npy, y.npy, dataset.json)')
+    parser.add_argument('--stage', choices=STAGES + ('both',), default='both', help='Stage to tune (default: both)')
+    parser.add_argument('--method', choices=('halving', 'hyperband'), default='halving',
+                        help='Successive halving over the whole grid, or Hyperband brackets (default: halving)')
+    parser.add_argument('--grid', default=None,
+                        help='JSON file with {"binary": {param: [values]}, "multiclass": {...}} grids')
+    parser.add_argument('--scoring', default='f1_macro', help='sklearn scorer name (default: f1_macro)')
+    parser.add_argument('--folds', type=int, default=5, help='Cross-validation folds (default: 5)')
+    parser.add_argument('--min-estimators', type=int, default=10, help='Ensemble size in the first rung (default: 10)')
+    parser.add_argument('--max-estimators', type=int, default=300, help='Largest ensemble size (default: 300)')
+    parser.add_argument('--factor', type=int, default=3, help='Candidates kept 1/factor per rung (default: 3)')
+    parser.add_argument('--cache-directory', default=None, help='Keep the scaled fold matrices here between runs')
+    parser.add_argument('--compare-grid', action='store_true',
+                        help='Also run the exhaustive grid at --max-estimators on the same folds (slow)')
+    parser.add_argument('--n-jobs', type=int, default=None, help='Threads per random forest fit')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    parser.add_argument('--output', default=None, help='Write the results as JSON')
+    args = parser.parse_args()
+
+    grids = None
+    if args.grid:
+        with open(args.grid) as file:
+            grids = dict({'binary': BINARY_GRID, 'multiclass': MULTICLASS_GRID}, **json.load(file))
+    X, y, _ = load_dataset(args.dataset_directory)
+    stages = STAGES if args.stage == 'both' else (args.stage,)
+    results = tune(X, y, stages, grids, args.method, args.scoring, args.folds, args.min_estimators,
+                   args.max_estimators, args.factor, args.seed, args.cache_directory, args.compare_grid, args.n_jobs)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
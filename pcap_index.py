@@ -0,0 +1,117 @@
+import argparse
+import os
+import struct
+
+import numpy as np
+
+from pcap_reader import CaptureReader
+
+INDEX_MAGIC = b'PCAPIDX1'
+# magic, capture size, capture mtime, checkpoint step in bytes, number of checkpoints
+INDEX_HEADER = struct.Struct('<8sQdQQ')
+CHECKPOINT_DTYPE = np.dtype([('time', '<f8'), ('offset', '<u8')])
+DEFAULT_STEP = 4 * 1024 * 1024
+
+
+class CaptureIndex:
+    def __init__(self, pcap_file, checkpoints, step=DEFAULT_STEP, file_size=None, mtime=None):
+        self.pcap_file = pcap_file
+        self.checkpoints = checkpoints
+        self.step = step
+        stat = os.stat(pcap_file)
+        self.file_size = stat.st_size if file_size is None else file_size
+        self.mtime = stat.st_mtime if mtime is None else mtime
+
+    @staticmethod
+    def index_path(pcap_file):
+        return pcap_file + '.idx'
+
+    @classmethod
+    def build(cls, pcap_file, step=DEFAULT_STEP):
+        # One header-only scan, keeping the (timestamp, offset) of the first record after every step bytes
+        reader = CaptureReader(pcap_file)
+        times = []
+        offsets = []
+        next_offset = 0
+        for timestamp, _, _, _, offset in reader.records(skip_data=True):
+            if offset >= next_offset:
+                times.append(timestamp)
+                offsets.append(offset)
+                next_offset = offset + step
+        if reader.late_interfaces:
+            # Packet offsets are not valid starting points, only the first one can be used
+            times, offsets = times[:1], offsets[:1]
+        checkpoints = np.empty(len(times), dtype=CHECKPOINT_DTYPE)
+        checkpoints['time'] = times
+        checkpoints['offset'] = offsets
+        return cls(pcap_file, checkpoints, step)
+
+    @classmethod
+    def load(cls, pcap_file):
+        # Returns None if there is no sidecar or the capture changed since it was written
+        try:
+            with open(cls.index_path(pcap_file), 'rb') as f:
+                magic, file_size, mtime, step, count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+                checkpoints = np.fromfile(f, dtype=CHECKPOINT_DTYPE, count=count)
+        except (OSError, struct.error):
+            return None
+        stat = os.stat(pcap_file)
+        if magic != INDEX_MAGIC or file_size != stat.st_size or mtime != stat.st_mtime or len(checkpoints) != count:
+            return None
+        return cls(pcap_file, checkpoints, step, file_size, mtime)
+
+    @classmethod
+    def load_or_build(cls, pcap_file, step=DEFAULT_STEP):
+        index = cls.load(pcap_file)
+        if index is None:
+            index = cls.build(pcap_file, step)
+            try:
+                index.save()
+            except OSError:
+                # Read-only capture directory, keep the index in memory only
+                pass
+        return index
+
+    def save(self):
+        with open(self.index_path(self.pcap_file), 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, self.file_size, self.mtime, self.step, len(self.checkpoints)))
+            self.checkpoints.tofile(f)
+
+    def split(self, parts):
+        # Byte ranges of roughly equal size that start on record boundaries; the last one is open-ended
+        offsets = self.checkpoints['offset']
+        if len(offsets) == 0:
+            return [(None, None)]
+        targets = np.linspace(0, self.file_size, parts + 1)[1:-1]
+        cuts = np.unique(np.searchsorted(offsets, targets))
+        starts = [int(offsets[0])] + [int(offsets[i]) for i in cuts if 0 < i < len(offsets)]
+        return [(start, stop) for start, stop in zip(starts, starts[1:] + [None])]
+
+    def time_range(self, start_time, end_time):
+        # Byte range holding all records in [start_time, end_time]; one checkpoint of margin
+        # on each side keeps slightly out-of-order records inside the range
+        times = self.checkpoints['time']
+        offsets = self.checkpoints['offset']
+        if len(times) == 0:
+            return None, None
+        first = max(int(np.searchsorted(times, start_time, side='right')) - 2, 0)
+        last = int(np.searchsorted(times, end_time, side='right')) + 1
+        stop = int(offsets[last]) if last < len(offsets) else None
+        return int(offsets[first]), stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build (timestamp, byte offset) sidecar indexes for capture files.')
+    parser.add_argument('pcap_files', nargs='+', help='Capture files to index')
+    parser.add_argument('--step', type=int, default=DEFAULT_STEP,
+                        help=f'Bytes between checkpoints (default: {DEFAULT_STEP})')
+    args = parser.parse_args()
+
+    for pcap_file in args.pcap_files:
+        index = CaptureIndex.build(pcap_file, args.step)
+        index.save()
+        print(f"Indexed {pcap_file}: {len(index.checkpoints)} checkpoints")
+
+
+if __name__ == '__main__':
+    main()
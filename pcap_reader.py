@@ -0,0 +1,351 @@
+import gzip
+import io
+import mmap
+import os
+import socket
+import struct
+import time
+
+# Capture file magic numbers
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+# pcapng block types
+PCAPNG_IDB = 0x00000001
+PCAPNG_OPB = 0x00000002
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+
+# Link-layer types we can fast-path down to the IP header
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+# DLT_RAW as written by BSD (12) and OpenBSD (14) libpcap, both raw IP like LINKTYPE_RAW
+LINKTYPE_RAW_BSD = 12
+LINKTYPE_RAW_OPENBSD = 14
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPV6_EXT_HEADERS = (0, 43, 60)
+IPV6_FRAGMENT = 44
+
+# Capture files picked up from a directory, optionally compressed
+CAPTURE_EXTENSIONS = ('.pcap', '.pcapng')
+COMPRESSED_EXTENSIONS = ('.gz', '.zst')
+
+
+class CaptureFormatError(Exception):
+    pass
+
+
+def split_capture_name(filename):
+    # 'x.pcapng.zst' -> ('x', '.pcapng', '.zst'); the capture extension is empty if it is not a known one
+    base, compression = os.path.splitext(filename)
+    if compression not in COMPRESSED_EXTENSIONS:
+        base, compression = filename, ''
+    stem, extension = os.path.splitext(base)
+    if extension not in CAPTURE_EXTENSIONS:
+        return base, '', compression
+    return stem, extension, compression
+
+
+def capture_base_name(filename):
+    # Name of the output files: without the capture and compression extensions
+    base, extension, _ = split_capture_name(os.path.basename(filename))
+    return base if extension else os.path.splitext(base)[0]
+
+
+def is_capture(filename):
+    return split_capture_name(filename)[1] != ''
+
+
+def is_compressed(path):
+    return split_capture_name(path)[2] != ''
+
+
+def open_capture(path):
+    # Compressed captures are decompressed while they are read, without a temporary file; the
+    # zstandard package is only needed for .zst files
+    compression = split_capture_name(path)[2]
+    if compression == '.gz':
+        return gzip.open(path, 'rb')
+    if compression == '.zst':
+        import zstandard
+        return ForwardSeekFile(io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')),
+                                                 buffer_size=1 << 20))
+    # Plain files are memory-mapped, empty or unmappable ones are read as a stream
+    f = open(path, 'rb')
+    if os.fstat(f.fileno()).st_size == 0:
+        return f
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return f
+    f.close()
+    return mm
+
+
+class ForwardSeekFile:
+    # Stream that can only move forward: seek() reads and discards up to the target position
+    def __init__(self, f):
+        self.f = f
+        self.position = 0
+
+    def read(self, n):
+        data = self.f.read(n)
+        self.position += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        target = offset if whence == 0 else self.position + offset
+        if target < self.position:
+            raise CaptureFormatError(f"Cannot seek back to {target} in a compressed capture")
+        while self.position < target and self.read(min(target - self.position, 1 << 20)):
+            pass
+        return self.position
+
+    def close(self):
+        self.f.close()
+
+
+class FollowFile:
+    # Reader for a capture that is still being written: read(n) waits until n bytes are available
+    def __init__(self, path, poll_interval=0.2):
+        self.f = open(path, 'rb')
+        self.poll_interval = poll_interval
+
+    def read(self, n):
+        data = self.f.read(n)
+        while len(data) < n:
+            time.sleep(self.poll_interval)
+            data += self.f.read(n - len(data))
+        return data
+
+    def seek(self, offset, whence=0):
+        return self.f.seek(offset, whence)
+
+    def close(self):
+        self.f.close()
+
+
+class CaptureReader:
+    def __init__(self, path, follow=False):
+        self.path = path
+        self.follow = follow
+        self.first_time = None
+        # Set when a pcapng section or interface is declared after the first packet,
+        # in which case reading cannot start at an arbitrary packet offset
+        self.late_interfaces = False
+
+    def records(self, start=None, stop=None, skip_data=False):
+        # Yields (timestamp, linktype, data, orig_len, offset) for every packet record,
+        # optionally limited to records starting in the byte range [start, stop)
+        f = FollowFile(self.path) if self.follow else open_capture(self.path)
+        try:
+            head = f.read(4)
+            if len(head) < 4:
+                return
+            if struct.unpack('<I', head)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS) or \
+                    struct.unpack('>I', head)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                records = self._pcap_records(f, head, start, stop, skip_data)
+            elif struct.unpack('<I', head)[0] == PCAPNG_SHB:
+                records = self._pcapng_records(f, head, start, stop)
+            else:
+                raise CaptureFormatError(f"Unknown capture format in {self.path}")
+            for record in records:
+                if self.first_time is None:
+                    self.first_time = record[0]
+                yield record
+        finally:
+            f.close()
+
+    def _pcap_records(self, f, head, start, stop, skip_data):
+        if struct.unpack('<I', head)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            endian = '<'
+        else:
+            endian = '>'
+        scale = 1e-9 if struct.unpack(endian + 'I', head)[0] == PCAP_MAGIC_NS else 1e-6
+        header = f.read(20)
+        if len(header) < 20:
+            raise CaptureFormatError(f"Truncated pcap header in {self.path}")
+        linktype = struct.unpack(endian + 'HHiIII', header)[5] & 0x0fffffff
+        record_header = struct.Struct(endian + 'IIII')
+        offset = 24
+        if start is not None and start > offset:
+            f.seek(start)
+            offset = start
+        while stop is None or offset < stop:
+            hdr = f.read(16)
+            if len(hdr) < 16:
+                return
+            ts_sec, ts_frac, caplen, orig_len = record_header.unpack(hdr)
+            if skip_data:
+                f.seek(caplen, 1)
+                data = None
+            else:
+                data = f.read(caplen)
+                if len(data) < caplen:
+                    return
+            yield ts_sec + ts_frac * scale, linktype, data, orig_len, offset
+            offset += 16 + caplen
+
+    def _pcapng_records(self, f, head, start, stop):
+        endian = '<'
+        interfaces = []
+        offset = 0
+        last_time = 0.0
+        seen_packets = False
+        block = head + f.read(4)
+        while len(block) == 8 and (stop is None or offset < stop):
+            if struct.unpack('<I', block[:4])[0] == PCAPNG_SHB:
+                # A new section may switch byte order and resets the interface list
+                magic = f.read(4)
+                if len(magic) < 4:
+                    return
+                if struct.unpack('<I', magic)[0] == PCAPNG_BYTE_ORDER_MAGIC:
+                    endian = '<'
+                elif struct.unpack('>I', magic)[0] == PCAPNG_BYTE_ORDER_MAGIC:
+                    endian = '>'
+                else:
+                    raise CaptureFormatError(f"Bad pcapng byte-order magic in {self.path}")
+                interfaces = []
+                total_len = struct.unpack(endian + 'I', block[4:])[0]
+                body = magic + f.read(total_len - 12)
+            else:
+                total_len = struct.unpack(endian + 'I', block[4:])[0]
+                body = f.read(total_len - 8)
+            if total_len < 12 or len(body) < total_len - 8:
+                return
+            block_type = struct.unpack(endian + 'I', block[:4])[0]
+
+            if block_type in (PCAPNG_EPB, PCAPNG_OPB, PCAPNG_SPB):
+                seen_packets = True
+                if start is not None and offset < start:
+                    # Section and interface blocks precede the packets, so jump straight to start
+                    f.seek(start)
+                    offset = start
+                    block = f.read(8)
+                    continue
+            elif seen_packets and block_type in (PCAPNG_SHB, PCAPNG_IDB):
+                self.late_interfaces = True
+
+            if block_type == PCAPNG_IDB:
+                linktype = struct.unpack_from(endian + 'H', body)[0]
+                interfaces.append((linktype, *self._idb_time_options(body, endian)))
+            elif block_type == PCAPNG_EPB or block_type == PCAPNG_OPB:
+                if block_type == PCAPNG_EPB:
+                    if_id, ts_high, ts_low, caplen, orig_len = struct.unpack_from(endian + 'IIIII', body)
+                else:
+                    if_id, _, ts_high, ts_low, caplen, orig_len = struct.unpack_from(endian + 'HHIIII', body)
+                linktype, resolution, ts_offset = interfaces[if_id]
+                last_time = ((ts_high << 32) | ts_low) * resolution + ts_offset
+                yield last_time, linktype, body[20:20 + caplen], orig_len, offset
+            elif block_type == PCAPNG_SPB:
+                # Simple packet blocks carry no timestamp, reuse the previous one
+                orig_len = struct.unpack_from(endian + 'I', body)[0]
+                caplen = min(orig_len, total_len - 16)
+                yield last_time, interfaces[0][0], body[4:4 + caplen], orig_len, offset
+
+            offset += total_len
+            block = f.read(8)
+
+    @staticmethod
+    def _idb_time_options(body, endian):
+        resolution = 1e-6
+        ts_offset = 0
+        pos = 8
+        while pos + 4 <= len(body) - 4:
+            code, length = struct.unpack_from(endian + 'HH', body, pos)
+            if code == 0:
+                break
+            value = body[pos + 4:pos + 4 + length]
+            if code == 9 and length >= 1:
+                # if_tsresol: power of 10 or, with the top bit set, power of 2
+                resolution = 2.0 ** -(value[0] & 0x7f) if value[0] & 0x80 else 10.0 ** -value[0]
+            elif code == 14 and length >= 8:
+                ts_offset = struct.unpack(endian + 'q', value[:8])[0]
+            pos += 4 + ((length + 3) & ~3)
+        return resolution, ts_offset
+
+
+def ip_layer(data, linktype):
+    # Returns (ip_version, src, dst, proto, payload_offset, payload_end, first_fragment) or None
+    if linktype == LINKTYPE_ETHERNET:
+        if len(data) < 14:
+            return None
+        ethertype = (data[12] << 8) | data[13]
+        off = 14
+        while ethertype in ETHERTYPE_VLAN:
+            if len(data) < off + 4:
+                return None
+            ethertype = (data[off + 2] << 8) | data[off + 3]
+            off += 4
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if len(data) < 16:
+            return None
+        ethertype = (data[14] << 8) | data[15]
+        off = 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        if len(data) < 20:
+            return None
+        ethertype = (data[0] << 8) | data[1]
+        off = 20
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_RAW_BSD, LINKTYPE_RAW_OPENBSD, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        if not data:
+            return None
+        ethertype = ETHERTYPE_IPV4 if data[0] >> 4 == 4 else ETHERTYPE_IPV6
+        off = 0
+    elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        if len(data) < 5:
+            return None
+        ethertype = ETHERTYPE_IPV4 if data[4] >> 4 == 4 else ETHERTYPE_IPV6
+        off = 4
+    else:
+        raise CaptureFormatError(f"Unsupported link-layer type {linktype}")
+
+    if ethertype == ETHERTYPE_IPV4:
+        if len(data) < off + 20 or data[off] >> 4 != 4:
+            return None
+        ihl = (data[off] & 0x0f) * 4
+        total_len = (data[off + 2] << 8) | data[off + 3]
+        frag = ((data[off + 6] & 0x1f) << 8) | data[off + 7]
+        end = min(off + total_len, len(data))
+        return 4, data[off + 12:off + 16], data[off + 16:off + 20], data[off + 9], off + ihl, end, frag == 0
+    if ethertype == ETHERTYPE_IPV6:
+        if len(data) < off + 40 or data[off] >> 4 != 6:
+            return None
+        payload_len = (data[off + 4] << 8) | data[off + 5]
+        proto = data[off + 6]
+        src = data[off + 8:off + 24]
+        dst = data[off + 24:off + 40]
+        end = min(off + 40 + payload_len, len(data))
+        pos = off + 40
+        first_fragment = True
+        while proto in IPV6_EXT_HEADERS or proto == IPV6_FRAGMENT:
+            if pos + 8 > end:
+                return None
+            if proto == IPV6_FRAGMENT:
+                first_fragment = ((data[pos + 2] << 8) | data[pos + 3]) >> 3 == 0
+                proto = data[pos]
+                pos += 8
+            else:
+                proto, pos = data[pos], pos + (data[pos + 1] + 1) * 8
+        return 6, src, dst, proto, pos, end, first_fragment
+    return None
+
+
+def format_address(address):
+    if len(address) == 4:
+        return socket.inet_ntoa(address)
+    return socket.inet_ntop(socket.AF_INET6, address)
@@ -0,0 +1,160 @@
+import csv
+import struct
+from collections import Counter, namedtuple
+
+from pcap_reader import CaptureReader, IPPROTO_UDP, format_address, ip_layer
+
+PFCP_PORT = 8805
+
+# Mapping PFCP message types to readable names
+pfcp_msg_type_map = {
+    1: "heartbeat_request",
+    2: "heartbeat_response",
+    3: "pfd_management_request",
+    4: "pfd_management_response",
+    5: "association_setup_request",
+    6: "association_setup_response",
+    7: "association_update_request",
+    8: "association_update_response",
+    9: "association_release_request",
+    10: "association_release_response",
+    11: "version_not_supported_response",
+    12: "node_report_request",
+    13: "node_report_response",
+    14: "session_set_deletion_request",
+    15: "session_set_deletion_response",
+    50: "session_establishment_request",
+    51: "session_establishment_response",
+    52: "session_modification_request",
+    53: "session_modification_response",
+    54: "session_deletion_request",
+    55: "session_deletion_response",
+    56: "session_report_request",
+    57: "session_report_response",
+}
+
+# Fields of the original `tshark -T fields` export; tests/test_pfcp_decoder.py checks both decoders agree on them
+TSHARK_FIELDS = ['frame.time_relative', 'ip.src', 'ip.dst', 'pfcp.msg_type', 'frame.len']
+
+# Information element types used by the session and latency features
+IE_CAUSE = 19
+IE_F_SEID = 57
+CAUSE_REQUEST_ACCEPTED = 1
+
+# ie_offset/ie_end delimit the message's information elements inside the frame data
+PfcpHeader = namedtuple('PfcpHeader', ['version', 's_flag', 'msg_type', 'seid', 'seq', 'length', 'ie_offset', 'ie_end'])
+PfcpFrame = namedtuple('PfcpFrame', ['time', 'src', 'dst', 'frame_len', 'messages', 'offset', 'data'])
+
+
+def parse_pfcp(payload, off, end):
+    # Decodes the headers of all PFCP messages in one UDP payload, following the FO flag
+    messages = []
+    while off + 8 <= end:
+        flags = payload[off]
+        msg_type = payload[off + 1]
+        length = (payload[off + 2] << 8) | payload[off + 3]
+        if flags & 0x01:
+            if off + 16 > end or length < 12:
+                break
+            seid = struct.unpack_from('!Q', payload, off + 4)[0]
+            seq = int.from_bytes(payload[off + 12:off + 15], 'big')
+            ie_offset = off + 16
+        else:
+            if length < 4:
+                break
+            seid = None
+            seq = int.from_bytes(payload[off + 4:off + 7], 'big')
+            ie_offset = off + 8
+        ie_end = min(off + 4 + length, end)
+        messages.append(PfcpHeader(flags >> 5, flags & 0x01, msg_type, seid, seq, length, ie_offset, ie_end))
+        # FO (follow on) flag: another PFCP message follows in the same datagram
+        if not flags & 0x04:
+            break
+        off += 4 + length
+    return messages
+
+
+def find_ie(data, message, ie_type):
+    # Returns the value of the first top-level information element of ie_type in a message, or None
+    pos = message.ie_offset
+    while pos + 4 <= message.ie_end:
+        current = (data[pos] << 8) | data[pos + 1]
+        length = (data[pos + 2] << 8) | data[pos + 3]
+        if current == ie_type:
+            return data[pos + 4:min(pos + 4 + length, message.ie_end)]
+        pos += 4 + length
+    return None
+
+
+def f_seid(data, message):
+    value = find_ie(data, message, IE_F_SEID)
+    if value is None or len(value) < 9:
+        return None
+    return struct.unpack_from('!Q', value, 1)[0]
+
+
+def cause(data, message):
+    value = find_ie(data, message, IE_CAUSE)
+    return value[0] if value else None
+
+
+class PfcpDecoder:
+    def __init__(self, pcap_file, port=PFCP_PORT):
+        self.pcap_file = pcap_file
+        self.port = port
+        self.reader = CaptureReader(pcap_file)
+        self.stats = Counter()
+
+    @property
+    def first_time(self):
+        return self.reader.first_time
+
+    def frames(self, start=None, stop=None):
+        # Yields one PfcpFrame per UDP datagram to/from the PFCP port, with absolute timestamps
+        decode = self.decode
+        for record in self.reader.records(start, stop):
+            frame = decode(*record)
+            if frame is not None:
+                yield frame
+
+    def decode(self, timestamp, linktype, data, orig_len, offset=None):
+        # Decodes one captured frame; returns None (and counts the reason) if it carries no PFCP
+        stats = self.stats
+        stats['frames'] += 1
+        ip = ip_layer(data, linktype)
+        if ip is None or ip[3] != IPPROTO_UDP:
+            stats['not_udp'] += 1
+            return None
+        version, src, dst, _, off, end, first_fragment = ip
+        if not first_fragment or off + 8 > end:
+            stats['fragmented'] += 1
+            return None
+        sport = (data[off] << 8) | data[off + 1]
+        dport = (data[off + 2] << 8) | data[off + 3]
+        if sport != self.port and dport != self.port:
+            stats['not_pfcp'] += 1
+            return None
+        messages = parse_pfcp(data, off + 8, end)
+        if not messages:
+            stats['malformed'] += 1
+            return None
+        stats['pfcp_frames'] += 1
+        stats['pfcp_messages'] += len(messages)
+        return PfcpFrame(timestamp, format_address(src), format_address(dst), orig_len, messages, offset, data)
+
+    def write_tshark_csv(self, csv_file):
+        # Writes the same columns and quoting as `tshark -T fields -E header=y -E quote=d`
+        with open(csv_file, 'w', newline='') as file:
+            writer = csv.writer(file, quoting=csv.QUOTE_ALL, lineterminator='\n')
+            writer.writerow(TSHARK_FIELDS)
+            for frame in self.frames():
+                # tshark only fills ip.src/ip.dst for IPv4
+                src = frame.src if ':' not in frame.src else ''
+                dst = frame.dst if ':' not in frame.dst else ''
+                writer.writerow([
+                    f'{frame.time - self.first_time:.9f}',
+                    src,
+                    dst,
+                    ','.join(str(m.msg_type) for m in frame.messages),
+                    frame.frame_len,
+                ])
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from pfcp_windows import WindowCounter
+
+VERSION_NOT_SUPPORTED_RESPONSE = 11
+
+# Every PFCP request type is answered by the next type number; Version Not Supported answers any request
+REQUEST_TYPES = (1, 3, 5, 7, 9, 12, 14, 50, 52, 54, 56)
+RESPONSE_TYPES = {request + 1: request for request in REQUEST_TYPES}
+
+# Response times are kept as a histogram per window so that resampled and sliding windows can be
+# summed exactly; buckets grow by 2**(1/4), i.e. percentiles are accurate to about 19%
+LATENCY_MIN = 1e-5
+BUCKETS_PER_DOUBLING = 4
+N_BUCKETS = 96
+BUCKET_EDGES = LATENCY_MIN * 2.0 ** (np.arange(1, N_BUCKETS + 1) / BUCKETS_PER_DOUBLING)
+PERCENTILES = (50, 90, 99)
+
+LATENCY_COLUMNS = ['answered_requests', 'unanswered_requests', 'retransmissions', 'unmatched_responses',
+                   'response_time_sum']
+ANSWERED, UNANSWERED, RETRANSMISSIONS, UNMATCHED, RESPONSE_TIME_SUM = range(len(LATENCY_COLUMNS))
+HISTOGRAM_COLUMNS = [f'response_time_bucket_{i}' for i in range(N_BUCKETS)]
+
+
+class LatencyMatcher:
+    # Pairs requests with their responses by (requesting node, responding node, sequence number).
+    # Pending requests sit in an insertion-ordered dict, so expiring the oldest ones is O(1) per message;
+    # a request without a response after `timeout` seconds is counted as unanswered in its own window.
+    def __init__(self, interval, timeout=10.0):
+        self.timeout = timeout
+        self.pending = OrderedDict()
+        self.features = WindowCounter(interval, columns=LATENCY_COLUMNS + HISTOGRAM_COLUMNS, dtype=np.float64)
+        self.last_time = None
+
+    def __len__(self):
+        return len(self.pending)
+
+    def update(self, timestamp, frame, message):
+        if self.last_time is None:
+            # Anchor the feature windows on the same t0 as the message counts
+            self.features.add_value(timestamp, ANSWERED, 0)
+        if self.last_time is None or timestamp > self.last_time:
+            self.last_time = timestamp
+            self._expire(timestamp - self.timeout)
+        msg_type = message.msg_type
+        if msg_type in RESPONSE_TYPES or msg_type == VERSION_NOT_SUPPORTED_RESPONSE:
+            request = self.pending.get((frame.dst, frame.src, message.seq))
+            if request is None or (msg_type != VERSION_NOT_SUPPORTED_RESPONSE
+                                   and request[1] != RESPONSE_TYPES[msg_type]):
+                self.features.add_value(timestamp, UNMATCHED, 1)
+                return
+            del self.pending[(frame.dst, frame.src, message.seq)]
+            sent = request[0]
+            # Latency is measured from the first transmission, so retransmitted requests show up as slow
+            latency = max(timestamp - sent, 0.0)
+            self.features.add_value(sent, ANSWERED, 1)
+            self.features.add_value(sent, RESPONSE_TIME_SUM, latency)
+            bucket = min(int(np.searchsorted(BUCKET_EDGES, latency)), N_BUCKETS - 1)
+            self.features.add_value(sent, len(LATENCY_COLUMNS) + bucket, 1)
+        elif msg_type in RESPONSE_TYPES.values():
+            key = (frame.src, frame.dst, message.seq)
+            if key in self.pending:
+                self.features.add_value(timestamp, RETRANSMISSIONS, 1)
+            else:
+                self.pending[key] = (timestamp, msg_type)
+
+    def _expire(self, deadline):
+        pending = self.pending
+        while pending:
+            key, (sent, _) = next(iter(pending.items()))
+            if sent >= deadline:
+                break
+            del pending[key]
+            self.features.add_value(sent, UNANSWERED, 1)
+
+    def to_frame(self, windows, start=None, stop=None):
+        # Feature table for the same windows as `windows`, the message count counter of the capture.
+        # Requests still pending at the end of the capture and younger than the timeout are left out.
+        if self.last_time is not None:
+            self._expire(self.last_time - self.timeout)
+        start, stop = windows.bounds(start, stop)
+        features = self.features
+        if windows.interval != features.interval or windows.length != features.length:
+            features = features.slide(windows.length, windows.interval)
+        df = features.to_frame(start, stop)
+        histogram = df[HISTOGRAM_COLUMNS].to_numpy()
+        df = df.drop(columns=HISTOGRAM_COLUMNS)
+        counts = LATENCY_COLUMNS[:RESPONSE_TIME_SUM]
+        df[counts] = df[counts].round().astype(np.int64)
+        answered = df['answered_requests'].to_numpy()
+        # Windows without answered requests get 0 rather than NaN so the table stays usable for the models
+        df['response_time_mean'] = np.divide(df.pop('response_time_sum').to_numpy(), answered,
+                                             out=np.zeros(len(df)), where=answered > 0)
+        cumulative = np.cumsum(histogram, axis=1)
+        for q in PERCENTILES:
+            # Upper edge of the bucket holding the q-th percentile
+            bucket = np.minimum((cumulative < cumulative[:, -1:] * q / 100).sum(axis=1), N_BUCKETS - 1)
+            df[f'response_time_p{q}'] = np.where(answered > 0, BUCKET_EDGES[bucket], 0.0)
+        return df
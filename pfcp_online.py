@@ -0,0 +1,263 @@
+import argparse
+import json
+import pickle
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from pcap_reader import CaptureReader
+from pfcp_decoder import PfcpDecoder
+from pfcp_windows import MSG_TYPE_COLUMNS, MSG_TYPE_INDEX, RollingWindow
+
+VERDICT_LABELS = {0: 'normal', 1: 'del_att', 2: 'mod_att', 3: 'est_att'}
+POLICIES = ('block', 'drop-oldest', 'drop-newest')
+
+
+def load_model(path):
+    # A models/inference.py artifact (.npz), or any pickled estimator with predict(), e.g. the fitted
+    # scaler + ConditionalClassifier pipeline
+    if path.endswith('.npz'):
+        from models.inference import load_artifact
+        return load_artifact(path)
+    try:
+        import joblib
+        return joblib.load(path)
+    except ImportError:
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+
+class OnlineWindows:
+    # Event-time windows over a live stream: counts go into the open bin of `hop` seconds,
+    # and every closed bin emits the window of `interval` seconds ending with it. With align, bins start
+    # on multiples of hop since the epoch instead of at the first message.
+    def __init__(self, interval, hop=None, align=False):
+        self.interval = interval
+        self.align = align
+        self.hop = hop or interval
+        if interval % self.hop:
+            raise ValueError(f"Interval {interval} is not a multiple of hop {self.hop}")
+        self.rolling = RollingWindow(interval // self.hop)
+        self.bin_start = None
+        self.current = np.zeros(len(MSG_TYPE_COLUMNS), dtype=np.int64)
+
+    def add(self, timestamp, msg_type):
+        if self.bin_start is None:
+            self.bin_start = timestamp // self.hop * self.hop if self.align else timestamp
+        closed = self.advance(timestamp)
+        column = MSG_TYPE_INDEX[msg_type]
+        if column >= 0:
+            self.current[column] += 1
+        return closed
+
+    def advance(self, now):
+        # Closes every bin that ended before `now`; returns [(window_start, window_end, counts)]
+        closed = []
+        if self.bin_start is None:
+            return closed
+        while now >= self.bin_start + self.hop:
+            bin_end = self.bin_start + self.hop
+            counts = self.rolling.push(self.current)
+            if counts is not None:
+                closed.append((bin_end - self.interval, bin_end, counts))
+            self.current = np.zeros_like(self.current)
+            self.bin_start = bin_end
+        return closed
+
+
+class MicroBatchScorer(threading.Thread):
+    # Scores closed windows in batches of up to batch_size, waiting at most max_wait for a batch to fill
+    def __init__(self, model, windows, output, batch_size=64, max_wait=0.05):
+        super().__init__(daemon=True)
+        self.model = model
+        self.windows = windows
+        self.output = output
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.latencies = []
+        self.scored = 0
+        self.columns = list(getattr(model, 'feature_names_in_', MSG_TYPE_COLUMNS))
+
+    def run(self):
+        while True:
+            item = self.windows.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.windows.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self.score(batch)
+            if stop:
+                return
+
+    def score(self, batch):
+        X = pd.DataFrame(np.vstack([counts for _, _, counts, _ in batch]), columns=MSG_TYPE_COLUMNS)
+        X = X.reindex(columns=self.columns, fill_value=0)
+        verdicts = np.asarray(self.model.predict(X)).astype(int)
+        done = time.perf_counter()
+        for (start, end, _, closed_at), verdict in zip(batch, verdicts):
+            latency = done - closed_at
+            self.latencies.append(latency)
+            self.output.write(json.dumps({
+                'window_start': round(float(start), 6),
+                'window_end': round(float(end), 6),
+                'verdict': int(verdict),
+                'label': VERDICT_LABELS.get(int(verdict), 'unknown'),
+                'latency_ms': round(latency * 1000, 3),
+            }) + '\n')
+        self.output.flush()
+        self.scored += len(batch)
+
+
+def live_source(iface, bpf_filter, records):
+    from scapy.all import AsyncSniffer, conf
+    # Raw frames only; decoding happens in the windowing loop like for capture files. The link type comes
+    # from the capture socket, e.g. cooked frames on "any" or raw IP on tun interfaces.
+    sock = conf.L2listen(iface=iface, filter=bpf_filter)
+    linktype = conf.l2types.layer2num.get(getattr(sock, 'LL', None))
+    if linktype is None:
+        sock.close()
+        raise ValueError(f"Unsupported link layer {getattr(sock, 'LL', None)} on {iface}")
+    sniffer = AsyncSniffer(opened_socket=sock, store=False,
+                           prn=lambda pkt: records.put((float(pkt.time), linktype, bytes(pkt), len(pkt))))
+    sniffer.start()
+    return sniffer
+
+
+def file_source(path, records, follow=False, speed=None):
+    # Feeds a capture file; with speed > 0 records are released at `speed` times the recorded rate
+    reader = CaptureReader(path, follow=follow)
+    wall_start = time.perf_counter()
+    for timestamp, linktype, data, orig_len, _ in reader.records():
+        if speed:
+            delay = (timestamp - reader.first_time) / speed - (time.perf_counter() - wall_start)
+            if delay > 0:
+                time.sleep(delay)
+        records.put((timestamp, linktype, data, orig_len))
+    records.put(None)
+
+
+class OnlineDetector:
+    def __init__(self, model, interval=120, hop=None, batch_size=64, max_wait=0.05, queue_size=1000,
+                 policy='drop-oldest', grace=2.0, wall_clock=True, output=sys.stdout):
+        self.windows = OnlineWindows(interval, hop)
+        self.decoder = PfcpDecoder(None)
+        self.records = queue.Queue(maxsize=100000)
+        self.pending = queue.Queue(maxsize=queue_size)
+        self.scorer = MicroBatchScorer(model, self.pending, output, batch_size, max_wait)
+        self.policy = policy
+        self.grace = grace
+        # Live sources close idle windows on the wall clock; replays only on packet time
+        self.wall_clock = wall_clock
+        self.dropped = 0
+
+    def submit(self, closed):
+        for start, end, counts in closed:
+            item = (start, end, counts, time.perf_counter())
+            if self.policy == 'block':
+                self.pending.put(item)
+                continue
+            try:
+                self.pending.put_nowait(item)
+            except queue.Full:
+                # Scoring fell behind: keep either the newest or the oldest windows
+                self.dropped += 1
+                if self.policy == 'drop-oldest':
+                    try:
+                        self.pending.get_nowait()
+                    except queue.Empty:
+                        pass
+                    self.pending.put_nowait(item)
+
+    def run(self):
+        self.scorer.start()
+        try:
+            while True:
+                try:
+                    record = self.records.get(timeout=0.5)
+                except queue.Empty:
+                    if self.wall_clock:
+                        self.submit(self.windows.advance(time.time() - self.grace))
+                    continue
+                if record is None:
+                    # End of a replayed file: close the bin that is still open
+                    if self.windows.bin_start is not None:
+                        self.submit(self.windows.advance(self.windows.bin_start + self.windows.hop))
+                    break
+                frame = self.decoder.decode(*record)
+                if frame is None:
+                    continue
+                for message in frame.messages:
+                    self.submit(self.windows.add(frame.time, message.msg_type))
+        except KeyboardInterrupt:
+            pass
+        self.pending.put(None)
+        self.scorer.join()
+        self.report()
+
+    def report(self):
+        latencies = np.array(self.scorer.latencies) * 1000
+        if len(latencies):
+            print(f"Scored {self.scorer.scored} windows, dropped {self.dropped}, latency ms "
+                  f"p50={np.percentile(latencies, 50):.2f} p99={np.percentile(latencies, 99):.2f} "
+                  f"max={latencies.max():.2f}", file=sys.stderr)
+        else:
+            print(f"Scored 0 windows, dropped {self.dropped}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score PFCP traffic window by window as it arrives.')
+    parser.add_argument('--model', required=True, help='Model artifact (.npz from models/inference.py) or pickled model with predict() over the window counts')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--iface', help='Capture live from this interface')
+    source.add_argument('--follow', help='Read a pcap file that is still being written')
+    source.add_argument('--replay', help='Replay a capture file for benchmarking')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Replay speed as a multiple of the recorded rate, 0 for as fast as possible (default: 1)')
+    parser.add_argument('--filter', default='udp port 8805', help='BPF filter for --iface (default: udp port 8805)')
+    parser.add_argument('--interval', type=int, default=120, help='Window length in seconds (default: 120)')
+    parser.add_argument('--hop', type=int, default=None, help='Emit a window every HOP seconds (default: interval)')
+    parser.add_argument('--batch-size', type=int, default=64, help='Maximum windows per scoring call (default: 64)')
+    parser.add_argument('--max-wait', type=float, default=0.05,
+                        help='Seconds to wait for a batch to fill before scoring it (default: 0.05)')
+    parser.add_argument('--queue-size', type=int, default=1000,
+                        help='Closed windows waiting for scoring before the back-pressure policy applies')
+    parser.add_argument('--policy', choices=POLICIES, default='drop-oldest',
+                        help='What to do when scoring falls behind (default: drop-oldest)')
+    parser.add_argument('--grace', type=float, default=2.0,
+                        help='Seconds after a window ends before it is closed on the wall clock (default: 2)')
+    parser.add_argument('--output', default=None, help='Write verdicts as JSON lines to this file (default: stdout)')
+    args = parser.parse_args()
+
+    output = open(args.output, 'a') if args.output else sys.stdout
+    detector = OnlineDetector(load_model(args.model), args.interval, args.hop, args.batch_size, args.max_wait,
+                              args.queue_size, args.policy, args.grace, wall_clock=args.replay is None,
+                              output=output)
+    if args.iface:
+        live_source(args.iface, args.filter, detector.records)
+    else:
+        path = args.follow or args.replay
+        speed = args.speed if args.replay else None
+        threading.Thread(target=file_source, args=(path, detector.records, bool(args.follow), speed),
+                         daemon=True).start()
+    detector.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import numpy as np
+
+from pfcp_decoder import CAUSE_REQUEST_ACCEPTED, cause, f_seid
+from pfcp_windows import WindowCounter
+
+SESSION_ESTABLISHMENT_RESPONSE = 51
+SESSION_MODIFICATION_REQUEST = 52
+SESSION_DELETION_REQUEST = 54
+
+# Columns counted per window; session_seconds is turned into the average live_sessions of a window
+SESSION_COLUMNS = ['orphan_deletions', 'orphan_modifications', 'new_sessions', 'ended_sessions',
+                   'unused_evictions', 'session_seconds']
+ORPHAN_DELETIONS, ORPHAN_MODIFICATIONS, NEW_SESSIONS, ENDED_SESSIONS, UNUSED_EVICTIONS, SESSION_SECONDS = \
+    range(len(SESSION_COLUMNS))
+
+
+class SessionTable:
+    # Live PFCP sessions keyed by (UPF address, UP SEID). Per-session state lives in preallocated
+    # arrays indexed by slot; the dict only maps keys to slots. Sessions idle for longer than
+    # idle_timeout are evicted, and the table never holds more than max_sessions.
+    def __init__(self, interval, idle_timeout=600, max_sessions=1_000_000, initial_capacity=1024):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.slots = {}
+        self.keys = [None] * initial_capacity
+        self.last_seen = np.zeros(initial_capacity, dtype=np.float64)
+        self.modified = np.zeros(initial_capacity, dtype=bool)
+        self.active = np.zeros(initial_capacity, dtype=bool)
+        self.free = list(range(initial_capacity - 1, -1, -1))
+        self.features = WindowCounter(interval, columns=SESSION_COLUMNS, dtype=np.float64)
+        self.last_time = None
+        self.next_eviction = None
+        self.forced_evictions = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def update(self, timestamp, frame, message):
+        self._advance(timestamp)
+        msg_type = message.msg_type
+        if msg_type == SESSION_ESTABLISHMENT_RESPONSE:
+            # The UP F-SEID in an accepted response is the SEID the SMF uses for this session afterwards
+            seid = f_seid(frame.data, message)
+            if seid is not None and cause(frame.data, message) == CAUSE_REQUEST_ACCEPTED:
+                self._insert((frame.src, seid), timestamp)
+        elif msg_type == SESSION_MODIFICATION_REQUEST:
+            slot = self.slots.get((frame.dst, message.seid))
+            if slot is None:
+                self.features.add_value(timestamp, ORPHAN_MODIFICATIONS, 1)
+            else:
+                self.last_seen[slot] = timestamp
+                self.modified[slot] = True
+        elif msg_type == SESSION_DELETION_REQUEST:
+            slot = self.slots.pop((frame.dst, message.seid), None)
+            if slot is None:
+                self.features.add_value(timestamp, ORPHAN_DELETIONS, 1)
+            else:
+                self._release(slot)
+                self.features.add_value(timestamp, ENDED_SESSIONS, 1)
+
+    def _insert(self, key, timestamp):
+        slot = self.slots.get(key)
+        if slot is None:
+            if not self.free:
+                self._make_room()
+            slot = self.free.pop()
+            self.slots[key] = slot
+            self.keys[slot] = key
+            self.active[slot] = True
+            self.modified[slot] = False
+            self.features.add_value(timestamp, NEW_SESSIONS, 1)
+        self.last_seen[slot] = timestamp
+
+    def _release(self, slot):
+        self.active[slot] = False
+        self.keys[slot] = None
+        self.free.append(slot)
+
+    def _make_room(self):
+        capacity = len(self.keys)
+        if capacity < self.max_sessions:
+            new_capacity = min(2 * capacity, self.max_sessions)
+            self.keys.extend([None] * (new_capacity - capacity))
+            self.last_seen = np.concatenate((self.last_seen, np.zeros(new_capacity - capacity)))
+            self.modified = np.concatenate((self.modified, np.zeros(new_capacity - capacity, dtype=bool)))
+            self.active = np.concatenate((self.active, np.zeros(new_capacity - capacity, dtype=bool)))
+            self.free.extend(range(new_capacity - 1, capacity - 1, -1))
+        else:
+            # Table full: drop the least recently seen eighth of the sessions
+            oldest = np.argpartition(self.last_seen, capacity // 8)[:capacity // 8]
+            self._evict(oldest[self.active[oldest]], self.last_time)
+            self.forced_evictions += len(oldest)
+
+    def _evict(self, slots, timestamp):
+        unused = int(np.count_nonzero(~self.modified[slots]))
+        if unused:
+            self.features.add_value(timestamp, UNUSED_EVICTIONS, unused)
+        for slot in slots:
+            del self.slots[self.keys[slot]]
+            self._release(int(slot))
+
+    def _advance(self, timestamp):
+        # Integrates the number of live sessions over time, split at window boundaries
+        if self.last_time is None:
+            self.last_time = timestamp
+            self.next_eviction = timestamp + self.idle_timeout
+            self.features.add_value(timestamp, SESSION_SECONDS, 0)
+            return
+        if timestamp <= self.last_time:
+            return
+        live = len(self.slots)
+        if live:
+            features = self.features
+            start = self.last_time
+            window = int((start - features.t0) // features.interval)
+            while start < timestamp:
+                # Stepping by window index keeps float rounding at the boundaries from stalling the loop
+                end = min(features.t0 + (window + 1) * features.interval, timestamp)
+                if end > start:
+                    features.add_value(start, SESSION_SECONDS, live * (end - start))
+                    start = end
+                window += 1
+        self.last_time = timestamp
+        if timestamp >= self.next_eviction:
+            idle = np.flatnonzero(self.active & (self.last_seen < timestamp - self.idle_timeout))
+            if len(idle):
+                self._evict(idle, timestamp)
+            self.next_eviction = timestamp + self.idle_timeout / 4
+
+    def to_frame(self, windows, start=None, stop=None):
+        # Feature table for the same windows as `windows`, the message count counter of the capture
+        start, stop = windows.bounds(start, stop)
+        features = self.features
+        if windows.interval != features.interval or windows.length != features.length:
+            features = features.slide(windows.length, windows.interval)
+        df = features.to_frame(start, stop)
+        counts = SESSION_COLUMNS[:SESSION_SECONDS]
+        df[counts] = df[counts].round().astype(np.int64)
+        length = features.length
+        df['new_session_rate'] = df['new_sessions'] / length
+        df['live_sessions'] = df.pop('session_seconds') / length
+        return df
@@ -0,0 +1,203 @@
+from array import array
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from pfcp_decoder import pfcp_msg_type_map
+
+# Fixed output column order, independent of which message types a capture contains
+MSG_TYPE_COLUMNS = list(pfcp_msg_type_map.values())
+MSG_TYPE_INDEX = np.full(256, -1, dtype=np.int64)
+for _column, _msg_type in enumerate(pfcp_msg_type_map):
+    MSG_TYPE_INDEX[_msg_type] = _column
+
+
+class WindowCounter:
+    # Counts per window and column; columns default to the PFCP message types, with keys mapped
+    # to columns through `index` (MSG_TYPE_INDEX for message types)
+    def __init__(self, interval, t0=None, initial_windows=64, batch_size=65536, columns=None, index=None,
+                 dtype=np.int64):
+        self.columns = MSG_TYPE_COLUMNS if columns is None else list(columns)
+        self.index = MSG_TYPE_INDEX if columns is None else (np.arange(len(self.columns)) if index is None else index)
+        self.interval = interval
+        # Window length; longer than interval for overlapping windows built by slide()
+        self.length = interval
+        self.t0 = t0
+        self.counts = np.zeros((initial_windows, len(self.columns)), dtype=dtype)
+        self.n_windows = 0
+        # Windows added in front of the original t0 by out-of-order packets
+        self.front_windows = 0
+        self.unknown = 0
+        self.batch_size = batch_size
+        self._windows = array('q')
+        self._types = array('q')
+
+    def add(self, timestamp, msg_type):
+        if self.t0 is None:
+            self.t0 = timestamp
+        # Updates are buffered and applied to the matrix in vectorized batches
+        self._windows.append(int((timestamp - self.t0) // self.interval))
+        self._types.append(msg_type)
+        if len(self._windows) >= self.batch_size:
+            self.flush()
+
+    def add_many(self, timestamps, msg_types):
+        # Vectorized add of whole arrays, e.g. messages read back from a cache
+        if not len(timestamps):
+            return
+        self.flush()
+        if self.t0 is None:
+            self.t0 = float(timestamps[0])
+        windows = ((np.asarray(timestamps, dtype=np.float64) - self.t0) // self.interval).astype(np.int64)
+        self._apply(windows, np.asarray(msg_types, dtype=np.int64))
+
+    def flush(self):
+        if not self._windows:
+            return
+        self._apply(np.frombuffer(self._windows, dtype=np.int64), np.frombuffer(self._types, dtype=np.int64))
+        self._windows = array('q')
+        self._types = array('q')
+
+    def _apply(self, windows, types):
+        columns = self.index[types % len(self.index)]
+        known = columns >= 0
+        self.unknown += int(len(columns) - known.sum())
+        windows = windows[known]
+        columns = columns[known]
+        if len(windows):
+            first = int(windows.min())
+            if first < 0:
+                # Packets older than t0 (reordered capture) move the grid back by whole windows
+                self._grow_front(-first)
+                windows = windows - first
+            last = int(windows.max())
+            if last >= len(self.counts):
+                self._grow(last + 1)
+            np.add.at(self.counts, (windows, columns), 1)
+            self.n_windows = max(self.n_windows, last + 1)
+
+    def add_value(self, timestamp, column, value):
+        # Unbuffered add of an arbitrary amount to one column, for derived features
+        if self.t0 is None:
+            self.t0 = timestamp
+        self.flush()
+        window = int((timestamp - self.t0) // self.interval)
+        if window < 0:
+            self._grow_front(-window)
+            window = 0
+        if window >= len(self.counts):
+            self._grow(window + 1)
+        self.counts[window, column] += value
+        self.n_windows = max(self.n_windows, window + 1)
+
+    def _grow(self, n_windows):
+        size = max(n_windows, 2 * len(self.counts))
+        counts = np.zeros((size, self.counts.shape[1]), dtype=self.counts.dtype)
+        counts[:len(self.counts)] = self.counts
+        self.counts = counts
+
+    def _grow_front(self, shift):
+        self.counts = np.vstack((np.zeros((shift, self.counts.shape[1]), dtype=self.counts.dtype), self.counts))
+        if self.t0 is not None:
+            self.t0 -= shift * self.interval
+        self.front_windows += shift
+        if self.n_windows:
+            self.n_windows += shift
+
+    def merge(self, other):
+        # Adds the counts of a counter over the same interval; windows are aligned through t0
+        self.flush()
+        other.flush()
+        self.unknown += other.unknown
+        if other.n_windows == 0:
+            return
+        if self.t0 is None:
+            self.t0 = other.t0
+        shift = int(round((other.t0 - self.t0) / self.interval))
+        if shift < 0:
+            self._grow_front(-shift)
+            shift = 0
+        end = shift + other.n_windows
+        if end > len(self.counts):
+            self._grow(end)
+        self.counts[shift:end] += other.counts[:other.n_windows]
+        self.n_windows = max(self.n_windows, end)
+
+    def resample(self, interval):
+        # Counter for a coarser interval that is a multiple of this one
+        return self.slide(interval, interval)
+
+    def slide(self, interval, hop):
+        # Windows of length interval starting every hop seconds, built from prefix sums over this
+        # counter's bins; both must be multiples of its interval. The result is indexed on the hop grid.
+        self.flush()
+        width = int(round(interval / self.interval))
+        step = int(round(hop / self.interval))
+        if width < 1 or step < 1 or width * self.interval != interval or step * self.interval != hop:
+            raise ValueError(f"Intervals {interval}/{hop} are not multiples of {self.interval}")
+        result = WindowCounter(hop, initial_windows=1, columns=self.columns, index=self.index,
+                               dtype=self.counts.dtype)
+        result.length = interval
+        result.unknown = self.unknown
+        if self.n_windows == 0:
+            return result
+        # Window starts stay aligned with the original t0, also for windows added in front of it
+        front = -(-self.front_windows // step)
+        first = self.front_windows - front * step
+        cumulative = np.zeros((self.n_windows + 1, self.counts.shape[1]), dtype=self.counts.dtype)
+        np.cumsum(self.counts[:self.n_windows], axis=0, out=cumulative[1:])
+        starts = np.arange(first, self.n_windows, step)
+        ends = starts + width
+        result.counts = cumulative[ends.clip(0, self.n_windows)] - cumulative[starts.clip(0, self.n_windows)]
+        result.n_windows = len(result.counts)
+        result.front_windows = front
+        result.t0 = self.t0 + first * self.interval
+        return result
+
+    def _rows(self, start, stop):
+        start = 0 if start is None else start + self.front_windows
+        stop = self.n_windows if stop is None else stop + self.front_windows
+        return start, stop
+
+    def bounds(self, start=None, stop=None):
+        # Window range [start, stop) counted from the original t0, as returned by to_frame(start, stop)
+        self.flush()
+        start = -self.front_windows if start is None else start
+        stop = self.n_windows - self.front_windows if stop is None else stop
+        return start, stop
+
+    def window_times(self, start=None, stop=None):
+        # Absolute start and end times of the windows returned by to_frame(start, stop)
+        start, stop = self._rows(start, stop)
+        starts = self.t0 + np.arange(start, stop) * self.interval
+        return starts, starts + self.length
+
+    def to_frame(self, start=None, stop=None):
+        # Rows for windows [start, stop) counted from the original t0, padded with empty windows
+        self.flush()
+        start, stop = self._rows(start, stop)
+        if start < 0:
+            self._grow_front(-start)
+            start, stop = 0, stop - start
+        if stop > len(self.counts):
+            self._grow(stop)
+        return pd.DataFrame(self.counts[start:stop], columns=self.columns)
+
+
+class RollingWindow:
+    # Running per-type sum over the last `width` closed bins, for emitting overlapping windows online
+    def __init__(self, width, n_columns=len(MSG_TYPE_COLUMNS)):
+        self.width = width
+        self.bins = deque()
+        self.total = np.zeros(n_columns, dtype=np.int64)
+
+    def push(self, counts):
+        # Adds one closed bin and returns the counts of the window ending with it once enough bins are in
+        self.bins.append(counts)
+        self.total += counts
+        if len(self.bins) > self.width:
+            self.total -= self.bins.popleft()
+        if len(self.bins) < self.width:
+            return None
+        return self.total.copy()
@@ -0,0 +1,129 @@
+import json
+import os
+import resource
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+STAGES = ('decode', 'window', 'label', 'write')
+PROMETHEUS_PREFIX = 'pfcp_convert'
+
+
+def cpu_time():
+    # CPU seconds of this process and of its finished worker processes (--split)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def peak_rss():
+    # High-water mark of the resident set size since the process started, of this process or of its largest
+    # finished worker (--split, --jobs). ru_maxrss never goes down, so it is reported once per run rather than
+    # per stage or capture; it is in kilobytes on Linux.
+    return max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) * 1024
+
+
+class Stage:
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.calls = 0
+
+    def to_dict(self):
+        return {'wall_seconds': round(self.wall, 6), 'cpu_seconds': round(self.cpu, 6), 'rows_in': self.rows_in,
+                'rows_out': self.rows_out, 'rows_per_second': round(self.rows_in / self.wall, 1) if self.wall else 0.0,
+                'calls': self.calls}
+
+
+class PipelineMetrics:
+    # Wall and CPU time and rows in and out per stage, plus dropped input by reason
+    def __init__(self):
+        self.stages = {}
+        self.drops = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        stage = self.stages.setdefault(name, Stage())
+        wall, cpu = time.perf_counter(), cpu_time()
+        try:
+            yield stage
+        finally:
+            stage.wall += time.perf_counter() - wall
+            stage.cpu += cpu_time() - cpu
+            stage.calls += 1
+
+    def drop(self, reason, count=1):
+        if count:
+            self.drops[reason] += count
+
+    def to_dict(self):
+        return {'stages': {name: stage.to_dict() for name, stage in self.stages.items()},
+                'drops': dict(self.drops)}
+
+
+def combine(reports):
+    # Totals over the to_dict() reports of several conversions
+    stages = {}
+    drops = Counter()
+    for report in reports:
+        for name, stage in report['stages'].items():
+            total = stages.setdefault(name, Counter())
+            for key, value in stage.items():
+                if key != 'rows_per_second':
+                    total[key] += value
+        drops.update(report['drops'])
+    for total in stages.values():
+        total['rows_per_second'] = round(total['rows_in'] / total['wall_seconds'], 1) if total['wall_seconds'] else 0.0
+    return {'stages': {name: dict(total) for name, total in stages.items()}, 'drops': dict(drops)}
+
+
+def write_atomic(path, text):
+    temp_file = f'{path}.{os.getpid()}.tmp'
+    with open(temp_file, 'w') as file:
+        file.write(text)
+    os.replace(temp_file, path)
+
+
+def write_json_report(path, report):
+    write_atomic(path, json.dumps(report, indent=2) + '\n')
+
+
+def prometheus_text(report):
+    # Text exposition format for the node_exporter textfile collector
+    lines = []
+
+    def metric(name, help_text, samples, kind='gauge'):
+        lines.append(f'# HELP {PROMETHEUS_PREFIX}_{name} {help_text}')
+        lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name} {kind}')
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+            lines.append(f'{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value}' if label_text
+                         else f'{PROMETHEUS_PREFIX}_{name} {value}')
+
+    totals = report['totals']
+    stages = totals['stages']
+    metric('stage_wall_seconds', 'Wall time spent in each pipeline stage.',
+           [({'stage': name}, stage['wall_seconds']) for name, stage in stages.items()])
+    metric('stage_cpu_seconds', 'CPU time spent in each pipeline stage.',
+           [({'stage': name}, stage['cpu_seconds']) for name, stage in stages.items()])
+    metric('stage_rows_in', 'Rows entering each pipeline stage (frames for decode).',
+           [({'stage': name}, stage['rows_in']) for name, stage in stages.items()])
+    metric('stage_rows_out', 'Rows leaving each pipeline stage.',
+           [({'stage': name}, stage['rows_out']) for name, stage in stages.items()])
+    metric('stage_rows_per_second', 'Input rows per wall second of each pipeline stage.',
+           [({'stage': name}, stage['rows_per_second']) for name, stage in stages.items()])
+    metric('dropped', 'Input frames or rows that were not counted, by reason.',
+           [({'reason': reason}, count) for reason, count in sorted(totals['drops'].items())])
+    metric('peak_rss_bytes', 'Resident set size high-water mark of the converter or of its largest worker.',
+           [({}, report['peak_rss_bytes'])])
+    metric('files', 'Captures of the last run by outcome.',
+           [({'status': status}, count) for status, count in report['files_by_status'].items()])
+    metric('run_seconds', 'Wall time of the last run.', [({}, report['seconds'])])
+    metric('last_run_timestamp_seconds', 'Unix time the last run finished.', [({}, report['finished'])])
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, report):
+    # Written to a temp file and renamed, so the collector never reads a partial file
+    write_atomic(path, prometheus_text(report))
@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+FORMATS = ('csv', 'parquet', 'hdf5')
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'hdf5': '.h5'}
+HDF5_KEY = 'pfcp_data'
+ROW_GROUP_SIZE = 65536
+
+# Integer columns are counts and stored as uint32 unless listed here. The dtypes do not depend on the
+# data, so every appended row group of a file has the same schema.
+COMPACT_DTYPES = {
+    'Label_val': np.int8,
+    'src_port': np.uint16,
+    'dst_port': np.uint16,
+    'protocol': np.uint8,
+    'msg_type': np.uint8,
+}
+COUNT_DTYPE = np.uint32
+LABEL_COLUMNS = ('Label',)
+HDF5_STRING_SIZE = 64
+
+
+def compact_dtypes(df):
+    # Smallest fixed dtypes for the integer columns and categorical labels
+    df = df.copy()
+    for column in df.columns:
+        dtype = COMPACT_DTYPES.get(column)
+        if dtype is None and pd.api.types.is_integer_dtype(df[column]):
+            dtype = COUNT_DTYPE
+        if dtype is not None:
+            values = df[column]
+            info = np.iinfo(dtype)
+            if len(values) and (values.min() < info.min or values.max() > info.max):
+                raise ValueError(f"Column {column} does not fit in {np.dtype(dtype).name}")
+            df[column] = values.astype(dtype)
+    for column in LABEL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
+
+
+def output_path(base, fmt):
+    return base + EXTENSIONS[fmt]
+
+
+class TableWriter:
+    # Appends DataFrames to one csv, parquet or hdf5 file. Data goes to a per-process temp file that
+    # replaces the output on close, so readers never see partial files. Backends are imported on first use.
+    def __init__(self, path, fmt='csv'):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown output format {fmt}, expected one of {', '.join(FORMATS)}")
+        self.path = path
+        self.format = fmt
+        self.temp_file = f'{path}.{os.getpid()}.tmp'
+        self.rows = 0
+        self.writer = None
+
+    def append(self, df):
+        if self.format == 'csv':
+            df.to_csv(self.temp_file, mode='a', header=self.rows == 0, index=False)
+        elif self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(compact_dtypes(df), preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.temp_file, table.schema)
+            self.writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+        else:
+            df = compact_dtypes(df)
+            # HDF5 tables cannot append categoricals with new categories, labels are stored as strings
+            for column in LABEL_COLUMNS:
+                if column in df.columns:
+                    df[column] = df[column].astype(str)
+            sizes = {column: HDF5_STRING_SIZE for column in df.columns if df[column].dtype == object}
+            df.to_hdf(self.temp_file, key=HDF5_KEY, mode='a', format='table', append=True,
+                      min_itemsize=sizes or None, complevel=1, index=False)
+        self.rows += len(df)
+
+    def close(self, columns=None):
+        # `columns` gives the header of a file that received no rows
+        if self.rows == 0:
+            empty = pd.DataFrame({column: pd.Series(dtype=np.int64) for column in columns or []})
+            if self.format == 'hdf5':
+                # Appending no rows to an HDF5 table writes nothing, keep the header in a fixed-format node
+                empty.to_hdf(self.temp_file, key=HDF5_KEY, mode='w', format='fixed')
+            else:
+                self.append(empty)
+        if self.writer is not None:
+            self.writer.close()
+        os.replace(self.temp_file, self.path)
+
+
+def write_table(df, path, fmt='csv'):
+    writer = TableWriter(path, fmt)
+    writer.append(df)
+    writer.close(list(df.columns))
+    return path
+
+
+def load_table(path, columns=None):
+    # Reads only the requested columns; parquet is memory-mapped, csv is compacted after parsing
+    extension = os.path.splitext(path)[1]
+    if extension == EXTENSIONS['parquet']:
+        df = pd.read_parquet(path, columns=columns, memory_map=True)
+    elif extension == EXTENSIONS['hdf5']:
+        with pd.HDFStore(path, mode='r') as store:
+            if store.get_storer(HDF5_KEY).is_table:
+                df = store.select(HDF5_KEY, columns=columns)
+            else:
+                df = store.get(HDF5_KEY)
+                df = df[columns] if columns is not None else df
+    else:
+        df = compact_dtypes(pd.read_csv(path, usecols=columns, low_memory=False))
+    for column in LABEL_COLUMNS:
+        if column in df.columns and df[column].dtype != 'category':
+            df[column] = df[column].astype('category')
+    return df
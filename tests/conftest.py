@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from synthetic_capture import CaptureGenerator, write_capture  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def normal_capture(tmp_path_factory):
+    # Heartbeats and sessions only, one message per datagram and no broken frames: every request is answered
+    # and every session is established, modified and deleted once. Returns (path, generator).
+    path = str(tmp_path_factory.mktemp('normal') / 'normal.pcap')
+    generator = CaptureGenerator(session_rate=10.0, session_lifetime=20.0, attack_rate=0, multi_share=0,
+                                 malformed_share=0, seed=3)
+    write_capture(path, generator, duration=300)
+    return path, generator
+
+
+@pytest.fixture(scope='session')
+def attack_capture(tmp_path_factory):
+    # Several attack slots with their attack log. Returns (path, generator, attack log path).
+    directory = tmp_path_factory.mktemp('attack')
+    path = str(directory / 'attack.pcap')
+    log = str(directory / 'attack_logs.csv')
+    generator = CaptureGenerator(session_rate=5.0, attack_rate=40.0, seed=5)
+    write_capture(path, generator, duration=400, attack_log=log)
+    return path, generator, log
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import ExtraTreesClassifier, GradientBoostingClassifier, RandomForestClassifier
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from models.inference import export_artifact, load_artifact
+
+COLUMNS = [f'f{i}' for i in range(8)]
+
+
+def training_data(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n, len(COLUMNS))) * rng.uniform(1, 100, len(COLUMNS)), columns=COLUMNS)
+    y = np.digitize(X['f0'] + X['f1'] - X['f2'], np.quantile(X['f0'] + X['f1'] - X['f2'], [0.5, 0.7, 0.85]))
+    return X, y
+
+
+def reference_predict(scaler, binary_clf, multiclass_clf, X):
+    # The notebooks' ConditionalClassifier: flagged rows get the multiclass prediction
+    X = scaler.transform(X)
+    predictions = binary_clf.predict(X)
+    flagged = predictions != 0
+    predictions[flagged] = multiclass_clf.predict(X[flagged])
+    return predictions
+
+
+@pytest.mark.parametrize('scaler_type', [StandardScaler, MinMaxScaler])
+@pytest.mark.parametrize('binary_type', [RandomForestClassifier, ExtraTreesClassifier])
+def test_artifact_predicts_like_sklearn(scaler_type, binary_type, tmp_path):
+    X, y = training_data()
+    scaler = scaler_type().fit(X)
+    scaled = scaler.transform(X)
+    binary_clf = binary_type(n_estimators=20, random_state=0).fit(scaled, (y != 0).astype(int))
+    attacks = y != 0
+    multiclass_clf = GradientBoostingClassifier(n_estimators=20, random_state=0).fit(scaled[attacks], y[attacks])
+    path = export_artifact(str(tmp_path / 'model.npz'), COLUMNS, binary_clf, multiclass_clf, scaler)
+    model = load_artifact(path)
+
+    X_test, _ = training_data(500, seed=1)
+    expected = reference_predict(scaler, binary_clf, multiclass_clf, X_test)
+    np.testing.assert_array_equal(model.predict(X_test), expected)
+    np.testing.assert_array_equal(model.predict(X_test, batch_size=64), expected)
+    # Columns are taken by name, in any order
+    np.testing.assert_array_equal(model.predict(X_test[COLUMNS[::-1]]), expected)
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from attack_labels import UNLABELLED, join_attack_log, load_attack_log
+from PfcpFlowMeter import DEFAULT_LABEL, LABEL_RULES, PcapCsvConverter, label_windows
+from pfcp_windows import MSG_TYPE_COLUMNS
+
+LOG = pd.DataFrame({'index': [0, 1, 2], 'Label': ['del_att', 'mod_att', 'del_att'], 'Label_val': [1, 2, 1],
+                    'start_time': [10.0, 50.0, 135.0], 'end_time': [50.0, 130.0, 140.0]})
+
+
+def test_majority_label_and_overlap():
+    starts = np.array([0.0, 60.0, 120.0, 200.0])
+    labels = join_attack_log(starts, starts + 60, LOG)
+    # 40 s of deletion against 10 s of modification; then modification only; 10 s modification against
+    # 5 s deletion; nothing
+    assert labels['Label_val'].tolist() == [1, 2, 2, UNLABELLED[0]]
+    assert labels['Label'].tolist() == ['del_att', 'mod_att', 'mod_att', UNLABELLED[1]]
+    np.testing.assert_allclose(labels['label_overlap'], [40 / 60, 1.0, 10 / 60, 0.0])
+
+
+def test_empty_log_leaves_windows_unlabelled():
+    labels = join_attack_log(np.array([0.0, 60.0]), np.array([60.0, 120.0]), LOG.iloc[:0])
+    assert labels['Label_val'].tolist() == [UNLABELLED[0]] * 2
+    assert labels['label_overlap'].tolist() == [0.0, 0.0]
+
+
+def test_load_attack_log_sorts_and_checks_columns(tmp_path):
+    path = tmp_path / 'attack_logs.csv'
+    LOG.iloc[::-1].to_csv(path, index=False)
+    assert load_attack_log(str(path))['start_time'].tolist() == [10.0, 50.0, 135.0]
+    LOG.drop(columns='end_time').to_csv(path, index=False)
+    with pytest.raises(ValueError):
+        load_attack_log(str(path))
+
+
+def counts_row(**counts):
+    row = dict.fromkeys(MSG_TYPE_COLUMNS, 0)
+    row.update(counts)
+    return row
+
+
+def test_label_rules_first_match_wins():
+    df = pd.DataFrame([
+        counts_row(heartbeat_request=45, heartbeat_response=45, session_deletion_request=10),
+        counts_row(heartbeat_request=30, session_deletion_request=20, session_modification_request=50),
+        counts_row(heartbeat_request=10, session_modification_request=30, session_modification_response=30),
+        counts_row(session_establishment_request=50, session_establishment_response=40),
+        counts_row(association_setup_request=5, association_setup_response=5),
+    ])
+    labelled = label_windows(df)
+    assert labelled['Label_val'].tolist() == [0, 1, 2, 3, DEFAULT_LABEL[0]]
+    assert labelled['Label'].tolist() == [rule[3] for rule in LABEL_RULES] + [DEFAULT_LABEL[1]]
+
+
+def test_converted_windows_carry_the_slot_labels(attack_capture, tmp_path):
+    path, _, log_path = attack_capture
+    log = load_attack_log(log_path)
+    converter = PcapCsvConverter(os.path.dirname(path), os.path.basename(path), str(tmp_path), 20,
+                                 attack_log=log, window_times=True)
+    converter.run()
+    df = pd.read_csv(converter.output_file)
+    # Windows inside one slot get its label with full overlap; the gap between slots is never a majority
+    for slot in log.itertuples():
+        inside = (df['window_start'] >= slot.start_time) & (df['window_end'] <= slot.end_time)
+        assert inside.any()
+        assert (df.loc[inside, 'Label_val'] == slot.Label_val).all()
+        np.testing.assert_allclose(df.loc[inside, 'label_overlap'], 1.0)
@@ -0,0 +1,55 @@
+import json
+import os
+import shutil
+
+from manifest import Manifest
+from PfcpFlowMeter import process_all_pcaps_in_directory
+
+
+def convert(data_directory, output_directory, interval=60, **options):
+    process_all_pcaps_in_directory(str(data_directory), str(output_directory), interval, **options)
+    with open(os.path.join(output_directory, 'run_report.json')) as file:
+        return {name: f['status'] for name, f in json.load(file)['files'].items()}
+
+
+def test_unchanged_captures_are_skipped(normal_capture, attack_capture, tmp_path):
+    data, output = tmp_path / 'data', tmp_path / 'output'
+    data.mkdir()
+    shutil.copy(normal_capture[0], data / 'a.pcap')
+    shutil.copy(attack_capture[0], data / 'b.pcap')
+    assert convert(data, output) == {'a.pcap': 'ok', 'b.pcap': 'ok'}
+    assert convert(data, output) == {'a.pcap': 'unchanged', 'b.pcap': 'unchanged'}
+
+    # Touched but not changed: hashed again and still skipped
+    os.utime(data / 'a.pcap', ns=(0, 0))
+    assert convert(data, output) == {'a.pcap': 'unchanged', 'b.pcap': 'unchanged'}
+
+    # Other settings convert again, and switching back finds the earlier outputs
+    assert convert(data, output, interval=120) == {'a.pcap': 'ok', 'b.pcap': 'ok'}
+    assert convert(data, output) == {'a.pcap': 'unchanged', 'b.pcap': 'unchanged'}
+
+    # New content, a deleted output and --force all convert again
+    shutil.copy(attack_capture[0], data / 'a.pcap')
+    os.remove(output / 'b_60.csv')
+    assert convert(data, output) == {'a.pcap': 'ok', 'b.pcap': 'ok'}
+    assert convert(data, output, force=True) == {'a.pcap': 'ok', 'b.pcap': 'ok'}
+
+
+def test_concurrent_runs_merge_their_entries(tmp_path):
+    for name in ('a.csv', 'b.csv'):
+        (tmp_path / name).touch()
+    first, second = Manifest(str(tmp_path)), Manifest(str(tmp_path))
+    first.record('a.pcap', 1, 1, 'digest-a', 'settings', [str(tmp_path / 'a.csv')])
+    first.save()
+    second.record('b.pcap', 1, 1, 'digest-b', 'settings', [str(tmp_path / 'b.csv')])
+    second.save()
+    assert Manifest(str(tmp_path)).converted('settings') == ['a.pcap', 'b.pcap']
+
+
+def test_old_manifest_layout_is_read(tmp_path):
+    (tmp_path / 'a_60.csv').touch()
+    with open(tmp_path / 'manifest.json', 'w') as file:
+        json.dump({'a.pcap': {'size': 1, 'mtime_ns': 1, 'digest': 'd', 'settings': 'key', 'outputs': ['a_60.csv']}},
+                  file)
+    entry = Manifest(str(tmp_path)).current('a.pcap', 'key')
+    assert entry['outputs'] == [os.path.join(str(tmp_path), 'a_60.csv')]
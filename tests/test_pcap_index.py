@@ -0,0 +1,81 @@
+import os
+import shutil
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+from pcap_index import CaptureIndex
+from pcap_reader import CaptureReader
+from pfcp_decoder import PfcpDecoder
+from PfcpFlowMeter import PcapCsvConverter
+
+STEP = 32 * 1024
+
+
+def message_counts(path, start=None, stop=None):
+    return Counter(message.msg_type for frame in PfcpDecoder(path).frames(start, stop) for message in frame.messages)
+
+
+@pytest.fixture(scope='module')
+def indexed_capture(attack_capture, tmp_path_factory):
+    # A copy with a saved sidecar index of small steps, so the converter splits it into several parts
+    directory = tmp_path_factory.mktemp('indexed')
+    path = str(directory / 'capture.pcap')
+    shutil.copy(attack_capture[0], path)
+    CaptureIndex.build(path, STEP).save()
+    return path
+
+
+def test_index_round_trip(indexed_capture):
+    index = CaptureIndex.load(indexed_capture)
+    assert index is not None and index.step == STEP
+    assert (index.checkpoints == CaptureIndex.build(indexed_capture, STEP).checkpoints).all()
+    # A changed capture invalidates the sidecar
+    os.utime(indexed_capture, ns=(0, 0))
+    assert CaptureIndex.load(indexed_capture) is None
+    CaptureIndex.build(indexed_capture, STEP).save()
+
+
+def test_split_ranges_cover_every_record(indexed_capture):
+    index = CaptureIndex.load(indexed_capture)
+    ranges = index.split(4)
+    assert len(ranges) == 4
+    total = Counter()
+    for start, stop in ranges:
+        total.update(message_counts(indexed_capture, start, stop))
+    assert total == message_counts(indexed_capture)
+
+
+def test_time_range_holds_all_records_in_range(indexed_capture):
+    index = CaptureIndex.load(indexed_capture)
+    times = [record[0] for record in CaptureReader(indexed_capture).records(skip_data=True)]
+    first, last = times[len(times) // 3], times[len(times) // 2]
+    start, stop = index.time_range(first, last)
+    ranged = [record[0] for record in CaptureReader(indexed_capture).records(start, stop, skip_data=True)]
+    assert [t for t in times if first <= t <= last] == [t for t in ranged if first <= t <= last]
+    assert len(ranged) < len(times)
+
+
+def convert(path, output_directory, **options):
+    converter = PcapCsvConverter(os.path.dirname(path), os.path.basename(path), str(output_directory), [60, 120],
+                                 **options)
+    converter.run()
+    return {interval: pd.read_csv(output) for interval, output in converter.output_files.items()}
+
+
+def test_split_conversion_equals_serial(indexed_capture, tmp_path):
+    serial = convert(indexed_capture, tmp_path / 'serial')
+    split = convert(indexed_capture, tmp_path / 'split', split=3)
+    for interval in serial:
+        pd.testing.assert_frame_equal(split[interval], serial[interval])
+
+
+def test_time_range_conversion_matches_full(indexed_capture, tmp_path):
+    full = convert(indexed_capture, tmp_path / 'full')
+    ranged = convert(indexed_capture, tmp_path / 'ranged', time_range=(100.0, 250.0))
+    for interval, df in ranged.items():
+        first = int(100 // interval)
+        expected = full[interval].iloc[first:first + len(df)].reset_index(drop=True)
+        assert len(df) == -(-250 // interval) - first
+        pd.testing.assert_frame_equal(df, expected)
@@ -0,0 +1,67 @@
+import csv
+import shutil
+import subprocess
+from collections import Counter
+
+import pytest
+
+from pfcp_decoder import TSHARK_FIELDS, PfcpDecoder
+from synthetic_capture import FORMATS, CaptureGenerator, write_capture
+
+# A short capture with plenty of concatenated (FO flag) and broken datagrams
+GENERATOR_ARGS = dict(session_rate=10.0, attack_rate=50.0, multi_share=0.2, malformed_share=0.01, seed=7)
+DURATION = 90
+
+
+@pytest.fixture(scope='module', params=FORMATS)
+def capture(request, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('capture') / f'capture.{request.param}')
+    generator = CaptureGenerator(**GENERATOR_ARGS)
+    stats = write_capture(path, generator, duration=DURATION)
+    return path, generator, stats
+
+
+def test_messages_match_generator(capture):
+    path, generator, stats = capture
+    decoder = PfcpDecoder(path)
+    counts = Counter()
+    multi = 0
+    for frame in decoder.frames():
+        counts.update(message.msg_type for message in frame.messages)
+        multi += len(frame.messages) > 1
+    assert stats['multi_message'] > 0 and stats['malformed'] > 0
+    assert counts == generator.messages
+    assert decoder.stats['pfcp_messages'] == stats['messages']
+    assert decoder.stats['frames'] == stats['frames']
+    assert decoder.stats['pfcp_frames'] + decoder.stats['malformed'] + decoder.stats['fragmented'] \
+        + decoder.stats['not_udp'] == stats['frames']
+    assert multi > 0
+
+
+def test_tshark_csv_columns(capture, tmp_path):
+    path, generator, _ = capture
+    csv_file = tmp_path / 'native.csv'
+    PfcpDecoder(path).write_tshark_csv(csv_file)
+    with open(csv_file, newline='') as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == TSHARK_FIELDS
+    counts = Counter(int(msg_type) for row in rows[1:] for msg_type in row[3].split(','))
+    assert counts == generator.messages
+    assert float(rows[1][0]) == 0.0
+
+
+@pytest.mark.skipif(shutil.which('tshark') is None, reason='tshark is not installed')
+def test_matches_tshark(capture, tmp_path):
+    path, _, _ = capture
+    csv_file = tmp_path / 'native.csv'
+    PfcpDecoder(path).write_tshark_csv(csv_file)
+    with open(csv_file, newline='') as file:
+        native = list(csv.reader(file))
+    command = ['tshark', '-r', path, '-Y', 'pfcp', '-T', 'fields', '-E', 'separator=,', '-E', 'quote=d',
+               '-E', 'header=y'] + [arg for field in TSHARK_FIELDS for arg in ('-e', field)]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    tshark = list(csv.reader(output.splitlines()))
+    assert tshark[0] == native[0]
+    # tshark also lists the broken frames the native decoder drops, with whatever it could read of them
+    tshark_rows = {tuple(row) for row in tshark[1:] if row[3] and all(t.isdigit() for t in row[3].split(','))}
+    assert {tuple(row) for row in native[1:]} <= tshark_rows
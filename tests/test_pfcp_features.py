@@ -0,0 +1,100 @@
+from collections import namedtuple
+
+import numpy as np
+import pytest
+
+from pfcp_decoder import PfcpDecoder
+from pfcp_latency import LatencyMatcher
+from pfcp_sessions import SessionTable
+from pfcp_windows import WindowCounter
+
+Frame = namedtuple('Frame', 'src dst')
+Message = namedtuple('Message', 'msg_type seq')
+
+
+def run(path, *features):
+    windows = WindowCounter(60)
+    for frame in PfcpDecoder(path).frames():
+        for message in frame.messages:
+            windows.add(frame.time, message.msg_type)
+            for feature in features:
+                feature.update(frame.time, frame, message)
+    return windows
+
+
+def test_sessions_follow_the_capture(normal_capture):
+    path, generator = normal_capture
+    sessions = SessionTable(60, idle_timeout=3600)
+    windows = run(path, sessions)
+    df = sessions.to_frame(windows)
+    assert len(df) == windows.n_windows
+    assert df['new_sessions'].sum() == generator.messages[51]
+    assert df['ended_sessions'].sum() == generator.messages[54]
+    assert df['orphan_deletions'].sum() == 0
+    # Only modifications sent before the establishment response was seen find no session
+    assert df['orphan_modifications'].sum() < 0.01 * generator.messages[52]
+    assert len(sessions) == generator.messages[51] - generator.messages[54]
+    assert (df['live_sessions'] >= 0).all() and df['live_sessions'].max() > 0
+
+
+def test_idle_sessions_are_evicted(normal_capture):
+    path, generator = normal_capture
+    sessions = SessionTable(60, idle_timeout=5)
+    df = sessions.to_frame(run(path, sessions))
+    # Sessions live longer than the timeout, so many are gone before their deletion arrives
+    assert df['unused_evictions'].sum() > 0
+    assert df['orphan_deletions'].sum() > 0
+    assert df['ended_sessions'].sum() + df['orphan_deletions'].sum() == generator.messages[54]
+    assert len(sessions) < generator.messages[51] - generator.messages[54]
+
+
+def test_table_never_exceeds_max_sessions(normal_capture):
+    path, generator = normal_capture
+    sessions = SessionTable(60, idle_timeout=3600, max_sessions=32, initial_capacity=8)
+    largest = 0
+    for frame in PfcpDecoder(path).frames():
+        for message in frame.messages:
+            sessions.update(frame.time, frame, message)
+            largest = max(largest, len(sessions))
+    assert largest <= 32
+    assert sessions.forced_evictions > 0
+
+
+def test_latency_matches_generated_responses(normal_capture):
+    path, generator = normal_capture
+    latency = LatencyMatcher(60)
+    windows = run(path, latency)
+    df = latency.to_frame(windows)
+    answered = df['answered_requests'].sum()
+    assert answered == sum(generator.messages[t] for t in (2, 51, 53, 55))
+    assert df['unmatched_responses'].sum() == 0 and df['retransmissions'].sum() == 0
+    busy = df['answered_requests'] > 0
+    # Response delays are exponential with mean response_delay
+    mean = (df['response_time_mean'] * df['answered_requests']).sum() / answered
+    assert mean == pytest.approx(generator.response_delay, rel=0.05)
+    # Percentiles are bucket upper edges, within 19% above the true value: the median is ln(2) * mean
+    median = np.log(2) * generator.response_delay
+    assert df.loc[busy, 'response_time_p50'].between(median * 0.9, median * 1.3).all()
+    assert (df.loc[busy, 'response_time_p99'] > df.loc[busy, 'response_time_p50']).all()
+
+
+def test_latency_retransmission_timeout_and_unmatched():
+    smf, upf = Frame('smf', 'upf'), Frame('upf', 'smf')
+    latency = LatencyMatcher(60, timeout=10)
+    windows = WindowCounter(60)
+    for timestamp, frame, message in (
+            (0.0, smf, Message(50, 1)),
+            (1.0, smf, Message(50, 1)),   # retransmission
+            (1.5, upf, Message(51, 1)),   # answers the first transmission
+            (2.0, smf, Message(52, 2)),   # never answered
+            (3.0, upf, Message(55, 9)),   # no such request
+            (30.0, smf, Message(1, 3)),
+            (30.1, upf, Message(2, 3))):
+        windows.add(timestamp, message.msg_type)
+        latency.update(timestamp, frame, message)
+    df = latency.to_frame(windows)
+    row = df.iloc[0]
+    assert (row['answered_requests'], row['retransmissions'], row['unanswered_requests'],
+            row['unmatched_responses']) == (2, 1, 1, 1)
+    assert row['response_time_mean'] == pytest.approx((1.5 + 0.1) / 2)
+    assert len(latency) == 0
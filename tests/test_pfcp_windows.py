@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from pfcp_windows import MSG_TYPE_COLUMNS, MSG_TYPE_INDEX, WindowCounter
+
+MSG_TYPES = np.array([1, 2, 50, 51, 52, 53, 54, 55])
+
+
+def random_messages(n=5000, span=1000.0, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0, span, n), rng.choice(MSG_TYPES, n)
+
+
+def expected_counts(times, types, t0, interval, length=None, n_windows=None):
+    # Brute-force counts of the windows [t0 + k * interval, t0 + k * interval + length)
+    length = length or interval
+    n_windows = n_windows or int((times.max() - t0) // interval) + 1
+    counts = np.zeros((n_windows, len(MSG_TYPE_COLUMNS)), dtype=np.int64)
+    for k in range(n_windows):
+        start = t0 + k * interval
+        inside = (times >= start) & (times < start + length)
+        np.add.at(counts[k], MSG_TYPE_INDEX[types[inside]], 1)
+    return counts
+
+
+def test_add_matches_brute_force():
+    times, types = random_messages()
+    counter = WindowCounter(60, t0=0.0, batch_size=100)
+    for timestamp, msg_type in zip(times, types):
+        counter.add(timestamp, msg_type)
+    np.testing.assert_array_equal(counter.to_frame().to_numpy(), expected_counts(times, types, 0.0, 60))
+
+
+def test_out_of_order_grows_the_front():
+    times, types = random_messages()
+    # The first message is in the middle of the capture, so earlier ones are added in front of t0
+    order = np.argsort(np.abs(times - 500.0))
+    times, types = times[order], types[order]
+    counter = WindowCounter(60, batch_size=64)
+    for timestamp, msg_type in zip(times, types):
+        counter.add(timestamp, msg_type)
+    t0 = times[0] - counter.front_windows * 60
+    assert counter.front_windows > 0
+    assert counter.t0 == pytest.approx(t0)
+    frame = counter.to_frame()
+    np.testing.assert_array_equal(frame.to_numpy(), expected_counts(times, types, t0, 60))
+    # Window indices stay counted from the original first message
+    start, stop = counter.bounds()
+    assert start == -counter.front_windows
+    np.testing.assert_array_equal(counter.to_frame(start, stop).to_numpy(), frame.to_numpy())
+
+
+def test_unknown_types_are_counted_not_windowed():
+    counter = WindowCounter(60, t0=0.0)
+    for timestamp, msg_type in ((1.0, 1), (2.0, 99), (3.0, 200), (70.0, 2)):
+        counter.add(timestamp, msg_type)
+    assert counter.to_frame().to_numpy().sum() == 2
+    assert counter.unknown == 2
+
+
+def test_resample_matches_coarser_count():
+    times, types = random_messages()
+    counter = WindowCounter(30, t0=0.0)
+    counter.add_many(times, types)
+    coarse = counter.resample(120)
+    direct = WindowCounter(120, t0=0.0)
+    direct.add_many(times, types)
+    np.testing.assert_array_equal(coarse.to_frame().to_numpy(), direct.to_frame().to_numpy())
+    with pytest.raises(ValueError):
+        counter.resample(45)
+
+
+def test_slide_gives_overlapping_windows():
+    times, types = random_messages()
+    counter = WindowCounter(30, t0=0.0)
+    counter.add_many(times, types)
+    hopping = counter.slide(120, 30)
+    assert hopping.interval == 30 and hopping.length == 120
+    frame = hopping.to_frame()
+    np.testing.assert_array_equal(frame.to_numpy(),
+                                  expected_counts(times, types, 0.0, 30, length=120, n_windows=len(frame)))
+    starts, ends = hopping.window_times()
+    np.testing.assert_allclose(ends - starts, 120)
+    np.testing.assert_allclose(np.diff(starts), 30)
+
+
+def test_merge_aligns_on_t0():
+    times, types = random_messages()
+    whole = WindowCounter(60, t0=0.0)
+    whole.add_many(times, types)
+    # Two halves with their own t0 on the same grid, merged later part first
+    late = times >= 400
+    early_counter = WindowCounter(60, t0=0.0)
+    early_counter.add_many(times[~late], types[~late])
+    late_counter = WindowCounter(60, t0=420.0)
+    late_counter.add_many(times[late], types[late])
+    merged = late_counter
+    merged.merge(early_counter)
+    assert merged.t0 == 0.0
+    np.testing.assert_array_equal(merged.to_frame().to_numpy(), whole.to_frame().to_numpy())
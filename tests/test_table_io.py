@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from table_io import FORMATS, TableWriter, load_table, output_path, write_table
+
+
+def window_table(n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'heartbeat_request': rng.integers(0, 1000, n),
+        'session_establishment_request': rng.integers(0, 70000, n),
+        'response_time_mean': rng.random(n),
+        'Label_val': rng.choice([-1, 0, 1, 2, 3], n),
+        'Label': rng.choice(['unlabelled', 'normal', 'del_att', 'mod_att', 'est_att'], n),
+    })
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_round_trip_with_compact_dtypes(fmt, tmp_path):
+    df = window_table()
+    path = write_table(df, output_path(str(tmp_path / 'windows'), fmt), fmt)
+    loaded = load_table(path)
+    assert loaded['heartbeat_request'].dtype == np.uint32
+    assert loaded['Label_val'].dtype == np.int8
+    assert loaded['Label'].dtype == 'category'
+    pd.testing.assert_frame_equal(loaded.astype({'Label': object}), df, check_dtype=False)
+    # Only the requested columns are read
+    assert list(load_table(path, columns=['Label_val'])) == ['Label_val']
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_appended_batches_and_empty_tables(fmt, tmp_path):
+    df = window_table()
+    path = output_path(str(tmp_path / 'windows'), fmt)
+    writer = TableWriter(path, fmt)
+    for start in range(0, len(df), 300):
+        writer.append(df.iloc[start:start + 300])
+    writer.close(list(df.columns))
+    pd.testing.assert_frame_equal(load_table(path).astype({'Label': object}), df, check_dtype=False)
+
+    empty = output_path(str(tmp_path / 'empty'), fmt)
+    TableWriter(empty, fmt).close(list(df.columns))
+    loaded = load_table(empty)
+    assert len(loaded) == 0 and list(loaded.columns) == list(df.columns)
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'hdf5'])
+def test_values_that_do_not_fit_are_refused(fmt, tmp_path):
+    df = pd.DataFrame({'Label_val': [0, 300]})
+    with pytest.raises(ValueError):
+        write_table(df, output_path(str(tmp_path / 'windows'), fmt), fmt)